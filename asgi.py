@@ -0,0 +1,12 @@
+# Point d'entrée des serveurs ASGI, pour servir l'API en lecture (voir correspondance/passerelle.py), ex :
+# FLASK_APP=run.py flask maj-schema && uvicorn asgi:application --port 8001
+# Le serveur charge ce fichier dans chacun de ses processus : le schéma de la base de données n'y est pas mis à jour.
+# Il l'est une seule fois, avant le lancement du serveur (commande maj-schema) ; à défaut, il l'est à la première
+# requête reçue par chaque processus, les mises à jour simultanées étant appliquées l'une après l'autre (voir
+# mettre_a_jour_schema).
+from correspondance.app import create_app
+from correspondance.passerelle import PasserelleASGI
+
+application_wsgi = create_app()
+
+application = PasserelleASGI(application_wsgi)
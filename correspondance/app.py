@@ -1,9 +1,10 @@
 # Import des modules nécessaires au fonctionnement de l'application.
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 import os
-from .constantes import SECRET_KEY
+from .constantes import SECRET_KEY, BASE_DE_DONNEES, SQLITE_PRAGMAS, SQLITE_TAILLE_POOL, SQLITE_DEPASSEMENT_POOL, \
+    MOT_DE_PASSE_METHODE, MOT_DE_PASSE_TAILLE_SEL
+from .moteur import SQLAlchemySQLite
 
 # Stockage des chemins
 chemin_actuel = os.path.dirname(os.path.abspath(__file__))
@@ -17,16 +18,55 @@ app = Flask(
     static_folder=statics
 )
 
-# Confinguration du "secret"
-app.config['SECRET_KEY'] = SECRET_KEY
-# Configuration de la base de données
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///db.db'
-# Initiation de l'extension
-db = SQLAlchemy(app)
+# Extensions : elles sont liées à l'application par create_app, une fois sa configuration connue.
+db = SQLAlchemySQLite()
+login = LoginManager()
+
+
+def create_app(config=None):
+    """
+    Configure l'application et l'associe à la base de données et à la gestion des utilisateur-rice-s. Les routes étant
+    déclarées sur l'objet app de ce module, il n'y a qu'une application par processus : un nouvel appel met à jour sa
+    configuration (ex : une autre base de données pour un test ou un banc d'essai).
+    La base de données est, par ordre de priorité : celle de config (clé BASE_DE_DONNEES, chemin du fichier SQLite, ou
+    SQLALCHEMY_DATABASE_URI), celle de la variable d'environnement CORRESPONDANCE_BASE_DE_DONNEES, puis db.db à la
+    racine du projet. Un chemin relatif est pris depuis le dossier courant.
+    :param config: dictionnaire de configuration, qui remplace les valeurs par défaut
+    :return: l'application Flask
+    """
+    # Confinguration du "secret"
+    app.config['SECRET_KEY'] = SECRET_KEY
+    # Profil du moteur SQLite : instructions PRAGMA de chaque connexion et taille du pool de connexions
+    app.config['SQLITE_PRAGMAS'] = SQLITE_PRAGMAS
+    app.config['SQLALCHEMY_POOL_SIZE'] = SQLITE_TAILLE_POOL
+    app.config['SQLALCHEMY_MAX_OVERFLOW'] = SQLITE_DEPASSEMENT_POOL
+    # Hachage des mots de passe : méthode, coût et longueur du sel des empreintes
+    app.config['MOT_DE_PASSE_METHODE'] = MOT_DE_PASSE_METHODE
+    app.config['MOT_DE_PASSE_TAILLE_SEL'] = MOT_DE_PASSE_TAILLE_SEL
+    app.config['BASE_DE_DONNEES'] = os.environ.get("CORRESPONDANCE_BASE_DE_DONNEES") or BASE_DE_DONNEES
+    app.config.update(config or {})
+    # Configuration de la base de données : le chemin est rendu absolu, pour ne plus dépendre du dossier courant
+    # lorsque la connexion est ouverte.
+    if not (config and "SQLALCHEMY_DATABASE_URI" in config):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(app.config['BASE_DE_DONNEES'])
+
+    # Initiation des extensions (une seule fois : la configuration est relue à chaque ouverture du moteur)
+    if "sqlalchemy" not in app.extensions:
+        db.init_app(app)
+        # Mise en place de la gestion d'utilisateur-rice-s
+        login.init_app(app)
+    return app
 
-# Mise en place de la gestion d'utilisateur-rice-s
-login = LoginManager(app)
 
 # Import les routes nécessaires au fonctionnement de l'application à son lancement.
 from .routes import generic
 from .routes import api
+# Import des commandes d'administration et de la mise à jour du schéma de la base de données.
+from . import commandes
+from .modeles.schema import mettre_a_jour_schema
+
+
+# Avant la première requête, la base de données est mise à jour si besoin (index de recherche, etc.).
+@app.before_first_request
+def preparer_base_de_donnees():
+    mettre_a_jour_schema()
@@ -0,0 +1,139 @@
+# Cache des réponses des routes de lecture et des valeurs coûteuses à calculer (ex : facettes de la recherche) :
+# Les entrées sont gardées en mémoire et étiquetées avec les objets dont elles dépendent, ex : ("lettre", 5) pour la
+# page de la lettre 5, ou ("lettre", "*") pour une collection de lettres. Les entrées les plus anciennement lues sont
+# retirées lorsque la taille maximale est atteinte, et chaque entrée expire après une durée maximale. Les réponses des
+# routes sont enregistrées, et les entrées invalidées au fil des écritures, par routes/cache.py.
+# Chaque processus du serveur (voir gunicorn.conf.py) a son propre cache, et l'invalidation par étiquettes ne voit que
+# les écritures du processus. Chaque entrée porte donc aussi la version des données lue dans la base au début de son
+# calcul (voir modeles/statistiques.py, version_donnees) : une entrée lue alors que la version a changé, à cause d'une
+# écriture faite par n'importe quel processus, est retirée et recalculée.
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from .constantes import CACHE_TAILLE_MAX, CACHE_TAILLE_MAX_REPONSE, CACHE_DUREE
+from .modeles.statistiques import version_donnees
+
+
+class CacheReponses:
+    """
+    Cache LRU (least recently used) de réponses, limité en taille totale (en octets) et en durée de vie.
+    """
+    def __init__(self, taille_max, taille_max_reponse, duree):
+        self.taille_max = taille_max
+        self.taille_max_reponse = taille_max_reponse
+        self.duree = duree
+        self.entrees = OrderedDict()
+        self.cles_par_etiquette = {}
+        self.taille = 0
+        # La génération augmente à chaque invalidation : une réponse calculée pendant une invalidation n'est pas
+        # enregistrée, car elle peut contenir des données déjà modifiées.
+        self.generation = 0
+        self.compteurs = {"hits": 0, "misses": 0, "enregistrements": 0, "evictions": 0, "invalidations": 0,
+                          "perimees": 0}
+        self.verrou = threading.Lock()
+
+    def lire(self, cle, version):
+        """
+        Retourne l'entrée (statut, en-têtes, contenu) correspondant à la clé, ou None si elle est absente, expirée ou
+        calculée avec une autre version des données.
+        :param version: version actuelle des données
+        """
+        with self.verrou:
+            entree = self.entrees.get(cle)
+            if entree is None or entree["expiration"] < time.monotonic() or entree["version"] != version:
+                if entree is not None:
+                    if entree["version"] != version:
+                        self.compteurs["perimees"] += 1
+                    self._retirer(cle)
+                self.compteurs["misses"] += 1
+                return None
+            self.entrees.move_to_end(cle)
+            self.compteurs["hits"] += 1
+            return entree
+
+    def ecrire(self, cle, generation, version, etiquettes, statut, entetes, contenu):
+        """
+        Enregistre une réponse, sauf si une invalidation a eu lieu depuis le début de son calcul ou si elle est trop
+        volumineuse. Les entrées les moins récemment lues sont retirées tant que la taille maximale est dépassée.
+        :param version: version des données lue au début du calcul de la réponse
+        """
+        taille = len(contenu)
+        if taille > self.taille_max_reponse:
+            return
+        with self.verrou:
+            if generation != self.generation:
+                return
+            if cle in self.entrees:
+                self._retirer(cle)
+            self.entrees[cle] = {"expiration": time.monotonic() + self.duree, "version": version,
+                                 "etiquettes": etiquettes, "statut": statut, "entetes": entetes, "contenu": contenu}
+            self.taille += taille
+            for etiquette in etiquettes:
+                self.cles_par_etiquette.setdefault(etiquette, set()).add(cle)
+            self.compteurs["enregistrements"] += 1
+            while self.taille > self.taille_max:
+                self._retirer(next(iter(self.entrees)))
+                self.compteurs["evictions"] += 1
+
+    def invalider(self, etiquettes):
+        """
+        Retire du cache toutes les réponses portant au moins une des étiquettes.
+        """
+        with self.verrou:
+            self.generation += 1
+            for etiquette in etiquettes:
+                for cle in self.cles_par_etiquette.pop(etiquette, set()):
+                    if cle in self.entrees:
+                        self._retirer(cle)
+                        self.compteurs["invalidations"] += 1
+
+    def vider(self):
+        """
+        Retire toutes les réponses du cache.
+        """
+        with self.verrou:
+            self.generation += 1
+            self.entrees.clear()
+            self.cles_par_etiquette.clear()
+            self.taille = 0
+
+    def statistiques(self):
+        """
+        Retourne les compteurs du cache (hits, misses, etc.), son nombre d'entrées et sa taille.
+        """
+        with self.verrou:
+            return dict(self.compteurs, entrees=len(self.entrees), taille=self.taille, taille_max=self.taille_max)
+
+    def _retirer(self, cle):
+        entree = self.entrees.pop(cle)
+        self.taille -= len(entree["contenu"])
+        for etiquette in entree["etiquettes"]:
+            cles = self.cles_par_etiquette.get(etiquette)
+            if cles is not None:
+                cles.discard(cle)
+                if not cles:
+                    del self.cles_par_etiquette[etiquette]
+
+
+cache = CacheReponses(CACHE_TAILLE_MAX, CACHE_TAILLE_MAX_REPONSE, CACHE_DUREE)
+
+
+def valeur_en_cache(cle, etiquettes, calculer):
+    """
+    Retourne une valeur gardée dans le cache des réponses (ex : facettes de la recherche), ou la calcule et l'y
+    enregistre si elle est absente. La valeur, écrite en JSON, est invalidée comme les réponses portant les mêmes
+    étiquettes.
+    :param cle: clé de la valeur, distincte des clés des réponses (voir routes/cache.py, cle_requete)
+    :param etiquettes: étiquettes de la valeur
+    :param calculer: fonction sans paramètre calculant la valeur
+    """
+    version = version_donnees()
+    entree = cache.lire(cle, version)
+    if entree is not None:
+        return json.loads(entree["contenu"])
+    generation = cache.generation
+    valeur = calculer()
+    cache.ecrire(cle, generation, version, etiquettes, None, None, json.dumps(valeur).encode("utf-8"))
+    return valeur
@@ -0,0 +1,152 @@
+# Commandes d'administration, utilisables avec l'outil "flask" (ex : FLASK_APP=run.py flask maj-schema)
+import os
+import time
+import resource
+import click
+
+from .app import app, db
+from .modeles.schema import mettre_a_jour_schema, version_schema, index_manquants
+from .modeles import recherche, statistiques
+from .modeles.importation import importer_corpus
+from .modeles.export import exporter_lettres, FORMATS_EXPORT
+from .modeles.plans import verifier_plans
+
+
+@app.cli.command("maj-schema")
+def maj_schema():
+    """
+    Met à jour le schéma de la base de données (index, tables annexes).
+    """
+    versions = mettre_a_jour_schema()
+    if versions:
+        click.echo("Migration(s) appliquée(s) : {}".format(", ".join(str(version) for version in versions)))
+    else:
+        with db.engine.connect() as connexion:
+            click.echo("Le schéma est à jour (version {})".format(version_schema(connexion)))
+
+
+@app.cli.command("reindexer")
+def reindexer():
+    """
+    Reconstruit l'index plein texte des lettres.
+    """
+    mettre_a_jour_schema()
+    with db.engine.begin() as connexion:
+        recherche.creer_index(connexion)
+    click.echo("L'index de recherche a été reconstruit")
+
+
+@app.cli.command("recalculer-statistiques")
+def recalculer_statistiques():
+    """
+    Recalcule les compteurs du corpus affichés sur la page d'accueil.
+    """
+    mettre_a_jour_schema()
+    with db.engine.begin() as connexion:
+        statistiques.recalculer_statistiques(connexion)
+    click.echo("Les statistiques ont été recalculées")
+
+
+@app.cli.command("compacter-base")
+def compacter_base():
+    """
+    Reconstruit le fichier de la base de données (VACUUM) pour rendre au système la place libérée (ex : après la
+    compression des transcriptions).
+    """
+    mettre_a_jour_schema()
+    chemin = db.engine.url.database
+    with db.engine.connect() as connexion:
+        connexion = connexion.execution_options(isolation_level="AUTOCOMMIT")
+        # En mode WAL, les dernières écritures, puis la base reconstruite, sont d'abord écrites dans le journal : elles
+        # sont reportées dans le fichier avant de mesurer sa taille.
+        connexion.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        taille = os.path.getsize(chemin)
+        connexion.execute("VACUUM")
+        connexion.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    click.echo("Taille de la base : {:.1f} Mo -> {:.1f} Mo".format(taille / 1024 / 1024,
+                                                                    os.path.getsize(chemin) / 1024 / 1024))
+
+
+@app.cli.command("import-corpus")
+@click.option("--dossier", type=click.Path(exists=True, file_okay=False),
+              default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "base_de_données"),
+              help="Dossier contenant publication.csv, lettre.csv et source.csv")
+@click.option("--taille-lot", type=click.IntRange(min=1), default=5000, show_default=True,
+              help="Nombre de lignes insérées par lot")
+def import_corpus(dossier, taille_lot):
+    """
+    Importe les publications, les lettres et leurs sources depuis les fichiers CSV du corpus. Les lignes déjà
+    présentes dans la base sont ignorées.
+    """
+    mettre_a_jour_schema()
+    with db.engine.connect() as connexion:
+        rapport = importer_corpus(connexion, dossier, taille_lot)
+    indexation = rapport.pop("index")
+    for table, compteurs in rapport.items():
+        click.echo("{} : {} ligne(s) lue(s), {} ajoutée(s), {} ignorée(s) (déjà présentes), {} rejetée(s) "
+                   "en {:.2f} s ({:.0f} lignes/s)".format(
+                       table, compteurs["lues"], compteurs["ajoutees"], compteurs["ignorees"],
+                       compteurs["rejetees"], compteurs["duree"],
+                       compteurs["lues"] / compteurs["duree"] if compteurs["duree"] else 0))
+    click.echo("index : {} lettre(s) indexée(s) en {:.2f} s".format(indexation["lettres"], indexation["duree"]))
+
+
+@app.cli.command("export")
+@click.option("--format", "format_export", type=click.Choice(list(FORMATS_EXPORT)), default="ndjson",
+              show_default=True, help="Format de l'export")
+@click.option("--sortie", type=click.File("w", encoding="utf-8"), default="-",
+              help="Fichier de sortie (par défaut : la sortie standard)")
+@click.option("--taille-lot", type=click.IntRange(min=1), default=1000, show_default=True,
+              help="Nombre de lettres lues à chaque requête")
+def export(format_export, sortie, taille_lot):
+    """
+    Exporte l'ensemble du corpus (lettres, publications, transcriptions et contributions) en NDJSON ou en CSV.
+    """
+    formater = FORMATS_EXPORT[format_export][0]
+    debut = time.perf_counter()
+    nombre = 0
+    taille = 0
+    with db.engine.connect() as connexion:
+        def compter(lettres):
+            nonlocal nombre
+            for lettre in lettres:
+                nombre += 1
+                yield lettre
+
+        for ligne in formater(compter(exporter_lettres(connexion, taille_lot))):
+            sortie.write(ligne)
+            taille += len(ligne.encode("utf-8"))
+    duree = time.perf_counter() - debut
+    # Le résumé est écrit sur la sortie d'erreur pour ne pas se mêler à l'export.
+    click.echo("{} lettre(s) exportée(s) en {:.2f} s ({:.0f} lettres/s, {:.1f} Mo/s), mémoire maximale : {:.0f} Mo"
+               .format(nombre, duree, nombre / duree if duree else 0, taille / duree / 1e6 if duree else 0,
+                       resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024), err=True)
+
+
+@app.cli.command("verifier-plans")
+@click.option("--details", is_flag=True, help="Affiche le plan de toutes les requêtes, et non les seuls problèmes")
+def verifier_plans_requetes(details):
+    """
+    Vérifie que les index déclarés dans les modèles existent dans la base et que les requêtes des pages fréquentes
+    (pages d'un objet, API) utilisent un index. Le code de sortie est 1 si un problème est trouvé.
+    """
+    mettre_a_jour_schema()
+    problemes = 0
+    with db.engine.connect() as connexion:
+        manquants = index_manquants(connexion)
+    for nom in manquants:
+        click.echo("Index absent de la base : {}".format(nom))
+    problemes += len(manquants)
+
+    resultats = verifier_plans()
+    for resultat in resultats:
+        if resultat["statut"] != 200 or resultat["parcours"] or details:
+            click.echo("{} (HTTP {}) : {}".format(resultat["url"], resultat["statut"], " ".join(resultat["requete"].split())))
+            for etape in resultat["plan"]:
+                click.echo("    {}{}".format("PARCOURS COMPLET : " if etape in resultat["parcours"] else "", etape))
+        if resultat["statut"] != 200 or resultat["parcours"]:
+            problemes += 1
+
+    click.echo("{} requête(s) vérifiée(s), {} problème(s)".format(len(resultats), problemes))
+    if problemes:
+        raise SystemExit(1)
@@ -1,3 +1,4 @@
+import os
 from warnings import warn
 
 # Dans ce fichier, nous déterminons les constantes de notre projet :
@@ -8,6 +9,72 @@ RESULTATS_PAR_PAGE = 10
 SECRET_KEY = "JE SUIS UN SECRET !"
 # La route pour l'API
 API_ROUTE = "/api"
+# Le nombre d'objets chargés depuis la base de données à chaque lot lors de l'envoi en flux des collections de l'API.
+API_TAILLE_LOT = 100
+# Le nombre maximal d'objets par page demandé avec le paramètre page[size] de l'API.
+API_TAILLE_PAGE_MAX = 500
+# Le nombre de contributions par page de l'historique des contributions (/api/contributions), si page[size] n'est
+# pas renseigné.
+API_TAILLE_PAGE_CONTRIBUTIONS = 50
+# Le nombre maximal de lettres envoyées en une fois à l'API pour être créées ou modifiées (POST /api/lettres).
+API_TAILLE_MAX_ECRITURE = 1000
+# La taille maximale (en octets) du cache des réponses des routes de lecture, et d'une réponse gardée en cache.
+CACHE_TAILLE_MAX = 64 * 1024 * 1024
+CACHE_TAILLE_MAX_REPONSE = 4 * 1024 * 1024
+# La durée (en secondes) pendant laquelle une réponse reste en cache.
+CACHE_DUREE = 300
+# La base de données utilisée par défaut (voir create_app) : le fichier db.db à la racine du projet.
+BASE_DE_DONNEES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db.db")
+# Le fichier CSV des coordonnées des lieux d'envoi des lettres (voir modeles/lieux.py).
+LIEUX_COORDONNEES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "base_de_données",
+                                 "lieu.csv")
+# Le niveau de compression zlib (de 0 à 9) du texte des transcriptions enregistré dans la base de données.
+TRANSCRIPTION_COMPRESSION = 6
+# La longueur maximale (en caractères) de l'extrait des transcriptions affiché dans les listes.
+TRANSCRIPTION_EXTRAIT_TAILLE = 200
+# Le nombre de révisions d'une transcription entre deux révisions complètes ; les autres sont enregistrées sous la
+# forme d'un delta (voir modeles/revisions.py).
+REVISIONS_INTERVALLE_COMPLET = 10
+# Le nombre maximal de valeurs par facette de la recherche (rédacteurs, lieux, publications).
+FACETTES_TAILLE = 20
+# Les instructions PRAGMA exécutées à l'ouverture de chaque connexion à la base SQLite :
+# - journal_mode : en mode WAL, les lectures ne sont pas bloquées par une écriture en cours ;
+# - synchronous : en mode WAL, NORMAL ne synchronise le disque qu'aux points de contrôle (une coupure de courant peut
+#   perdre les dernières écritures validées, sans corrompre la base) ;
+# - busy_timeout : délai (en millisecondes) pendant lequel une écriture attend que la base soit libérée ;
+# - mmap_size : taille (en octets) de la base lue directement en mémoire ;
+# - cache_size : taille du cache de pages de chaque connexion (en kibioctets lorsqu'elle est négative).
+# Les clés étrangères (foreign_keys) ne sont pas activées : les suppressions de l'application ne retirent pas les
+# contributions qui font référence aux objets supprimés.
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 10000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16 * 1024,
+}
+# Le nombre de connexions à la base gardées ouvertes par processus, et le nombre de connexions supplémentaires
+# ouvertes lorsque toutes sont utilisées.
+SQLITE_TAILLE_POOL = 5
+SQLITE_DEPASSEMENT_POOL = 10
+# Le service de l'API en lecture par un serveur ASGI (voir passerelle.py) : nombre de requêtes exécutées en même temps
+# par processus, hors collections complètes et exports, et nombre de collections complètes et d'exports produits en
+# même temps (à eux deux, pas plus que SQLITE_TAILLE_POOL + SQLITE_DEPASSEMENT_POOL connexions), nombre de morceaux
+# de réponse produits d'avance pour un client, et taille (en octets) à partir de laquelle les données produites sont
+# envoyées au client.
+ASGI_FILS = SQLITE_TAILLE_POOL
+ASGI_FILS_FLUX = 2
+ASGI_TAMPON = 8
+ASGI_TAILLE_MORCEAU = 64 * 1024
+# Le hachage des mots de passe (voir hachage.py) : méthode et coût (nombre d'itérations de PBKDF2), et longueur du sel
+# des empreintes ; une empreinte calculée avec d'autres valeurs est recalculée à la connexion suivante de l'utilisateur.
+# Nombre d'empreintes calculées en même temps par processus, et nombre maximal de requêtes qui attendent une empreinte
+# (au-delà, la connexion est refusée et l'utilisateur invité à réessayer) : il doit rester inférieur au nombre de fils
+# d'exécution de chaque processus du serveur (CORRESPONDANCE_FILS, voir gunicorn.conf.py).
+MOT_DE_PASSE_METHODE = "pbkdf2:sha256:150000"
+MOT_DE_PASSE_TAILLE_SEL = 16
+MOT_DE_PASSE_FILS = 1
+MOT_DE_PASSE_PLACES = 3
 
 # Si la valeur de la variable SECRET_KEY n'est pas modifié,
 # un message de sécurité s'affiche à destination du développeur.
@@ -0,0 +1,109 @@
+# Hachage des mots de passe :
+# Le calcul d'une empreinte de mot de passe (PBKDF2) est volontairement coûteux. Il est exécuté par un nombre borné de
+# fils d'exécution dédiés (MOT_DE_PASSE_FILS), et un nombre borné de requêtes peuvent attendre une empreinte en même
+# temps (MOT_DE_PASSE_PLACES) : une requête de connexion ou d'inscription arrivée au-delà est refusée tout de suite
+# (HachageOccupe), au lieu d'occuper un fil du serveur. Lors d'un afflux de connexions, les fils du serveur restent
+# ainsi disponibles pour les autres pages, pourvu que MOT_DE_PASSE_PLACES reste inférieur au nombre de fils
+# d'exécution de chaque processus (voir gunicorn.conf.py).
+# La méthode de hachage et son coût (ex : "pbkdf2:sha256:150000", nombre d'itérations) et la longueur du sel sont lus
+# dans la configuration de l'application à chaque empreinte : une empreinte calculée avec d'autres paramètres est
+# recalculée lors de la connexion suivante de l'utilisateur (voir Utilisateur.identification).
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+from .constantes import MOT_DE_PASSE_FILS, MOT_DE_PASSE_PLACES
+
+
+class HachageOccupe(Exception):
+    """
+    Trop de mots de passe sont déjà en cours de hachage : la demande est refusée sans attendre.
+    """
+
+
+def normaliser_methode(methode):
+    """
+    Complète une méthode PBKDF2 sans nombre d'itérations avec le nombre utilisé par défaut par Werkzeug, tel qu'il est
+    enregistré dans l'empreinte (ex : "pbkdf2:sha256" devient "pbkdf2:sha256:150000").
+    :rtype: str
+    """
+    if methode.startswith("pbkdf2:") and methode.count(":") == 1:
+        return "{}:{}".format(methode, DEFAULT_PBKDF2_ITERATIONS)
+    return methode
+
+
+class Hacheur:
+    """
+    Calcule et vérifie les empreintes des mots de passe dans des fils d'exécution dédiés.
+    :param fils: nombre d'empreintes calculées en même temps
+    :param places: nombre maximal de requêtes qui attendent une empreinte (calculée ou en attente de calcul)
+    """
+    def __init__(self, fils, places):
+        self.fils = fils
+        self.places = places
+        self.verrou = threading.Lock()
+        self.executeur = None
+        self.semaphore = None
+        # Les fils d'exécution ne survivent pas à la création d'un processus (fork) : chaque processus crée les siens
+        # lors de sa première empreinte.
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.oublier_executeur)
+
+    def oublier_executeur(self):
+        """
+        Abandonne l'exécuteur hérité du processus parent. Appelée dans le processus créé après chaque fork.
+        """
+        self.verrou = threading.Lock()
+        self.executeur = None
+        self.semaphore = None
+
+    def executer(self, fonction, *arguments):
+        """
+        Exécute une fonction de hachage dans un fil dédié et attend son résultat.
+        :raises HachageOccupe: si MOT_DE_PASSE_PLACES requêtes attendent déjà une empreinte
+        """
+        with self.verrou:
+            if self.executeur is None:
+                self.executeur = ThreadPoolExecutor(max_workers=self.fils, thread_name_prefix="hachage")
+                self.semaphore = threading.BoundedSemaphore(self.places)
+        semaphore = self.semaphore
+        if not semaphore.acquire(blocking=False):
+            raise HachageOccupe()
+        try:
+            return self.executeur.submit(fonction, *arguments).result()
+        finally:
+            semaphore.release()
+
+    def hacher(self, motdepasse):
+        """
+        Calcule l'empreinte d'un mot de passe avec la méthode et la longueur de sel de la configuration
+        (MOT_DE_PASSE_METHODE, MOT_DE_PASSE_TAILLE_SEL).
+        :rtype: str
+        """
+        return self.executer(generate_password_hash, motdepasse, current_app.config["MOT_DE_PASSE_METHODE"],
+                             current_app.config["MOT_DE_PASSE_TAILLE_SEL"])
+
+    def verifier(self, empreinte, motdepasse):
+        """
+        Vérifie qu'un mot de passe correspond à une empreinte.
+        :rtype: bool
+        """
+        return self.executer(check_password_hash, empreinte, motdepasse)
+
+    @staticmethod
+    def a_recalculer(empreinte):
+        """
+        Indique si une empreinte a été calculée avec une autre méthode, un autre coût ou une autre longueur de sel que
+        ceux de la configuration. L'empreinte a la forme méthode$sel$hachage.
+        :rtype: bool
+        """
+        methode, _, reste = empreinte.partition("$")
+        sel = reste.partition("$")[0]
+        return methode != normaliser_methode(current_app.config["MOT_DE_PASSE_METHODE"]) or \
+            len(sel) != current_app.config["MOT_DE_PASSE_TAILLE_SEL"]
+
+
+# Hacheur de l'application, partagé par les fils d'exécution de chaque processus.
+hacheur = Hacheur(MOT_DE_PASSE_FILS, MOT_DE_PASSE_PLACES)
@@ -0,0 +1,133 @@
+from flask import url_for
+from sqlalchemy import event, inspect
+
+from .. app import db
+from ..modeles.donnees import Contribution
+
+
+# Table des compteurs de chaque contributeur :
+# Pour chaque utilisateur ayant contribué, nombre de contributions (en tout, et sur des lettres, des publications et
+# des transcriptions) et dates de la première et de la dernière. Les compteurs sont mis à jour dans la même transaction
+# que chaque contribution enregistrée par l'ORM (voir la fonction d'écoute en fin de fichier), ce qui permet de
+# présenter l'activité d'un contributeur sans parcourir ses contributions. Une contribution compte pour le type de
+# l'objet qu'elle concerne ; lorsque l'objet est supprimé, la contribution en est détachée et ne compte plus que dans
+# le total, comme lors d'un recalcul complet des compteurs (voir recalculer_contributeurs).
+class Contributeur(db.Model):
+    __tablename__ = "contributeur"
+    contributeur_ut_id = db.Column(db.Integer, db.ForeignKey('utilisateur.ut_id'), primary_key=True)
+    contributeur_contributions = db.Column(db.Integer, nullable=False, default=0)
+    contributeur_lettres = db.Column(db.Integer, nullable=False, default=0)
+    contributeur_publications = db.Column(db.Integer, nullable=False, default=0)
+    contributeur_transcriptions = db.Column(db.Integer, nullable=False, default=0)
+    contributeur_premiere = db.Column(db.DateTime)
+    contributeur_derniere = db.Column(db.DateTime)
+    utilisateur = db.relationship("Utilisateur")
+
+    def to_jsonapi_dict(self):
+        """
+        Permet de récupérer les données d'un contributeur et ses compteurs en JSON
+        """
+        return {
+            "type": "Contributeur",
+            "id": self.contributeur_ut_id,
+            "attributes": {
+                "name": self.utilisateur.ut_nom,
+                "contributions": self.contributeur_contributions,
+                "lettres": self.contributeur_lettres,
+                "publications": self.contributeur_publications,
+                "transcriptions": self.contributeur_transcriptions,
+                "premiere": self.contributeur_premiere,
+                "derniere": self.contributeur_derniere
+            },
+            "links": {
+                "self": url_for("api_contributeur_unique", ut_id=self.contributeur_ut_id, _external=True),
+                "contributions": url_for("api_contributions", contributeur=self.contributeur_ut_id, _external=True)
+            }
+        }
+
+
+# Colonne de chaque compteur par type d'objet et clé étrangère correspondante de la table contribution.
+COMPTEURS_PAR_OBJET = {
+    "contributeur_lettres": "contribution_lettre_id",
+    "contributeur_publications": "contribution_publication_id",
+    "contributeur_transcriptions": "contribution_transcription_id",
+}
+COLONNES_COMPTEURS = ["contributeur_contributions"] + list(COMPTEURS_PAR_OBJET)
+
+
+def recalculer_contributeurs(connexion):
+    """
+    Recalcule les compteurs de tous les contributeurs à partir du contenu de la table contribution. Les contributions
+    déjà détachées d'un objet supprimé ne comptent plus pour le type de cet objet.
+    :param connexion: connexion SQLAlchemy ouverte dans une transaction
+    """
+    Contributeur.__table__.create(connexion, checkfirst=True)
+    connexion.execute("DELETE FROM contributeur")
+    connexion.execute(
+        "INSERT INTO contributeur (contributeur_ut_id, contributeur_contributions, {}, contributeur_premiere, "
+        "contributeur_derniere) SELECT contribution_ut_id, count(*), {}, min(contribution_date), "
+        "max(contribution_date) FROM contribution WHERE contribution_ut_id IS NOT NULL GROUP BY contribution_ut_id"
+        .format(", ".join(COMPTEURS_PAR_OBJET), ", ".join("count({})".format(colonne)
+                                                          for colonne in COMPTEURS_PAR_OBJET.values())))
+
+
+def modifier_contributeurs(connexion, variations):
+    """
+    Ajoute une variation (positive ou négative) aux compteurs de contributeurs, en créant les contributeurs inconnus,
+    et étend si besoin leurs dates de première et de dernière contribution.
+    :param connexion: connexion SQLAlchemy (ou session) ouverte dans la transaction de l'écriture
+    :param variations: liste de dictionnaires {"ut_id", "premiere", "derniere" (dates, ou None), et une variation
+    par colonne de COLONNES_COMPTEURS}
+    """
+    connexion.execute(
+        db.text("INSERT INTO contributeur (contributeur_ut_id, {}, contributeur_premiere, contributeur_derniere) "
+                "VALUES (:ut_id, {}, :premiere, :derniere) ON CONFLICT (contributeur_ut_id) DO UPDATE SET {}, "
+                "contributeur_premiere = coalesce(min(contributeur_premiere, :premiere), contributeur_premiere, "
+                ":premiere), contributeur_derniere = coalesce(max(contributeur_derniere, :derniere), "
+                "contributeur_derniere, :derniere)".format(
+                    ", ".join(COLONNES_COMPTEURS), ", ".join(":" + colonne for colonne in COLONNES_COMPTEURS),
+                    ", ".join("{0} = {0} + :{0}".format(colonne) for colonne in COLONNES_COMPTEURS)))
+        .bindparams(db.bindparam("premiere", type_=db.DateTime), db.bindparam("derniere", type_=db.DateTime)),
+        variations)
+
+
+# Mise à jour des compteurs des contributeurs au fil des écritures :
+# Après l'envoi des modifications (flush), chaque contribution créée compte pour son contributeur, selon l'objet
+# qu'elle concerne ; une contribution supprimée est retirée de ses compteurs (les dates de première et de dernière
+# contribution ne sont alors pas recalculées), et une contribution détachée d'un objet supprimé (clé étrangère remise
+# à NULL par l'ORM) est retirée du compteur du type de cet objet.
+@event.listens_for(db.session, "after_flush")
+def mettre_a_jour_contributeurs(session, contexte):
+    variations = {}
+
+    def variation_contributeur(ut_id):
+        return variations.setdefault(ut_id, {"ut_id": ut_id, "premiere": None, "derniere": None,
+                                             **dict.fromkeys(COLONNES_COMPTEURS, 0)})
+
+    for objets, sens in ((session.new, 1), (session.deleted, -1)):
+        for objet in objets:
+            if not isinstance(objet, Contribution) or objet.contribution_ut_id is None:
+                continue
+            variation = variation_contributeur(objet.contribution_ut_id)
+            variation["contributeur_contributions"] += sens
+            for compteur, colonne in COMPTEURS_PAR_OBJET.items():
+                if getattr(objet, colonne) is not None:
+                    variation[compteur] += sens
+            date = objet.contribution_date
+            if sens > 0 and date is not None:
+                variation["premiere"] = min(variation["premiere"] or date, date)
+                variation["derniere"] = max(variation["derniere"] or date, date)
+
+    for objet in session.dirty:
+        if not isinstance(objet, Contribution) or objet.contribution_ut_id is None:
+            continue
+        etat = inspect(objet)
+        for compteur, colonne in COMPTEURS_PAR_OBJET.items():
+            historique = etat.attrs[colonne].history
+            if historique.has_changes():
+                avant = any(valeur is not None for valeur in historique.deleted)
+                apres = any(valeur is not None for valeur in historique.added)
+                if apres != avant:
+                    variation_contributeur(objet.contribution_ut_id)[compteur] += apres - avant
+    if variations:
+        modifier_contributeurs(session.connection(), list(variations.values()))
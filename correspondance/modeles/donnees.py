@@ -1,27 +1,258 @@
 from flask import url_for
+import calendar
 import datetime
+import hashlib
+import re
+import unicodedata
+import zlib
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
 from .. app import db
+from ..constantes import TRANSCRIPTION_COMPRESSION, TRANSCRIPTION_EXTRAIT_TAILLE
 from ..modeles.utilisateurs import Utilisateur
 from flask_login import current_user
 from typing import List
 
 
+def champs_demandes(champs, type_ressource):
+    """
+    Renvoie les champs (attributs et relations) demandés pour un type de ressource avec le paramètre fields[type] de
+    l'API.
+    :param champs: dictionnaire {type de ressource: ensemble des noms de champs demandés} ou None
+    :param type_ressource: type JSON:API de la ressource (ex : "Lettre")
+    :return: ensemble des noms de champs demandés, ou None si tous les champs sont demandés
+    :rtype: set or None
+    """
+    if not champs:
+        return None
+    return champs.get(type_ressource)
+
+
+def est_demande(demandes, nom):
+    """
+    Indique si un champ doit figurer dans la réponse JSON (et donc être chargé depuis la base de données).
+    :param demandes: ensemble renvoyé par champs_demandes
+    :param nom: nom JSON du champ
+    :rtype: bool
+    """
+    return demandes is None or nom in demandes
+
+
+def options_colonnes(demandes, attributs, obligatoires):
+    """
+    Construit l'option load_only limitant les colonnes chargées aux attributs demandés.
+    :param demandes: ensemble renvoyé par champs_demandes
+    :param attributs: dictionnaire {nom JSON: nom de la colonne}
+    :param obligatoires: colonnes toujours nécessaires (clé primaire, clés étrangères)
+    :return: liste d'options à passer à query.options()
+    """
+    if demandes is None:
+        return []
+    colonnes = [colonne for nom, colonne in attributs.items() if nom in demandes]
+    return [db.load_only(*(colonnes + list(obligatoires)))]
+
+
+def cle_naturelle(*valeurs):
+    """
+    Calcule la clé naturelle d'un objet à partir des valeurs qui l'identifient (ex : numéro, rédacteur, lieu et date
+    d'une lettre). Les valeurs sont normalisées (forme Unicode NFC, espaces superflus retirés, casse ignorée) puis
+    condensées (SHA-1) : deux saisies ne différant que par la casse ou les espaces ont la même clé, et la clé reste
+    courte quelle que soit la longueur des valeurs (ex : titres des publications).
+    :param valeurs: valeurs identifiant l'objet (None est traité comme une valeur vide)
+    :return: clé naturelle (40 caractères hexadécimaux)
+    :rtype: str
+    """
+    texte = "\x1f".join(" ".join(unicodedata.normalize("NFC", valeur or "").split()).casefold() for valeur in valeurs)
+    return hashlib.sha1(texte.encode("utf-8")).hexdigest()
+
+
+def cle_naturelle_vide(connexion, objet, colonne):
+    """
+    Indique si la clé naturelle enregistrée d'un objet est vide (NULL) : l'objet est un doublon antérieur à l'ajout
+    des clés naturelles, qui reste à fusionner à la main (voir modeles/schema.py, ajouter_cles_naturelles). Sa clé
+    calculée est déjà celle de l'objet conservé : elle serait refusée par l'index unique.
+    :param connexion: connexion SQLAlchemy de l'envoi des modifications
+    :param objet: lettre ou publication déjà enregistrée
+    :param colonne: nom de la colonne de la clé (ex : "lettre_cle")
+    :rtype: bool
+    """
+    etat = inspect(objet)
+    historique = etat.attrs[colonne].history
+    valeurs = list(historique.deleted or ()) + list(historique.unchanged or ())
+    if valeurs:
+        return valeurs[0] is None
+    # La clé n'est pas chargée (objet expiré par un commit) : elle est lue dans la base.
+    table = etat.mapper.local_table
+    return connexion.execute(db.select([table.c[colonne]]).where(
+        etat.mapper.primary_key[0] == etat.identity[0])).scalar() is None
+
+
+# Messages d'erreur de SQLite signalant un doublon refusé par l'index unique d'une clé naturelle.
+DOUBLONS_CLES_NATURELLES = ("lettre.lettre_cle", "publication.publication_cle")
+
+
+def doublon_cle_naturelle(erreur):
+    """
+    Indique si une erreur d'intégrité vient de l'index unique d'une clé naturelle (doublon d'une lettre ou d'une
+    publication), et non d'une autre contrainte de la base.
+    :param erreur: exception levée lors de l'enregistrement
+    :rtype: bool
+    """
+    return isinstance(erreur, IntegrityError) and any(
+        colonne in str(erreur.orig) for colonne in DOUBLONS_CLES_NATURELLES)
+
+
+def intervalle_date(texte):
+    """
+    Interprète une date, souvent incomplète ou incertaine dans le corpus, comme l'intervalle des jours où elle peut
+    tomber. Les nombres sont lus dans l'ordre année, mois, jour (ex : "1558-07-02", "1560-07", "1561-4-26") ou jour,
+    mois, année lorsque l'année est à la fin (ex : "02.08.1562"), quel que soit le séparateur. Les valeurs possibles
+    d'une même partie sont séparées par "/" (ex : "1560-07-3/17", "1558-08/09", "02.08.1562/1561 ?").
+    :param texte: date saisie
+    :return: tuple (premier jour, dernier jour), au format entier AAAAMMJJ (ex : 15580702), ou (None, None) si la date
+    n'est pas reconnue
+    :rtype: tuple
+    """
+    parties = []
+    for morceau in re.findall(r"\d+(?:\s*/\s*\d+)*", texte or ""):
+        parties.append([int(nombre) for nombre in re.findall(r"\d+", morceau)])
+    if not parties or len(parties) > 3:
+        return None, None
+    if len(str(max(parties[0]))) != 4:
+        parties.reverse()
+    if any(len(str(annee)) != 4 for annee in parties[0]):
+        return None, None
+    annees, mois, jours = (parties + [None, None])[:3]
+    if mois and not all(1 <= valeur <= 12 for valeur in mois):
+        return None, None
+    if jours and not all(1 <= valeur <= 31 for valeur in jours):
+        return None, None
+
+    debut = (min(annees), min(mois) if mois else 1, min(jours) if jours else 1)
+    fin_annee, fin_mois = max(annees), max(mois) if mois else 12
+    fin = (fin_annee, fin_mois, max(jours) if jours else calendar.monthrange(fin_annee, fin_mois)[1])
+    if debut[2] > calendar.monthrange(debut[0], debut[1])[1] or fin[2] > calendar.monthrange(fin[0], fin[1])[1]:
+        return None, None
+    return debut[0] * 10000 + debut[1] * 100 + debut[2], fin[0] * 10000 + fin[1] * 100 + fin[2]
+
+
+def compresser_texte(texte, niveau=TRANSCRIPTION_COMPRESSION):
+    """
+    Compresse un texte (zlib) pour l'enregistrer dans la base de données.
+    :param texte: texte à compresser
+    :param niveau: niveau de compression zlib, de 0 (aucune compression) à 9 (compression maximale)
+    :return: texte compressé (encodé en UTF-8), ou None
+    :rtype: bytes
+    """
+    if texte is None:
+        return None
+    return zlib.compress(texte.encode("utf-8"), niveau)
+
+
+@db.fonction_sqlite("decompresser", 1)
+def decompresser_texte(valeur):
+    """
+    Décompresse un texte enregistré par compresser_texte. Un texte enregistré sans compression (str) est retourné tel
+    quel. La fonction est aussi disponible en SQL, ex : SELECT decompresser(transcription_texte) FROM transcription.
+    :param valeur: valeur lue dans la base de données
+    :return: texte, ou None
+    :rtype: str
+    """
+    if isinstance(valeur, bytes):
+        return zlib.decompress(valeur).decode("utf-8")
+    return valeur
+
+
+def apercu_texte(texte, taille=TRANSCRIPTION_EXTRAIT_TAILLE):
+    """
+    Calcule l'aperçu d'un texte : son début, coupé entre deux mots, et son nombre de mots.
+    :param texte: texte complet
+    :param taille: longueur maximale de l'extrait (en caractères)
+    :return: tuple (extrait, nombre de mots)
+    :rtype: tuple
+    """
+    mots = (texte or "").split()
+    extrait = " ".join(mots)
+    if len(extrait) > taille:
+        extrait = extrait[:taille + 1].rsplit(" ", 1)[0].rstrip(",;:.") + " …"
+    return extrait, len(mots)
+
+
+def charger_ancienne_valeur(attribut):
+    """
+    Fait charger l'ancienne valeur d'un attribut avant tout changement (active_history) : elle figure alors dans
+    l'historique de l'attribut lors de l'envoi des modifications, même si l'objet a été expiré par un commit ou si la
+    colonne est différée. SQLAlchemy 1.3 ignore l'option active_history d'une colonne différée (deferred) : elle est
+    donc activée par une fonction d'écoute de l'attribut, qui ne fait rien d'autre.
+    :param attribut: attribut d'un modèle (ex : Transcription.transcription_texte)
+    """
+    event.listen(attribut, "set", lambda objet, valeur, ancienne_valeur, initiateur: None, active_history=True)
+
+
+class TexteCompresse(db.TypeDecorator):
+    """
+    Colonne de texte enregistré compressé (voir compresser_texte) : le texte est compressé à l'écriture et décompressé
+    à la lecture de la colonne, sans changement pour le reste de l'application. En SQL, la colonne doit être lue avec
+    la fonction decompresser.
+    """
+    impl = db.Text
+
+    def process_bind_param(self, valeur, dialecte):
+        return compresser_texte(valeur)
+
+    def process_result_value(self, valeur, dialecte):
+        return decompresser_texte(valeur)
+
+
 # Table des contributions :
 # L'utilisateur peut contribuer de différentes façon : les lettres, les sources et les transcriptions. A chaque
 # contribution, l'ID de l'objet modifié/ajouté/créé, l'ID de l'utilisateur et la date/heure sont ajouté à la DB.
 class Contribution(db.Model):
     __tablename__ = "contribution"
+    # Les contributions d'un utilisateur sont lues dans l'ordre de leur date (historique paginé, voir api.py).
+    __table_args__ = (db.Index("ix_contribution_contribution_ut_id_date", "contribution_ut_id", "contribution_date"),)
     contribution_id = db.Column(db.Integer, nullable=True, autoincrement=True, primary_key=True)
-    contribution_lettre_id = db.Column(db.Integer, db.ForeignKey('lettre.lettre_id'))
-    contribution_publication_id = db.Column(db.Integer, db.ForeignKey('publication.publication_id'))
-    contribution_transcription_id = db.Column(db.Integer, db.ForeignKey('transcription.transcription_id'))
+    contribution_lettre_id = db.Column(db.Integer, db.ForeignKey('lettre.lettre_id'), index=True)
+    contribution_publication_id = db.Column(db.Integer, db.ForeignKey('publication.publication_id'), index=True)
+    contribution_transcription_id = db.Column(db.Integer, db.ForeignKey('transcription.transcription_id'), index=True)
     contribution_ut_id = db.Column(db.Integer, db.ForeignKey('utilisateur.ut_id'))
-    contribution_date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    contribution_date = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
     utilisateur = db.relationship("Utilisateur", back_populates="contributions")
     lettre = db.relationship("Lettre", back_populates="contributions")
     publication = db.relationship("Publication", back_populates="contributions")
     transcription = db.relationship("Transcription", back_populates="contributions")
 
+    @staticmethod
+    def enregistrer_modification(lettre=None, publication=None, transcription=None, suppression=None):
+        """
+        Enregistre la modification d'un objet et la contribution de l'utilisateur courant dans une seule transaction :
+        la contribution est reliée directement aux objets modifiés (même s'ils viennent d'être créés et n'ont pas
+        encore d'identifiant), puis l'ensemble est envoyé à la base en un seul flush et validé en un seul commit.
+        Pour une suppression, la contribution est envoyée avant la suppression : comme les contributions précédentes
+        de l'objet, elle est alors détachée de l'objet supprimé. Si l'enregistrement échoue, rien n'est enregistré.
+        :param lettre: lettre créée ou modifiée (déjà ajoutée à la session)
+        :param publication: publication créée ou modifiée (déjà ajoutée à la session)
+        :param transcription: transcription créée ou modifiée (déjà ajoutée à la session)
+        :param suppression: objet à supprimer dans la même transaction
+        :return: tuple (True, contribution) ou (False, liste d'erreurs)
+        """
+        a_contribue = Contribution(contribution_ut_id=current_user.ut_id, lettre=lettre, publication=publication,
+                                   transcription=transcription)
+        try:
+            db.session.add(a_contribue)
+            if suppression is not None:
+                db.session.flush()
+                db.session.delete(suppression)
+            db.session.commit()
+            return True, a_contribue
+        except Exception as erreur:
+            # Annulation de la transaction en cours : ni la modification, ni la contribution ne sont enregistrées.
+            db.session.rollback()
+            # L'index unique des clés naturelles refuse l'enregistrement d'un doublon.
+            if doublon_cle_naturelle(erreur):
+                return False, ["Ces données sont déjà enregistrées dans la base de données"]
+            return False, [str(erreur)]
+
     def author_to_json(self):
         """
          Est appelé pour d'obtenir le lien d'autorité des modifications de données en JSON
@@ -31,12 +262,42 @@ class Contribution(db.Model):
             "on": self.contribution_date
         }
 
+    def to_jsonapi_dict(self, champs=None):
+        """
+        Permet de récupérer les données d'une contribution en JSON : date, contributeur et objets concernés
+        :param champs: ignoré (les contributions n'ont pas de champs facultatifs)
+        """
+        objets = []
+        for type_objet, identifiant, route, parametre in (
+                ("Lettre", self.contribution_lettre_id, "api_lettre_unique", "lettre_id"),
+                ("Publication", self.contribution_publication_id, "api_publication_unique", "publication_id"),
+                ("Transcription", self.contribution_transcription_id, "api_transcription_unique",
+                 "transcription_id")):
+            if identifiant is not None:
+                objets.append({"type": type_objet, "id": identifiant,
+                               "links": {"json": url_for(route, _external=True, **{parametre: identifiant})}})
+        return {
+            "type": "Contribution",
+            "id": self.contribution_id,
+            "attributes": {
+                "date": self.contribution_date
+            },
+            "relationships": {
+                "contributor": dict(self.utilisateur.to_jsonapi_dict(), id=self.contribution_ut_id, links={
+                    "json": url_for("api_contributeur_unique", ut_id=self.contribution_ut_id, _external=True)})
+                if self.utilisateur else None,
+                "objets": objets
+            }
+        }
+
 
 # Table de relation entre une lettre et ses publications :
 Source = db.Table("Source",
                   db.Column("source_lettre_id", db.Integer, db.ForeignKey('lettre.lettre_id'), primary_key=True),
                   db.Column("source_publication_id", db.Integer, db.ForeignKey('publication.publication_id'),
-                            primary_key=True))
+                            primary_key=True),
+                  # La clé primaire sert aux recherches par lettre ; cet index sert aux recherches par publication.
+                  db.Index("ix_source_source_publication_id", "source_publication_id", "source_lettre_id"))
 
 
 # Table des ouvrages dans lesquels sont publiées les lettres :
@@ -45,8 +306,14 @@ class Publication(db.Model):
     publication_id = db.Column(db.Integer, unique=True, nullable=False, primary_key=True, autoincrement=True)
     publication_titre = db.Column(db.Text)
     publication_volume = db.Column(db.Text)
+    # Clé naturelle (titre et volume normalisés), unique : voir cle_naturelle.
+    publication_cle = db.Column(db.Text, index=True, unique=True)
     contributions = db.relationship("Contribution", back_populates="publication")
 
+    # Correspondance entre les noms des attributs JSON et les colonnes, et liste des relations JSON :
+    ATTRIBUTS_JSONAPI = {"Titre": "publication_titre", "Volume": "publication_volume"}
+    RELATIONS_JSONAPI = ("editions",)
+
     def get_id(self):
         """
         Retourne l'id de l'objet actuellement utilisé
@@ -55,6 +322,14 @@ class Publication(db.Model):
         """
         return self.publication_id
 
+    @staticmethod
+    def calculer_cle(publication_titre, publication_volume):
+        """
+        Retourne la clé naturelle d'une publication (voir cle_naturelle)
+        :rtype: str
+        """
+        return cle_naturelle(publication_titre, publication_volume)
+
     @staticmethod
     def ajouter_publication(publication_titre, publication_volume):
         """
@@ -74,9 +349,9 @@ class Publication(db.Model):
 
         # Définition des erreurs : Vérification que le volume n'est pas déjà enregistrée dans la BD. Sinon, une erreur
         # s'ajoute à la liste précédemment définie.
+        # La recherche se fait sur la clé naturelle, indexée.
         ajout_unique = Publication.query.filter(
-            db.and_(Publication.publication_titre == publication_titre,
-                    Publication.publication_volume == publication_volume)).count()
+            Publication.publication_cle == Publication.calculer_cle(publication_titre, publication_volume)).count()
         if ajout_unique > 0:
             erreurs.append("Ce volume est déjà enregistré dans la base de donnée")
 
@@ -90,54 +365,57 @@ class Publication(db.Model):
             publication_titre=publication_titre,
             publication_volume=publication_volume)
 
-        try:
-            # Envoi dans la DB et enregistrement
-            db.session.add(nouvelle_publication)
-            db.session.commit()
-
-            # Enregistrement de la modification dans la table contribution :
-            if nouvelle_publication:
-                # Récupération l'id de la transcription que l'on souhaite supprimer.
-                publication = Publication.query.order_by(Publication.publication_id.desc()).limit(1).first()
-                # Récupération l'id de l'utilisateur courant
-                utilisateur = Utilisateur.query.get(current_user.ut_id)
-                # Préparation des données à l'enregistrement :
-                a_contribue = Contribution(utilisateur=utilisateur, publication=publication)
-                # Envoi dans la DB et enregistrement
-                db.session.add(a_contribue)
-                db.session.commit()
-
-            # Renvoi True à la fonction publication_creation :
-            return (True, nouvelle_publication)
-
-        # Si il y a des erreurs :
-        except Exception as erreur:
-            # Annulation de la transaction en cours
-            db.session.rollback()
+        # Envoi dans la DB et enregistrement de la publication et de la contribution en une seule transaction.
+        db.session.add(nouvelle_publication)
+        status, erreurs = Contribution.enregistrer_modification(publication=nouvelle_publication)
+        if status is False:
             # Renvoi False à la fonction publication_creation et les erreurs rencontrées.
-            return False, [str(erreur)]
+            return False, erreurs
 
-    def to_jsonapi_dict(self):
+        # Renvoi True à la fonction publication_creation :
+        return True, nouvelle_publication
+
+    @staticmethod
+    def options_jsonapi(champs=None):
+        """
+        Stratégie de chargement des relations utilisées par to_jsonapi_dict : les contributions et leurs auteurs sont
+        récupérés pour tout un lot de publications en une seule requête, au lieu d'une requête par publication.
+        Les colonnes et relations absentes de fields[Publication] ne sont pas chargées.
+        :param champs: champs demandés par type de ressource (voir champs_demandes)
+        :return: liste d'options à passer à query.options()
+        """
+        demandes = champs_demandes(champs, "Publication")
+        options = options_colonnes(demandes, Publication.ATTRIBUTS_JSONAPI, ["publication_id"])
+        if est_demande(demandes, "editions"):
+            options.append(db.selectinload(Publication.contributions).joinedload(Contribution.utilisateur))
+        return options
+
+    def to_jsonapi_dict(self, champs=None):
         """
          Permet de récupérer toutes les données d'une publication en JSON
+         :param champs: champs demandés par type de ressource (voir champs_demandes)
         """
+        demandes = champs_demandes(champs, "Publication")
+        relations = {}
+        if est_demande(demandes, "editions"):
+            relations["editions"] = [
+                contributor.author_to_json()
+                for contributor in self.contributions
+            ]
+
         return {
             "type": "Publication",
             "id": self.publication_id,
             "attributes": {
-                "Titre": self.publication_titre,
-                "Volume": self.publication_volume,
+                nom: getattr(self, colonne)
+                for nom, colonne in Publication.ATTRIBUTS_JSONAPI.items()
+                if est_demande(demandes, nom)
             },
             "links": {
                 "self": url_for("publications", publication_id=self.publication_id, _external=True),
                 "json": url_for("api_publication_unique", publication_id=self.publication_id, _external=True)
             },
-            "relationships": {
-                 "editions": [
-                     contributor.author_to_json()
-                     for contributor in self.contributions
-                 ]
-            }
+            "relationships": relations
         }
 
 
@@ -145,15 +423,32 @@ class Publication(db.Model):
 class Lettre(db.Model):
     __tablename__ = "lettre"
     lettre_id = db.Column(db.Integer, unique=True, nullable=False, primary_key=True, autoincrement=True)
-    lettre_date = db.Column(db.Text, nullable=False)
+    lettre_date = db.Column(db.Text, nullable=False, index=True)
     lettre_numero = db.Column(db.Text)
-    lettre_redacteur = db.Column(db.Text)
-    lettre_lieu = db.Column(db.Text)
+    lettre_redacteur = db.Column(db.Text, index=True)
+    # L'ancien lieu est chargé avant tout changement (active_history), même si la lettre a été expirée par un commit
+    # précédent : le nombre de lettres par lieu passe de l'ancien lieu au nouveau (voir lieux.py).
+    lettre_lieu = db.column_property(db.Column(db.Text, index=True), active_history=True)
+    # Clé naturelle (numéro, rédacteur, lieu et date normalisés), unique : voir cle_naturelle.
+    lettre_cle = db.Column(db.Text, index=True, unique=True)
+    # Premier et dernier jour possibles de la date d'envoi (AAAAMMJJ), calculés à partir de lettre_date : voir
+    # intervalle_date. Ils restent vides (NULL) si la date n'est pas reconnue.
+    lettre_date_debut = db.Column(db.Integer)
+    lettre_date_fin = db.Column(db.Integer)
     lettre_volume = db.relationship("Publication", secondary=Source, backref=db.backref("Lettre", lazy='dynamic'))
     transcription_texte: List["Transcription"] = db.relationship("Transcription", back_populates="lettre",
                                                                  cascade="all,delete")
     contributions = db.relationship("Contribution", back_populates="lettre")
 
+    # Correspondance entre les noms des attributs JSON et les colonnes, et liste des relations JSON :
+    ATTRIBUTS_JSONAPI = {"numero": "lettre_numero", "auteur": "lettre_redacteur", "lieu": "lettre_lieu",
+                         "date": "lettre_date"}
+    RELATIONS_JSONAPI = ("editions", "source", "transcription")
+
+    # Les recherches par période parcourent un intervalle de l'index des premiers jours, le dernier jour étant lu dans
+    # l'index (sans lire la table).
+    __table_args__ = (db.Index("ix_lettre_lettre_date_debut", "lettre_date_debut", "lettre_date_fin"),)
+
     def get_id(self):
         """
         Retourne l'id de l'objet actuellement utilisé
@@ -163,24 +458,57 @@ class Lettre(db.Model):
         return self.lettre_id
 
     @staticmethod
-    def ajouter_lettre(lettre_numero, lettre_redacteur, lettre_lieu, lettre_date):
+    def calculer_cle(lettre_numero, lettre_redacteur, lettre_lieu, lettre_date):
         """
+        Retourne la clé naturelle d'une lettre (voir cle_naturelle)
+        :rtype: str
+        """
+        return cle_naturelle(lettre_numero, lettre_redacteur, lettre_lieu, lettre_date)
+
+    @staticmethod
+    def filtre_periode(date_debut, date_fin):
+        """
+        Construit les conditions sélectionnant les lettres écrites pendant une période, c'est-à-dire dont tous les
+        jours possibles (voir intervalle_date) sont compris dans la période. Les lettres dont la date n'est pas reconnue
+        ne sont pas sélectionnées.
+        :param date_debut: début de la période (AAAA, AAAA-MM ou AAAA-MM-JJ), ou None
+        :param date_fin: fin de la période (AAAA, AAAA-MM ou AAAA-MM-JJ, incluse en entier), ou None
+        :return: tuple (liste de conditions SQLAlchemy, liste des erreurs)
+        :rtype: tuple
+        """
+        conditions = []
+        erreurs = []
+        if date_debut:
+            debut, fin = intervalle_date(date_debut)
+            if debut is None:
+                erreurs.append("date_from doit être une date (AAAA, AAAA-MM ou AAAA-MM-JJ)")
+            else:
+                conditions.append(Lettre.lettre_date_debut >= debut)
+        if date_fin:
+            debut, fin = intervalle_date(date_fin)
+            if fin is None:
+                erreurs.append("date_to doit être une date (AAAA, AAAA-MM ou AAAA-MM-JJ)")
+            else:
+                # Le premier jour d'une lettre précède son dernier jour : la première condition limite l'intervalle
+                # parcouru dans l'index.
+                conditions.extend([Lettre.lettre_date_debut <= fin, Lettre.lettre_date_fin <= fin])
+        return conditions, erreurs
+
+    @staticmethod
+    def verifier_champs(lettre_numero, lettre_redacteur, lettre_lieu, lettre_date):
+        """
+        Vérifie les champs obligatoires d'une lettre (règles communes au formulaire de création et à l'API).
         :param lettre_numero: le numéro de la lettre
-        :type: str
         :param lettre_redacteur: le rédacteur de la lettre
-        :type: str
         :param lettre_lieu: le lieu d'envoi de la lettre
-        :type: str
         :param lettre_date: la date d'envoi de la lettre
-        :type: str
-        :return: Ajout de données dans la base ou refus en cas d'erreurs
+        :return: liste des erreurs rencontrées (vide si la lettre est valide)
+        :rtype: list
         """
-
         # Définition d'une liste d'erreur vide.
         erreurs = []
 
-        # Définition des erreurs (paramètre obligatoire) : Si le champs n'est pas rempli correctement,
-        # une erreur s'ajoute à la liste précédemment définie.
+        # Si le champs n'est pas rempli correctement, une erreur s'ajoute à la liste précédemment définie.
         if not lettre_numero:
             erreurs.append("Le champ numero de lettre est vide, si la lettre n'est pas de éditée, mettre 0")
         if not lettre_redacteur:
@@ -189,13 +517,30 @@ class Lettre(db.Model):
             erreurs.append("Le champ lieu est vide")
         if not lettre_date or len(lettre_date) < 4:
             erreurs.append("Le champ date d'envoi doit au moins contenir une année")
+        return erreurs
+
+    @staticmethod
+    def ajouter_lettre(lettre_numero, lettre_redacteur, lettre_lieu, lettre_date):
+        """
+        :param lettre_numero: le numéro de la lettre
+        :type: str
+        :param lettre_redacteur: le rédacteur de la lettre
+        :type: str
+        :param lettre_lieu: le lieu d'envoi de la lettre
+        :type: str
+        :param lettre_date: la date d'envoi de la lettre
+        :type: str
+        :return: Ajout de données dans la base ou refus en cas d'erreurs
+        """
+
+        # Définition des erreurs (paramètres obligatoires).
+        erreurs = Lettre.verifier_champs(lettre_numero, lettre_redacteur, lettre_lieu, lettre_date)
 
         # Définition des erreurs : Vérification que la lettre n'est pas déjà enregistrée dans la BD. Sinon, une erreur
         # s'ajoute à la liste précédemment définie.
+        # La recherche se fait sur la clé naturelle, indexée.
         ajout_unique = Lettre.query.filter(
-                db.and_(Lettre.lettre_numero == lettre_numero,
-                        Lettre.lettre_redacteur == lettre_redacteur, Lettre.lettre_lieu == lettre_lieu,
-                        Lettre.lettre_date == lettre_date)).count()
+            Lettre.lettre_cle == Lettre.calculer_cle(lettre_numero, lettre_redacteur, lettre_lieu, lettre_date)).count()
         if ajout_unique > 0:
             erreurs.append("Cette lettre est déjà enregistré dans la base de donnée")
 
@@ -212,32 +557,137 @@ class Lettre(db.Model):
             lettre_date=lettre_date,
         )
 
+        # Envoi dans la DB et enregistrement de la lettre et de la contribution en une seule transaction.
+        db.session.add(nouvelle_lettre)
+        status, erreurs = Contribution.enregistrer_modification(lettre=nouvelle_lettre)
+        if status is False:
+            # Renvoi False à la fonction creation et les erreurs rencontrées.
+            return False, erreurs
+
+        # Renvoi True à la fonction creation :
+        return True, nouvelle_lettre
+
+    @staticmethod
+    def enregistrer_lot(elements):
+        """
+        Crée ou modifie un lot de lettres, avec leurs publications et leurs transcriptions, en une seule transaction.
+        Chaque élément est vérifié avec les mêmes règles que le formulaire de création ; les doublons (lettres déjà
+        présentes dans la base ou plusieurs fois dans le lot) sont cherchés en une seule requête pour tout le lot.
+        Les éléments valides sont enregistrés, avec une contribution de l'utilisateur courant par lettre, par lien vers
+        une publication et par transcription ; les éléments invalides sont rejetés avec leurs erreurs.
+        :param elements: liste de dictionnaires {"id" (pour une modification), "numero", "auteur", "lieu", "date",
+        "publications" (identifiants), "transcriptions" (textes)}
+        :return: tuple (True ou False si la transaction a échoué, liste des résultats dans l'ordre des éléments :
+        dictionnaires {"statut": "creee", "modifiee" ou "rejetee", "id", "erreurs"}, avec "conflit" (identifiant de
+        la lettre déjà enregistrée) pour une lettre enregistrée entre-temps par un autre contributeur)
+        """
+        resultats = [{"statut": "rejetee", "id": None, "erreurs": []} for element in elements]
+
+        # Vérification de la forme de chaque élément et de ses champs obligatoires.
+        for element, resultat in zip(elements, resultats):
+            if not isinstance(element, dict):
+                resultat["erreurs"].append("Chaque lettre doit être un objet JSON")
+                continue
+            champs = [element.get(champ) for champ in ("numero", "auteur", "lieu", "date")]
+            if not all(valeur is None or isinstance(valeur, str) for valeur in champs):
+                resultat["erreurs"].append("Les champs numero, auteur, lieu et date doivent être des textes")
+                continue
+            resultat["erreurs"].extend(Lettre.verifier_champs(*champs))
+            identifiant = element.get("id")
+            if identifiant is not None and (not isinstance(identifiant, int) or isinstance(identifiant, bool)):
+                resultat["erreurs"].append("L'identifiant de la lettre doit être un nombre entier")
+            publications = element.setdefault("publications", [])
+            if not isinstance(publications, list) or not all(
+                    isinstance(publication_id, int) and not isinstance(publication_id, bool)
+                    for publication_id in publications):
+                resultat["erreurs"].append("Le champ publications doit être une liste d'identifiants de publications")
+            transcriptions = element.setdefault("transcriptions", [])
+            if not isinstance(transcriptions, list) or not all(
+                    isinstance(texte, str) and texte for texte in transcriptions):
+                resultat["erreurs"].append("Le champ transcriptions doit être une liste de textes non vides")
+        valides = [(element, resultat) for element, resultat in zip(elements, resultats) if not resultat["erreurs"]]
+
+        def cle(element):
+            return Lettre.calculer_cle(element["numero"], element["auteur"], element["lieu"], element["date"])
+
+        # Chargement, en une requête chacun, des lettres à modifier, des lettres existantes ayant la même clé
+        # naturelle qu'un élément du lot, et des publications citées.
+        a_modifier = {lettre.lettre_id: lettre for lettre in Lettre.query.filter(Lettre.lettre_id.in_(
+            {element["id"] for element, resultat in valides if element.get("id") is not None})).all()}
+        existantes = dict(db.session.query(Lettre.lettre_cle, Lettre.lettre_id).filter(
+            Lettre.lettre_cle.in_({cle(element) for element, resultat in valides})))
+        publications = {publication.publication_id: publication for publication in Publication.query.filter(
+            Publication.publication_id.in_({identifiant for element, resultat in valides
+                                            for identifiant in element["publications"]})).all()}
+
+        # Vérification des doublons et des objets cités, puis préparation des écritures.
+        cles_du_lot = set()
+        lettres_du_lot = []
+        for element, resultat in valides:
+            identifiant = element.get("id")
+            if identifiant is not None and identifiant not in a_modifier:
+                resultat["erreurs"].append("La lettre {} n'existe pas".format(identifiant))
+            if existantes.get(cle(element), identifiant) != identifiant or cle(element) in cles_du_lot:
+                resultat["erreurs"].append("Cette lettre est déjà enregistré dans la base de donnée")
+            inconnues = [str(publication_id) for publication_id in element["publications"]
+                         if publication_id not in publications]
+            if inconnues:
+                resultat["erreurs"].append("Publication(s) inconnue(s) : {}".format(", ".join(inconnues)))
+            if resultat["erreurs"]:
+                continue
+            cles_du_lot.add(cle(element))
+
+            if identifiant is None:
+                lettre = Lettre()
+                db.session.add(lettre)
+                resultat["statut"] = "creee"
+            else:
+                lettre = a_modifier[identifiant]
+                resultat["statut"] = "modifiee"
+            lettre.lettre_numero, lettre.lettre_redacteur, lettre.lettre_lieu, lettre.lettre_date = \
+                element["numero"], element["auteur"], element["lieu"], element["date"]
+            db.session.add(Contribution(contribution_ut_id=current_user.ut_id, lettre=lettre))
+
+            for publication_id in element["publications"]:
+                source = publications[publication_id]
+                if source not in lettre.lettre_volume:
+                    lettre.lettre_volume.append(source)
+                    db.session.add(Contribution(contribution_ut_id=current_user.ut_id, lettre=lettre,
+                                                publication=source))
+            for texte in element["transcriptions"]:
+                transcription = Transcription(transcription_texte=texte)
+                lettre.transcription_texte.append(transcription)
+                db.session.add(Contribution(contribution_ut_id=current_user.ut_id, transcription=transcription))
+            lettres_du_lot.append((element, lettre, resultat))
+
+        # Enregistrement de toutes les lettres valides en un seul commit. Si une lettre identique a été enregistrée
+        # entre-temps par un autre contributeur, l'index unique des clés naturelles refuse le lot : les lettres en
+        # conflit sont cherchées par leur clé naturelle.
         try:
-            # Envoi dans la DB et enregistrement
-            db.session.add(nouvelle_lettre)
             db.session.commit()
-
-            # Enregistrement de l'ajout dans la table contribution :
-            if nouvelle_lettre:
-                # Récupération l'id de la nouvelle lettre.
-                lettre = Lettre.query.order_by(Lettre.lettre_id.desc()).limit(1).first()
-                # Récupération l'id de l'utilisateur courant
-                utilisateur = Utilisateur.query.get(current_user.ut_id)
-                # Préparation des données à l'enregistrement :
-                a_contribue = Contribution(utilisateur=utilisateur, lettre=lettre)
-                # Envoi dans la DB et enregistrement
-                db.session.add(a_contribue)
-                db.session.commit()
-
-            # Renvoi True à la fonction creation :
-            return (True, nouvelle_lettre)
-
-        # Si il y a des erreurs :
         except Exception as erreur:
-            # Annulation de la transaction en cours
             db.session.rollback()
-            # Renvoi False à la fonction publication_creation et les erreurs rencontrées.
-            return False, [str(erreur)]
+            conflits = {}
+            if doublon_cle_naturelle(erreur):
+                message = "Une de ces lettres a été enregistrée entre-temps dans la base de donnée"
+                conflits = dict(db.session.query(Lettre.lettre_cle, Lettre.lettre_id).filter(
+                    Lettre.lettre_cle.in_({cle(element) for element, lettre, resultat in lettres_du_lot})))
+            else:
+                message = str(erreur)
+            for element, lettre, resultat in lettres_du_lot:
+                resultat["statut"] = "rejetee"
+                conflit = conflits.get(cle(element), element.get("id"))
+                if conflit != element.get("id"):
+                    resultat["conflit"] = conflit
+                    resultat["erreurs"].append("Cette lettre a été enregistrée entre-temps dans la base de donnée "
+                                               "(lettre {})".format(conflit))
+                else:
+                    resultat["erreurs"].append(message)
+            return False, resultats
+
+        for element, lettre, resultat in lettres_du_lot:
+            resultat["id"] = lettre.lettre_id
+        return True, resultats
 
     @staticmethod
     def sourcer_lettre(publication_id, lettre_id):
@@ -247,7 +697,7 @@ class Lettre(db.Model):
             :type: int
             :param lettre_id: identifiant du document auquel ajouter la publication
             :type: int
-            :return: Liste d'erreurs si rencontré
+            :return: tuple (True, contribution) ou (False, liste d'erreurs)
         """
         # Définition d'une liste d'erreur vide.
         erreurs = []
@@ -263,11 +713,11 @@ class Lettre(db.Model):
             erreurs.append("Il n'y a pas de publication à associer")
         if not lettre_id:
             erreurs.append("Il n'y a pas de lettre à associer")
-
-        # Si les identifiants ne correspondent à rien,
-        if source is None or lettre is None:
-            # rien ne se passe.
-            return
+        # Si les identifiants ne correspondent à rien, une erreur s'ajoute également à la liste.
+        if publication_id and source is None:
+            erreurs.append("La publication {} est introuvable".format(publication_id))
+        if lettre_id and lettre is None:
+            erreurs.append("La lettre {} est introuvable".format(lettre_id))
 
         # Si la longueur de la liste erreurs est supérieur à 0, donc si il y a au moins une erreur :
         if len(erreurs) > 0:
@@ -279,23 +729,9 @@ class Lettre(db.Model):
             # Elle est ajoutée
             lettre.lettre_volume.append(source)
 
-        # Envoi dans la DB et enregistrement
+        # Envoi dans la DB et enregistrement du lien et de la contribution en une seule transaction.
         db.session.add(lettre)
-        db.session.commit()
-
-        # Enregistrement de la modification dans la table contribution :
-        if lettre:
-            # Récupération l'id de la lettre.
-            lettre_sourcee = Lettre.query.get_or_404(lettre_id)
-            # Récupération l'id de la publication.
-            source = Publication.query.filter(Publication.publication_id == publication_id).first()
-            # Récupération l'id de l'utilisateur courant
-            utilisateur = Utilisateur.query.get(current_user.ut_id)
-            # Préparation des données à l'enregistrement :
-            a_contribue = Contribution(utilisateur=utilisateur, lettre=lettre_sourcee, publication=source)
-            # Envoi dans la DB et enregistrement
-            db.session.add(a_contribue)
-            db.session.commit()
+        return Contribution.enregistrer_modification(lettre=lettre, publication=source)
 
     @staticmethod
     def retirer_source_lettre(publication_id, lettre_id):
@@ -305,7 +741,7 @@ class Lettre(db.Model):
             :type: int
             :param lettre_id: identifiant du document auquel supprimer la publication
             :type: int
-            :return: Liste d'erreurs si rencontré
+            :return: tuple (True, contribution) ou (False, liste d'erreurs)
         """
         # Définition d'une liste d'erreur vide.
         erreurs = []
@@ -321,11 +757,11 @@ class Lettre(db.Model):
             erreurs.append("Il n'y a pas de publication à dissocier")
         if not lettre_id:
             erreurs.append("Il n'y a pas de lettre à dissocier")
-
-        # Si les identifiants ne correspondent à rien,
-        if source is None or lettre is None:
-            # rien ne se passe.
-            return
+        # Si les identifiants ne correspondent à rien, une erreur s'ajoute également à la liste.
+        if publication_id and source is None:
+            erreurs.append("La publication {} est introuvable".format(publication_id))
+        if lettre_id and lettre is None:
+            erreurs.append("La lettre {} est introuvable".format(lettre_id))
 
         # Si la longueur de la liste erreurs est supérieur à 0, donc si il y a au moins une erreur :
         if len(erreurs) > 0:
@@ -334,58 +770,70 @@ class Lettre(db.Model):
 
         # Si la source est dans la liste de source contenu dans lettre_volume
         if source in lettre.lettre_volume:
-            # Elle est ajoutée
+            # Elle est retirée
             lettre.lettre_volume.remove(source)
 
-        # Envoi dans la DB et enregistrement
+        # Envoi dans la DB et enregistrement du retrait et de la contribution en une seule transaction.
         db.session.add(lettre)
-        db.session.commit()
-
-        # Enregistrement de la modification dans la table contribution :
-        if lettre:
-            # Récupération l'id de la lettre.
-            lettre_sourcee = Lettre.query.get_or_404(lettre_id)
-            # Récupération l'id de la publication.
-            source = Publication.query.filter(Publication.publication_id == publication_id).first()
-            # Récupération l'id de l'utilisateur courant
-            utilisateur = Utilisateur.query.get(current_user.ut_id)
-            # Préparation des données à l'enregistrement :
-            a_contribue = Contribution(utilisateur=utilisateur, lettre=lettre_sourcee, publication=source)
-            # Envoi dans la DB et enregistrement
-            db.session.add(a_contribue)
-            db.session.commit()
+        return Contribution.enregistrer_modification(lettre=lettre, publication=source)
 
-    def to_jsonapi_dict(self):
+    @staticmethod
+    def options_jsonapi(champs=None):
+        """
+        Stratégie de chargement des relations utilisées par to_jsonapi_dict : contributions, publications et
+        transcriptions (avec leurs propres contributions) sont récupérées pour tout un lot de lettres en un nombre fixe
+        de requêtes, quel que soit le nombre de lettres du lot.
+        Les colonnes et relations absentes de fields[Lettre] (ou fields[Publication], fields[Transcription] pour les
+        ressources incluses) ne sont pas chargées.
+        :param champs: champs demandés par type de ressource (voir champs_demandes)
+        :return: liste d'options à passer à query.options()
+        """
+        demandes = champs_demandes(champs, "Lettre")
+        options = options_colonnes(demandes, Lettre.ATTRIBUTS_JSONAPI, ["lettre_id"])
+        if est_demande(demandes, "editions"):
+            options.append(db.selectinload(Lettre.contributions).joinedload(Contribution.utilisateur))
+        if est_demande(demandes, "source"):
+            options.append(db.selectinload(Lettre.lettre_volume).options(*Publication.options_jsonapi(champs)))
+        if est_demande(demandes, "transcription"):
+            options.append(db.selectinload(Lettre.transcription_texte).options(*Transcription.options_jsonapi(champs)))
+        return options
+
+    def to_jsonapi_dict(self, champs=None):
         """
          Permet de récupérer toutes les données d'une lettre en JSON
+         :param champs: champs demandés par type de ressource (voir champs_demandes)
         """
+        demandes = champs_demandes(champs, "Lettre")
+        relations = {}
+        if est_demande(demandes, "editions"):
+            relations["editions"] = [
+                contributor.author_to_json()
+                for contributor in self.contributions
+            ]
+        if est_demande(demandes, "source"):
+            relations["source"] = [
+                publication.to_jsonapi_dict(champs)
+                for publication in self.lettre_volume
+            ]
+        if est_demande(demandes, "transcription"):
+            relations["transcription"] = [
+                transcription.to_jsonapi_dict(champs)
+                for transcription in self.transcription_texte
+            ]
+
         return {
             "type": "Lettre",
             "id": self.lettre_id,
             "attributes": {
-                "numero": self.lettre_numero,
-                "auteur": self.lettre_redacteur,
-                "lieu": self.lettre_lieu,
-                "date": self.lettre_date,
+                nom: getattr(self, colonne)
+                for nom, colonne in Lettre.ATTRIBUTS_JSONAPI.items()
+                if est_demande(demandes, nom)
             },
             "links": {
                 "self": url_for("lettres", lettre_id=self.lettre_id, _external=True),
                 "json": url_for("api_lettre_unique", lettre_id=self.lettre_id, _external=True)
             },
-            "relationships": {
-                 "editions": [
-                     contributor.author_to_json()
-                     for contributor in self.contributions
-                 ],
-                "source": [
-                    publication.to_jsonapi_dict()
-                    for publication in self.lettre_volume
-                ],
-                "transcription": [
-                    transcription.to_jsonapi_dict()
-                    for transcription in self.transcription_texte
-                ]
-            }
+            "relationships": relations
         }
 
 
@@ -393,11 +841,21 @@ class Lettre(db.Model):
 class Transcription(db.Model):
     __tablename__ = "transcription"
     transcription_id = db.Column(db.Integer, unique=True, nullable=False, primary_key=True, autoincrement=True)
-    transcription_texte = db.Column(db.Text, nullable=False)
-    transcription_lettre_id = db.Column(db.Integer, db.ForeignKey('lettre.lettre_id'), nullable=False)
+    # Le texte est enregistré compressé (voir TexteCompresse). Il n'est lu qu'à la demande (deferred) : les listes
+    # affichent l'extrait et le nombre de mots, calculés à chaque enregistrement du texte (voir apercu_texte).
+    # L'ancien texte est chargé avant tout changement (voir charger_ancienne_valeur en fin de fichier).
+    transcription_texte = db.deferred(db.Column(TexteCompresse, nullable=False))
+    transcription_extrait = db.Column(db.Text)
+    transcription_mots = db.Column(db.Integer)
+    transcription_lettre_id = db.Column(db.Integer, db.ForeignKey('lettre.lettre_id'), nullable=False, index=True)
     lettre: Lettre = db.relationship("Lettre", back_populates="transcription_texte")
     contributions = db.relationship("Contribution", back_populates="transcription")
 
+    # Correspondance entre les noms des attributs JSON et les colonnes, et liste des relations JSON :
+    ATTRIBUTS_JSONAPI = {"ID lettre transcrite": "transcription_lettre_id", "Texte": "transcription_texte",
+                         "Extrait": "transcription_extrait", "Mots": "transcription_mots"}
+    RELATIONS_JSONAPI = ("editions",)
+
     def get_id(self):
         """
         Retourne l'id de l'objet actuellement utilisé
@@ -406,25 +864,92 @@ class Transcription(db.Model):
         """
         return self.transcription_id
 
-    def to_jsonapi_dict(self):
+    @staticmethod
+    def options_jsonapi(champs=None):
+        """
+        Stratégie de chargement des relations utilisées par to_jsonapi_dict : les contributions et leurs auteurs sont
+        récupérés pour tout un lot de transcriptions en une seule requête.
+        Les colonnes et relations absentes de fields[Transcription] ne sont pas chargées : le texte, chargé à la
+        demande par défaut, n'est lu que s'il est demandé (ex : fields[Transcription]=Extrait,Mots pour un aperçu).
+        :param champs: champs demandés par type de ressource (voir champs_demandes)
+        :return: liste d'options à passer à query.options()
+        """
+        demandes = champs_demandes(champs, "Transcription")
+        # La clé étrangère vers la lettre reste nécessaire pour rattacher la transcription à sa lettre.
+        options = options_colonnes(demandes, Transcription.ATTRIBUTS_JSONAPI,
+                                   ["transcription_id", "transcription_lettre_id"])
+        if demandes is None:
+            options.append(db.undefer(Transcription.transcription_texte))
+        if est_demande(demandes, "editions"):
+            options.append(db.selectinload(Transcription.contributions).joinedload(Contribution.utilisateur))
+        return options
+
+    def to_jsonapi_dict(self, champs=None):
         """
          Permet de récupérer toutes les données d'une transcription en JSON
+         :param champs: champs demandés par type de ressource (voir champs_demandes)
         """
+        demandes = champs_demandes(champs, "Transcription")
+        relations = {}
+        if est_demande(demandes, "editions"):
+            relations["editions"] = [
+                contributor.author_to_json()
+                for contributor in self.contributions
+            ]
+
         return {
             "type": "Transcription",
             "id": self.transcription_id,
             "attributes": {
-                "ID lettre transcrite": self.transcription_lettre_id,
-                "Texte": self.transcription_texte,
+                nom: getattr(self, colonne)
+                for nom, colonne in Transcription.ATTRIBUTS_JSONAPI.items()
+                if est_demande(demandes, nom)
             },
             "links": {
                 "self": url_for("transcriptions", transcription_id=self.transcription_id, _external=True),
                 "json": url_for("api_transcription_unique", transcription_id=self.transcription_id, _external=True)
             },
-            "relationships": {
-                 "editions": [
-                     contributor.author_to_json()
-                     for contributor in self.contributions
-                 ]
-            }
+            "relationships": relations
         }
+
+
+# Calcul des clés naturelles : à chaque insertion ou modification d'une lettre ou d'une publication par l'ORM, sa clé
+# est recalculée à partir de ses colonnes, sauf pour les doublons anciens, dont la clé reste vide jusqu'à leur fusion
+# (voir cle_naturelle_vide).
+@event.listens_for(Lettre, "before_insert")
+@event.listens_for(Lettre, "before_update")
+def calculer_cle_lettre(mapper, connexion, lettre):
+    if inspect(lettre).persistent and cle_naturelle_vide(connexion, lettre, "lettre_cle"):
+        return
+    lettre.lettre_cle = Lettre.calculer_cle(lettre.lettre_numero, lettre.lettre_redacteur, lettre.lettre_lieu,
+                                            lettre.lettre_date)
+
+
+# De même, l'intervalle de la date d'envoi d'une lettre est recalculé à partir de lettre_date.
+@event.listens_for(Lettre, "before_insert")
+@event.listens_for(Lettre, "before_update")
+def calculer_intervalle_date_lettre(mapper, connexion, lettre):
+    lettre.lettre_date_debut, lettre.lettre_date_fin = intervalle_date(lettre.lettre_date)
+
+
+# L'extrait et le nombre de mots d'une transcription sont recalculés lorsque son texte est enregistré.
+@event.listens_for(Transcription, "before_insert")
+@event.listens_for(Transcription, "before_update")
+def calculer_apercu_transcription(mapper, connexion, transcription):
+    if inspect(transcription).attrs.transcription_texte.history.has_changes():
+        transcription.transcription_extrait, transcription.transcription_mots = \
+            apercu_texte(transcription.transcription_texte)
+
+
+# L'ancien texte d'une transcription est chargé avant tout changement, pour devenir la révision 1 d'une transcription
+# qui n'avait pas encore d'historique (voir revisions.py).
+charger_ancienne_valeur(Transcription.transcription_texte)
+
+
+@event.listens_for(Publication, "before_insert")
+@event.listens_for(Publication, "before_update")
+def calculer_cle_publication(mapper, connexion, publication):
+    if inspect(publication).persistent and cle_naturelle_vide(connexion, publication, "publication_cle"):
+        return
+    publication.publication_cle = Publication.calculer_cle(publication.publication_titre,
+                                                           publication.publication_volume)
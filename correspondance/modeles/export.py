@@ -0,0 +1,136 @@
+import csv
+import io
+import json
+from collections import defaultdict
+
+from .. app import db
+
+
+# Export complet du corpus :
+# Les lettres sont lues par lots, dans l'ordre de leur identifiant (reprise après le dernier identifiant lu, comme pour
+# les collections de l'API). Pour chaque lot, les publications, les transcriptions et les contributions des lettres
+# sont récupérées en une requête chacune. Les lignes sont lues avec des requêtes SQL simples, sans créer d'objets de
+# l'ORM, et chaque lettre est écrite dès qu'elle est prête : la mémoire utilisée ne dépend que de la taille d'un lot.
+
+LETTRES = "SELECT lettre_id, lettre_numero, lettre_redacteur, lettre_lieu, lettre_date FROM lettre " \
+          "WHERE lettre_id > :dernier ORDER BY lettre_id LIMIT :taille_lot"
+
+PUBLICATIONS = "SELECT source.source_lettre_id, publication.publication_id, publication.publication_titre, " \
+               "publication.publication_volume FROM source " \
+               "JOIN publication ON publication.publication_id = source.source_publication_id " \
+               "WHERE source.source_lettre_id IN :ids ORDER BY publication.publication_id"
+
+# Le texte des transcriptions est enregistré compressé (voir donnees.TexteCompresse).
+TRANSCRIPTIONS = "SELECT transcription_lettre_id, transcription_id, decompresser(transcription_texte) " \
+                 "FROM transcription WHERE transcription_lettre_id IN :ids ORDER BY transcription_id"
+
+# Historique des contributions sur chaque lettre et sur ses transcriptions.
+CONTRIBUTIONS = "SELECT coalesce(contribution.contribution_lettre_id, transcription.transcription_lettre_id), " \
+                "contribution.contribution_id, contribution.contribution_transcription_id, " \
+                "contribution.contribution_date, utilisateur.ut_nom FROM contribution " \
+                "LEFT JOIN transcription ON transcription.transcription_id = contribution.contribution_transcription_id " \
+                "LEFT JOIN utilisateur ON utilisateur.ut_id = contribution.contribution_ut_id " \
+                "WHERE contribution.contribution_lettre_id IN :ids OR transcription.transcription_lettre_id IN :ids " \
+                "ORDER BY contribution.contribution_date, contribution.contribution_id"
+
+# Colonnes de l'export CSV : une ligne par lettre, les publications, transcriptions et contributions étant réunies
+# dans une cellule chacune.
+COLONNES_CSV = ("id", "numero", "redacteur", "lieu", "date", "publications", "transcriptions", "contributions")
+
+
+def requete_par_lettre(connexion, requete, ids):
+    """
+    Exécute une requête dont la première colonne est l'identifiant de la lettre, et regroupe ses lignes par lettre.
+    :return: dictionnaire {lettre_id: liste des lignes (sans la première colonne)}
+    """
+    lignes = defaultdict(list)
+    resultat = connexion.execute(
+        db.text(requete).bindparams(db.bindparam("ids", expanding=True)), {"ids": ids})
+    for ligne in resultat:
+        lignes[ligne[0]].append(tuple(ligne[1:]))
+    return lignes
+
+
+def exporter_lettres(connexion, taille_lot):
+    """
+    Parcourt toutes les lettres du corpus, avec leurs publications, leurs transcriptions et leurs contributions.
+    :param connexion: connexion SQLAlchemy (ou session)
+    :param taille_lot: nombre de lettres lues à chaque requête
+    :return: générateur de dictionnaires, un par lettre
+    """
+    dernier = 0
+    while True:
+        lettres = connexion.execute(db.text(LETTRES), {"dernier": dernier, "taille_lot": taille_lot}).fetchall()
+        if not lettres:
+            return
+        ids = [lettre[0] for lettre in lettres]
+        publications = requete_par_lettre(connexion, PUBLICATIONS, ids)
+        transcriptions = requete_par_lettre(connexion, TRANSCRIPTIONS, ids)
+        contributions = requete_par_lettre(connexion, CONTRIBUTIONS, ids)
+
+        for lettre_id, numero, redacteur, lieu, date in lettres:
+            yield {
+                "id": lettre_id,
+                "numero": numero,
+                "redacteur": redacteur,
+                "lieu": lieu,
+                "date": date,
+                "publications": [{"id": publication_id, "titre": titre, "volume": volume}
+                                 for publication_id, titre, volume in publications[lettre_id]],
+                "transcriptions": [{"id": transcription_id, "texte": texte}
+                                   for transcription_id, texte in transcriptions[lettre_id]],
+                "contributions": [{"id": contribution_id, "transcription": transcription_id,
+                                   "date": str(date_contribution) if date_contribution else None,
+                                   "contributeur": contributeur}
+                                  for contribution_id, transcription_id, date_contribution, contributeur
+                                  in contributions[lettre_id]],
+            }
+
+        if len(lettres) < taille_lot:
+            return
+        dernier = ids[-1]
+
+
+def formater_ndjson(lettres):
+    """
+    Écrit les lettres au format NDJSON : un document JSON par ligne.
+    :param lettres: générateur renvoyé par exporter_lettres
+    :return: générateur de lignes de texte
+    """
+    for lettre in lettres:
+        yield json.dumps(lettre, ensure_ascii=False) + "\n"
+
+
+def formater_csv(lettres):
+    """
+    Écrit les lettres au format CSV (séparateur ";", comme lettre.csv). Les publications sont notées "titre (volume)",
+    les transcriptions par leur identifiant et les contributions "contributeur (date)", séparées par " | ".
+    :param lettres: générateur renvoyé par exporter_lettres
+    :return: générateur de lignes de texte
+    """
+    tampon = io.StringIO()
+    ecriture = csv.writer(tampon, delimiter=";")
+
+    def ligne(valeurs):
+        ecriture.writerow(valeurs)
+        texte = tampon.getvalue()
+        tampon.seek(0)
+        tampon.truncate()
+        return texte
+
+    yield ligne(COLONNES_CSV)
+    for lettre in lettres:
+        yield ligne([
+            lettre["id"], lettre["numero"], lettre["redacteur"], lettre["lieu"], lettre["date"],
+            " | ".join("{} ({})".format(publication["titre"], publication["volume"]) if publication["volume"]
+                       else publication["titre"] for publication in lettre["publications"]),
+            " | ".join(str(transcription["id"]) for transcription in lettre["transcriptions"]),
+            " | ".join("{} ({})".format(contribution["contributeur"], contribution["date"])
+                       for contribution in lettre["contributions"]),
+        ])
+
+
+FORMATS_EXPORT = {
+    "ndjson": (formater_ndjson, "application/x-ndjson"),
+    "csv": (formater_csv, "text/csv"),
+}
@@ -0,0 +1,143 @@
+from .. app import db
+from ..constantes import FACETTES_TAILLE
+from ..modeles.donnees import Lettre, Publication, Source
+from ..modeles.recherche import requete_fts
+from ..cache import valeur_en_cache
+
+
+# Facettes de la recherche :
+# Pour un ensemble de lettres (tout le corpus, ou les lettres trouvées pour un mot clé et des filtres), nombre de
+# lettres par rédacteur, par lieu, par année et par publication. Chaque facette est une requête GROUP BY : sur tout le
+# corpus, elle lit l'index de la colonne (rédacteur, lieu, dates, publications de la table Source) sans lire la table ;
+# sur un ensemble de lettres, elle lit les seules lettres de l'ensemble. Les facettes calculées sont gardées dans le
+# cache des réponses et invalidées comme elles à chaque écriture sur les lettres ou les publications.
+
+# Paramètres de la requête filtrant les lettres : période (voir Lettre.filtre_periode), rédacteur, lieu et publication
+# (identifiant). Les liens des facettes ajoutent un filtre aux filtres en cours.
+FILTRES = ("date_from", "date_to", "auteur", "lieu", "publication")
+
+# Étiquettes de cache des facettes : elles dépendent de toutes les lettres et de toutes les publications.
+ETIQUETTES_FACETTES = {("lettre", "*"), ("publication", "*")}
+
+
+def lire_filtres(arguments):
+    """
+    Lit les filtres renseignés dans les paramètres de la requête.
+    :param arguments: paramètres de la requête (request.args)
+    :return: dictionnaire {nom du filtre: valeur}, sans les filtres vides
+    :rtype: dict
+    """
+    return {nom: arguments.get(nom) for nom in FILTRES if arguments.get(nom)}
+
+
+def conditions_filtres(filtres):
+    """
+    Construit les conditions SQLAlchemy sur les lettres correspondant aux filtres.
+    :param filtres: dictionnaire renvoyé par lire_filtres
+    :return: tuple (liste de conditions, liste des erreurs)
+    :rtype: tuple
+    """
+    conditions, erreurs = Lettre.filtre_periode(filtres.get("date_from"), filtres.get("date_to"))
+    if filtres.get("auteur"):
+        conditions.append(Lettre.lettre_redacteur == filtres["auteur"])
+    if filtres.get("lieu"):
+        conditions.append(Lettre.lettre_lieu == filtres["lieu"])
+    if filtres.get("publication"):
+        if filtres["publication"].isdigit():
+            conditions.append(Lettre.lettre_id.in_(db.session.query(Source.c.source_lettre_id).filter(
+                Source.c.source_publication_id == int(filtres["publication"]))))
+        else:
+            erreurs.append("publication doit être l'identifiant d'une publication")
+    return conditions, erreurs
+
+
+def lettres_selectionnees(motclef, conditions):
+    """
+    Construit la sous-requête des identifiants des lettres trouvées pour le mot clé et répondant aux conditions.
+    :return: sous-requête (colonne lettre_id), ou None s'il n'y a ni mot clé ni condition (tout le corpus)
+    """
+    if not motclef and not conditions:
+        return None
+    query = db.session.query(Lettre.lettre_id).filter(*conditions)
+    if motclef:
+        trouvees = db.text("SELECT rowid AS lettre_id FROM lettre_recherche WHERE lettre_recherche MATCH :requete")\
+            .bindparams(requete=requete_fts(motclef) or '""').columns(lettre_id=db.Integer).alias("trouvees")
+        query = query.join(trouvees, trouvees.c.lettre_id == Lettre.lettre_id)
+    return query.subquery()
+
+
+def compter(colonnes, regroupement, lettre_id, lettres, ordre=None, conditions=(), jointure=None):
+    """
+    Compte les lettres par valeur d'une ou plusieurs colonnes.
+    :param colonnes: colonnes renvoyées (valeur, éventuellement libellés)
+    :param regroupement: expression de regroupement (GROUP BY)
+    :param lettre_id: colonne de l'identifiant de la lettre dans la table lue
+    :param lettres: sous-requête des identifiants des lettres (voir lettres_selectionnees), ou None
+    :param ordre: ordre des valeurs (par défaut : nombre de lettres décroissant, limité à FACETTES_TAILLE valeurs)
+    :param conditions: conditions supplémentaires (ex : valeur renseignée)
+    :param jointure: arguments de join() à partir de la table Source, pour compter les lettres par publication
+    :return: liste de tuples (colonnes..., nombre)
+    """
+    nombre = db.func.count()
+    query = db.session.query(*colonnes, nombre)
+    if jointure is not None:
+        query = query.select_from(Source).join(*jointure)
+    query = query.filter(*conditions)
+    if lettres is not None:
+        query = query.filter(lettre_id.in_(db.session.query(lettres.c.lettre_id)))
+    query = query.group_by(regroupement)
+    if ordre is None:
+        query = query.order_by(nombre.desc(), regroupement).limit(FACETTES_TAILLE)
+    else:
+        query = query.order_by(ordre)
+    return query.all()
+
+
+def compter_facettes(lettres):
+    """
+    Calcule les facettes d'un ensemble de lettres. Les rédacteurs, les lieux et les publications sont classés par
+    nombre de lettres décroissant (FACETTES_TAILLE valeurs au plus), les années dans l'ordre chronologique ; seules les
+    lettres dont la date tombe dans une seule année sont comptées par année.
+    :param lettres: sous-requête des identifiants des lettres (voir lettres_selectionnees), ou None pour tout le corpus
+    :return: dictionnaire {facette: liste de dictionnaires {"valeur", "nombre"} (et "libelle" pour les publications)}
+    :rtype: dict
+    """
+    annee = Lettre.lettre_date_debut / 10000
+    facettes = {
+        "auteur": [{"valeur": valeur, "nombre": nombre} for valeur, nombre in compter(
+            [Lettre.lettre_redacteur], Lettre.lettre_redacteur, Lettre.lettre_id, lettres,
+            conditions=[Lettre.lettre_redacteur.isnot(None)])],
+        "lieu": [{"valeur": valeur, "nombre": nombre} for valeur, nombre in compter(
+            [Lettre.lettre_lieu], Lettre.lettre_lieu, Lettre.lettre_id, lettres,
+            conditions=[Lettre.lettre_lieu.isnot(None)])],
+        "annee": [{"valeur": valeur, "nombre": nombre} for valeur, nombre in compter(
+            [annee], annee, Lettre.lettre_id, lettres, ordre=annee,
+            conditions=[Lettre.lettre_date_debut.isnot(None), annee == Lettre.lettre_date_fin / 10000])],
+        "publication": [
+            {"valeur": valeur, "libelle": "{} ({})".format(titre, volume) if volume else titre, "nombre": nombre}
+            for valeur, titre, volume, nombre in compter(
+                [Source.c.source_publication_id, Publication.publication_titre, Publication.publication_volume],
+                Source.c.source_publication_id, Source.c.source_lettre_id, lettres,
+                jointure=(Publication, Publication.publication_id == Source.c.source_publication_id))],
+    }
+    return facettes
+
+
+def facettes_recherche(motclef, filtres):
+    """
+    Retourne les facettes des lettres trouvées pour le mot clé et les filtres, et celles de tout le corpus, en les
+    lisant dans le cache si elles y sont.
+    :param motclef: mot clé de la recherche, ou None
+    :param filtres: dictionnaire renvoyé par lire_filtres (les filtres doivent être valides)
+    :return: dictionnaire {"resultats": facettes, "corpus": facettes} (voir compter_facettes)
+    :rtype: dict
+    """
+    # Le mot clé est normalisé (voir requete_fts) : deux saisies équivalentes partagent leurs facettes en cache.
+    requete = (requete_fts(motclef) or '""') if motclef else None
+    corpus = valeur_en_cache(("facettes", None, ()), ETIQUETTES_FACETTES, lambda: compter_facettes(None))
+    if requete is None and not filtres:
+        return {"resultats": corpus, "corpus": corpus}
+    conditions = conditions_filtres(filtres)[0]
+    resultats = valeur_en_cache(("facettes", requete, tuple(sorted(filtres.items()))), ETIQUETTES_FACETTES,
+                                lambda: compter_facettes(lettres_selectionnees(motclef, conditions)))
+    return {"resultats": resultats, "corpus": corpus}
@@ -0,0 +1,191 @@
+import csv
+import os
+import time
+from itertools import islice
+
+from .. app import db
+from ..modeles import recherche, statistiques, lieux
+from ..modeles.donnees import Lettre, Publication, intervalle_date
+
+
+# Import des fichiers CSV du corpus (dossier base_de_données) :
+# Les fichiers sont lus ligne par ligne et insérés par lots (executemany), dans une seule transaction qui verrouille la
+# base en écriture dès son début (BEGIN IMMEDIATE). Les lignes déjà présentes dans la base sont ignorées : une lettre
+# est reconnue par sa clé naturelle (numéro, rédacteur, lieu et date normalisés), une publication par la sienne (titre
+# et volume), voir donnees.cle_naturelle. Les identifiants des fichiers CSV ne sont utilisés que pour relier les
+# lettres à leurs publications (source.csv) : les lignes ajoutées reçoivent les identifiants suivant ceux de la base,
+# ce qui permet d'importer un nouveau volume dans une base déjà remplie.
+# Le fichier lieu.csv, facultatif, donne les coordonnées des lieux d'envoi (voir lieux.py).
+
+# Nom, séparateur et colonnes (dans l'ordre du fichier) de chaque fichier CSV.
+FICHIERS_CSV = {
+    "publication": ("publication.csv", ",", ("id", "titre", "volume")),
+    "lettre": ("lettre.csv", ";", ("id", "numero", "redacteur", "lieu", "date")),
+    "source": ("source.csv", ";", ("lettre_id", "publication_id")),
+    "lieu": ("lieu.csv", ";", ("nom", "latitude", "longitude")),
+}
+
+
+def lire_csv(chemin, separateur, colonnes):
+    """
+    Lit un fichier CSV ligne par ligne, sans le charger entièrement en mémoire. La ligne d'en-tête est ignorée et les
+    valeurs vides sont remplacées par None.
+    :param chemin: chemin du fichier
+    :param separateur: séparateur des colonnes
+    :param colonnes: noms des colonnes, dans l'ordre du fichier
+    :return: générateur de dictionnaires {nom de colonne: valeur}
+    """
+    with open(chemin, encoding="utf-8-sig", newline="") as fichier:
+        lignes = csv.reader(fichier, delimiter=separateur)
+        next(lignes, None)
+        for ligne in lignes:
+            if any(valeur.strip() for valeur in ligne):
+                yield dict(zip(colonnes, (valeur.strip() or None for valeur in ligne)))
+
+
+def par_lots(elements, taille_lot):
+    """
+    Découpe un itérable en listes de taille_lot éléments (la dernière peut être plus courte).
+    """
+    elements = iter(elements)
+    lot = list(islice(elements, taille_lot))
+    while lot:
+        yield lot
+        lot = list(islice(elements, taille_lot))
+
+
+def prochain_identifiant(connexion, table, colonne):
+    """
+    Retourne le premier identifiant libre d'une table. La base étant verrouillée en écriture pendant l'import, aucun
+    autre processus ne peut l'attribuer entre-temps.
+    """
+    return connexion.execute("SELECT coalesce(max({}), 0) + 1 FROM {}".format(colonne, table)).scalar()
+
+
+def importer_lignes(connexion, lignes, cle, existantes, identifiant, insertion, taille_lot, completer=None):
+    """
+    Insère par lots les lignes absentes de la base et fait correspondre l'identifiant CSV de chaque ligne à son
+    identifiant dans la base.
+    :param connexion: connexion SQLAlchemy ouverte dans la transaction de l'import
+    :param lignes: itérable de dictionnaires (voir lire_csv)
+    :param cle: fonction retournant la clé naturelle d'une ligne, ou None si la ligne est invalide
+    :param existantes: dictionnaire {clé naturelle: identifiant} des lignes déjà présentes dans la base
+    :param identifiant: premier identifiant libre de la table
+    :param insertion: requête INSERT, avec les paramètres :id et :cle et un paramètre par colonne
+    :param taille_lot: nombre de lignes par executemany
+    :param completer: fonction retournant les valeurs calculées à insérer avec une ligne (dictionnaire), ou None
+    :return: tuple (dictionnaire {identifiant CSV: identifiant dans la base}, compteurs, identifiants ajoutés)
+    """
+    identifiants = {}
+    ajoutes = []
+    compteurs = {"lues": 0, "ajoutees": 0, "ignorees": 0, "rejetees": 0}
+    for lot in par_lots(lignes, taille_lot):
+        a_inserer = []
+        for ligne in lot:
+            compteurs["lues"] += 1
+            cle_ligne = cle(ligne)
+            if cle_ligne is None:
+                compteurs["rejetees"] += 1
+                continue
+            if cle_ligne in existantes:
+                compteurs["ignorees"] += 1
+            else:
+                existantes[cle_ligne] = identifiant
+                a_inserer.append(dict(ligne, id=identifiant, cle=cle_ligne, **(completer(ligne) if completer else {})))
+                ajoutes.append(identifiant)
+                identifiant += 1
+            identifiants[ligne["id"]] = existantes[cle_ligne]
+        if a_inserer:
+            connexion.execute(insertion, a_inserer)
+            compteurs["ajoutees"] += len(a_inserer)
+    return identifiants, compteurs, ajoutes
+
+
+def importer_corpus(connexion, dossier, taille_lot):
+    """
+    Importe les publications, les lettres et leurs liens (sources) depuis les fichiers CSV d'un dossier, puis met à
+    jour l'index de recherche et les statistiques du corpus.
+    :param connexion: connexion SQLAlchemy, hors transaction
+    :param dossier: dossier contenant publication.csv, lettre.csv et source.csv (et, facultatif, lieu.csv)
+    :param taille_lot: nombre de lignes insérées par executemany
+    :return: dictionnaire {table: compteurs (lues, ajoutees, ignorees, rejetees, duree en secondes)}, avec une entrée
+    "index" donnant le nombre de lettres (ré)indexées et la durée de l'indexation
+    """
+    def chemin(table):
+        nom, separateur, colonnes = FICHIERS_CSV[table]
+        return lire_csv(os.path.join(dossier, nom), separateur, colonnes)
+
+    rapport = {}
+    with connexion.begin():
+        connexion.execute("BEGIN IMMEDIATE")
+
+        debut = time.perf_counter()
+        publications = dict(connexion.execute("SELECT publication_cle, publication_id FROM publication").fetchall())
+        publications_csv, rapport["publication"], _ = importer_lignes(
+            connexion, chemin("publication"),
+            lambda ligne: Publication.calculer_cle(ligne["titre"], ligne["volume"]) if ligne["titre"] else None,
+            publications, prochain_identifiant(connexion, "publication", "publication_id"),
+            "INSERT INTO publication (publication_id, publication_titre, publication_volume, publication_cle) "
+            "VALUES (:id, :titre, :volume, :cle)", taille_lot)
+        rapport["publication"]["duree"] = time.perf_counter() - debut
+
+        # Une lettre doit avoir un lieu et une date (colonnes NOT NULL).
+        debut = time.perf_counter()
+        lettres = dict(connexion.execute("SELECT lettre_cle, lettre_id FROM lettre").fetchall())
+        lettres_csv, rapport["lettre"], lettres_ajoutees = importer_lignes(
+            connexion, chemin("lettre"),
+            lambda ligne: Lettre.calculer_cle(ligne["numero"], ligne["redacteur"], ligne["lieu"], ligne["date"])
+            if ligne["lieu"] and ligne["date"] else None,
+            lettres, prochain_identifiant(connexion, "lettre", "lettre_id"),
+            "INSERT INTO lettre (lettre_id, lettre_numero, lettre_redacteur, lettre_lieu, lettre_date, lettre_cle, "
+            "lettre_date_debut, lettre_date_fin) "
+            "VALUES (:id, :numero, :redacteur, :lieu, :date, :cle, :date_debut, :date_fin)", taille_lot,
+            lambda ligne: dict(zip(("date_debut", "date_fin"), intervalle_date(ligne["date"]))))
+        rapport["lettre"]["duree"] = time.perf_counter() - debut
+
+        # Les liens dont la lettre ou la publication est absente des fichiers sont rejetés ; les liens déjà
+        # présents dans la base (cherchés pour tout le lot en une requête) sont ignorés.
+        debut = time.perf_counter()
+        compteurs = {"lues": 0, "ajoutees": 0, "ignorees": 0, "rejetees": 0}
+        lettres_sourcees = set()
+        for lot in par_lots(chemin("source"), taille_lot):
+            liens = set()
+            valides = 0
+            for ligne in lot:
+                compteurs["lues"] += 1
+                lettre_id = lettres_csv.get(ligne["lettre_id"])
+                publication_id = publications_csv.get(ligne["publication_id"])
+                if lettre_id is None or publication_id is None:
+                    compteurs["rejetees"] += 1
+                else:
+                    liens.add((lettre_id, publication_id))
+                    valides += 1
+            existants = set(tuple(lien) for lien in connexion.execute(
+                db.text("SELECT source_lettre_id, source_publication_id FROM source "
+                        "WHERE source_lettre_id IN :ids").bindparams(db.bindparam("ids", expanding=True)),
+                {"ids": sorted({lettre_id for lettre_id, publication_id in liens})})) if liens else set()
+            nouveaux = liens - existants
+            if nouveaux:
+                connexion.execute("INSERT INTO source (source_lettre_id, source_publication_id) "
+                                  "VALUES (:lettre_id, :publication_id)",
+                                  [{"lettre_id": lettre_id, "publication_id": publication_id}
+                                   for lettre_id, publication_id in sorted(nouveaux)])
+                lettres_sourcees.update(lettre_id for lettre_id, publication_id in nouveaux)
+            compteurs["ajoutees"] += len(nouveaux)
+            compteurs["ignorees"] += valides - len(nouveaux)
+        compteurs["duree"] = time.perf_counter() - debut
+        rapport["source"] = compteurs
+
+        # Les lettres ajoutées, et celles qui ont reçu une nouvelle publication, sont (ré)indexées ; les compteurs
+        # du corpus et le nombre de lettres par lieu sont recalculés.
+        debut = time.perf_counter()
+        lettres_a_indexer = set(lettres_ajoutees) | lettres_sourcees
+        recherche.indexer_lettres(connexion, lettres_a_indexer)
+        statistiques.recalculer_statistiques(connexion)
+        lieux.creer_table(connexion)
+        if os.path.exists(os.path.join(dossier, FICHIERS_CSV["lieu"][0])):
+            lieux.enregistrer_coordonnees(connexion, chemin("lieu"))
+        lieux.recalculer_lieux(connexion)
+        statistiques.noter_importation(connexion)
+        rapport["index"] = {"lettres": len(lettres_a_indexer), "duree": time.perf_counter() - debut}
+    return rapport
@@ -0,0 +1,115 @@
+from collections import Counter
+from sqlalchemy import event, inspect
+
+from .. app import db
+from ..modeles.donnees import Lettre
+
+
+# Table des lieux d'envoi des lettres :
+# Chaque lieu (valeur de lettre_lieu) est associé à ses coordonnées, lues dans un fichier CSV (base_de_données/lieu.csv,
+# voir importation.py), et à son nombre de lettres. Ce nombre est mis à jour dans la même transaction que chaque
+# création, suppression ou changement de lieu d'une lettre fait par l'ORM (voir la fonction d'écoute en fin de
+# fichier), ce qui permet de construire la carte des lettres sans parcourir la table lettre.
+class Lieu(db.Model):
+    __tablename__ = "lieu"
+    lieu_nom = db.Column(db.Text, primary_key=True)
+    lieu_latitude = db.Column(db.Float)
+    lieu_longitude = db.Column(db.Float)
+    lieu_lettres = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def carte():
+        """
+        Construit la carte des lettres : un point GeoJSON par lieu localisé, avec son nombre de lettres. Les lieux
+        dont les coordonnées sont inconnues sont listés à part (membre "non_localises").
+        :return: dictionnaire GeoJSON (FeatureCollection)
+        :rtype: dict
+        """
+        points = []
+        non_localises = []
+        for nom, latitude, longitude, lettres in db.session.query(
+                Lieu.lieu_nom, Lieu.lieu_latitude, Lieu.lieu_longitude, Lieu.lieu_lettres)\
+                .filter(Lieu.lieu_lettres > 0).order_by(Lieu.lieu_lettres.desc(), Lieu.lieu_nom):
+            if latitude is None or longitude is None:
+                non_localises.append({"lieu": nom, "lettres": lettres})
+            else:
+                # GeoJSON donne les coordonnées dans l'ordre longitude, latitude.
+                points.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+                               "properties": {"lieu": nom, "lettres": lettres}})
+        return {"type": "FeatureCollection", "features": points, "non_localises": non_localises}
+
+
+def creer_table(connexion):
+    """
+    Crée la table des lieux si elle n'existe pas.
+    :param connexion: connexion SQLAlchemy ouverte dans une transaction
+    """
+    connexion.execute("CREATE TABLE IF NOT EXISTS lieu (lieu_nom TEXT PRIMARY KEY, lieu_latitude REAL, "
+                      "lieu_longitude REAL, lieu_lettres INTEGER NOT NULL DEFAULT 0)")
+
+
+def enregistrer_coordonnees(connexion, lignes):
+    """
+    Enregistre les coordonnées des lieux, en remplaçant celles déjà connues.
+    :param connexion: connexion SQLAlchemy ouverte dans une transaction
+    :param lignes: itérable de dictionnaires {"nom", "latitude", "longitude"} (voir importation.lire_csv)
+    :return: nombre de lieux enregistrés
+    :rtype: int
+    """
+    coordonnees = [{"nom": ligne["nom"], "latitude": float(ligne["latitude"]), "longitude": float(ligne["longitude"])}
+                   for ligne in lignes if ligne["nom"] and ligne["latitude"] and ligne["longitude"]]
+    if coordonnees:
+        connexion.execute(
+            db.text("INSERT INTO lieu (lieu_nom, lieu_latitude, lieu_longitude) VALUES (:nom, :latitude, :longitude) "
+                    "ON CONFLICT (lieu_nom) DO UPDATE SET lieu_latitude = excluded.lieu_latitude, "
+                    "lieu_longitude = excluded.lieu_longitude"), coordonnees)
+    return len(coordonnees)
+
+
+def recalculer_lieux(connexion):
+    """
+    Ajoute les lieux des lettres absents de la table et recalcule le nombre de lettres de chaque lieu à partir du
+    contenu de la table lettre.
+    :param connexion: connexion SQLAlchemy ouverte dans une transaction
+    """
+    connexion.execute("INSERT OR IGNORE INTO lieu (lieu_nom) SELECT DISTINCT lettre_lieu FROM lettre")
+    connexion.execute("UPDATE lieu SET lieu_lettres = (SELECT count(*) FROM lettre WHERE lettre_lieu = lieu_nom)")
+
+
+def modifier_lieux(connexion, variations):
+    """
+    Ajoute une variation (positive ou négative) au nombre de lettres de lieux, en créant les lieux inconnus (sans
+    coordonnées).
+    :param connexion: connexion SQLAlchemy (ou session) ouverte dans la transaction de l'écriture
+    :param variations: dictionnaire {nom du lieu: variation}
+    """
+    variations = [{"nom": nom, "variation": variation} for nom, variation in variations.items() if variation]
+    if variations:
+        connexion.execute(
+            db.text("INSERT INTO lieu (lieu_nom, lieu_lettres) VALUES (:nom, :variation) "
+                    "ON CONFLICT (lieu_nom) DO UPDATE SET lieu_lettres = lieu_lettres + :variation"), variations)
+
+
+# Mise à jour du nombre de lettres par lieu au fil des écritures :
+# Après l'envoi des modifications (flush), les lettres créées comptent pour leur lieu, les lettres supprimées sont
+# retirées du leur, et une lettre dont le lieu a changé passe de l'ancien lieu au nouveau. L'ancien lieu d'une lettre
+# est chargé avant tout changement (active_history, voir la colonne lettre_lieu de donnees.Lettre).
+@event.listens_for(db.session, "after_flush")
+def mettre_a_jour_lieux(session, contexte):
+    variations = Counter()
+    for objet in session.new:
+        if isinstance(objet, Lettre):
+            variations[objet.lettre_lieu] += 1
+    for objet in session.deleted:
+        if isinstance(objet, Lettre):
+            historique = inspect(objet).attrs.lettre_lieu.history
+            variations[historique.deleted[0] if historique.deleted else objet.lettre_lieu] -= 1
+    for objet in session.dirty:
+        if isinstance(objet, Lettre) and objet not in session.deleted:
+            historique = inspect(objet).attrs.lettre_lieu.history
+            if historique.deleted and historique.added:
+                variations[historique.deleted[0]] -= 1
+                variations[historique.added[0]] += 1
+    variations.pop(None, None)
+    if variations:
+        modifier_lieux(session.connection(), variations)
@@ -0,0 +1,109 @@
+from sqlalchemy import event
+
+from .. app import app, db
+from ..cache import cache
+
+
+# Vérification des plans d'exécution des requêtes fréquentes :
+# Les pages d'un objet (lettre, publication, transcription), leur équivalent dans l'API et les pages de l'API par
+# curseur sont demandées à l'application (client de test de Flask). Les requêtes SELECT envoyées à la base pendant
+# chaque demande sont relevées, puis expliquées par SQLite (EXPLAIN QUERY PLAN). Une requête qui parcourt une table
+# entière (SCAN), au lieu d'utiliser un index (SEARCH), est signalée : sa durée augmente avec la taille du corpus.
+# Les collections complètes (/lettres, /publications, export) lisent toutes les lignes par nature et ne sont pas
+# vérifiées.
+
+# Routes vérifiées : l'URL est complétée avec un identifiant existant, choisi par la requête associée (une lettre
+# publiée et transcrite, si possible, pour que toutes les jointures de la page soient exécutées).
+ROUTES_A_VERIFIER = [
+    ("/lettres/{}", "SELECT lettre_id FROM lettre ORDER BY lettre_id IN "
+                    "(SELECT transcription_lettre_id FROM transcription) DESC, lettre_id LIMIT 1"),
+    ("/publications/{}", "SELECT publication_id FROM publication ORDER BY publication_id LIMIT 1"),
+    ("/transcriptions/{}", "SELECT transcription_id FROM transcription ORDER BY transcription_id LIMIT 1"),
+    ("/api/lettres/{}", "SELECT lettre_id FROM lettre ORDER BY lettre_id IN "
+                        "(SELECT transcription_lettre_id FROM transcription) DESC, lettre_id LIMIT 1"),
+    ("/api/publications/{}", "SELECT publication_id FROM publication ORDER BY publication_id LIMIT 1"),
+    ("/api/transcriptions/{}", "SELECT transcription_id FROM transcription ORDER BY transcription_id LIMIT 1"),
+    ("/api/transcriptions/{}/revisions", "SELECT min(revision_transcription_id) FROM revision"),
+    ("/api/transcriptions/{}/revisions/2", "SELECT min(revision_transcription_id) FROM revision "
+                                           "WHERE revision_numero = 2"),
+    ("/api/lettres?page[size]=10&page[after]={}", "SELECT min(lettre_id) FROM lettre"),
+    ("/api/transcriptions?page[size]=10&page[after]={}", "SELECT min(transcription_id) FROM transcription"),
+    ("/api/contributions?page[size]=10&page[after]={}", "SELECT max(contribution_id) FROM contribution"),
+    ("/api/contributions?contributeur={}&page[size]=10", "SELECT min(contribution_ut_id) FROM contribution"),
+    ("/api/contributeurs/{}", "SELECT min(contributeur_ut_id) FROM contributeur"),
+    ("/lettres?date_from={0}-06&date_to={0}-07", "SELECT min(lettre_date_debut) / 10000 FROM lettre"),
+    ("/api/lettres?page[size]=10&date_from={0}-06&date_to={0}-07", "SELECT min(lettre_date_debut) / 10000 FROM lettre"),
+]
+
+
+def plan_requete(connexion, requete, parametres):
+    """
+    Retourne le plan d'exécution d'une requête, tel qu'il est décrit par SQLite.
+    :param connexion: connexion SQLAlchemy
+    :param requete: requête SQL, avec ses paramètres positionnels (?)
+    :param parametres: valeurs des paramètres
+    :return: liste des étapes du plan (ex : "SEARCH lettre USING INTEGER PRIMARY KEY (rowid=?)")
+    :rtype: list
+    """
+    curseur = connexion.connection.cursor()
+    try:
+        return [ligne[3] for ligne in curseur.execute("EXPLAIN QUERY PLAN " + requete, parametres)]
+    finally:
+        curseur.close()
+
+
+def parcours_complets(plan):
+    """
+    Retourne les étapes d'un plan qui parcourent une table entière. Les tables virtuelles (index plein texte), que
+    SQLite note SCAN alors que la recherche passe par leur propre index, et les requêtes sans table (SELECT EXISTS)
+    ne sont pas concernées.
+    """
+    return [etape for etape in plan if etape.startswith("SCAN ") and "VIRTUAL TABLE" not in etape
+            and etape != "SCAN CONSTANT ROW"]
+
+
+def requetes_de_la_route(url):
+    """
+    Demande une URL à l'application et relève les requêtes SELECT envoyées à la base de données. Le cache des
+    réponses est vidé au préalable, pour que la route soit réellement exécutée.
+    :param url: URL à demander
+    :return: tuple (code HTTP de la réponse, liste de tuples (requête, paramètres))
+    """
+    requetes = []
+
+    def relever(connexion, curseur, requete, parametres, contexte, executemany):
+        if requete.lstrip().upper().startswith("SELECT"):
+            requetes.append((requete, parametres))
+
+    cache.vider()
+    event.listen(db.engine, "before_cursor_execute", relever)
+    try:
+        with app.test_client() as client:
+            reponse = client.get(url)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", relever)
+    return reponse.status_code, requetes
+
+
+def verifier_plans(routes=ROUTES_A_VERIFIER):
+    """
+    Vérifie les plans d'exécution des requêtes des routes fréquentes.
+    :param routes: liste de tuples (modèle d'URL, requête SQL retournant l'identifiant à utiliser)
+    :return: liste de dictionnaires, un par requête : url, statut (code HTTP), requete, plan et parcours (étapes
+    parcourant une table entière)
+    :rtype: list
+    """
+    resultats = []
+    for modele, requete_identifiant in routes:
+        with db.engine.connect() as connexion:
+            identifiant = connexion.execute(requete_identifiant).scalar()
+        if identifiant is None:
+            continue
+        url = modele.format(identifiant)
+        statut, requetes = requetes_de_la_route(url)
+        with db.engine.connect() as connexion:
+            for requete, parametres in requetes:
+                plan = plan_requete(connexion, requete, parametres)
+                resultats.append({"url": url, "statut": statut, "requete": requete, "plan": plan,
+                                  "parcours": parcours_complets(plan)})
+    return resultats
@@ -0,0 +1,149 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import event
+
+from .. app import db
+from ..modeles.donnees import Lettre, Publication, Transcription, Source
+
+
+# Index plein texte des lettres (table virtuelle SQLite FTS5) :
+# Chaque ligne de la table lettre_recherche correspond à une lettre (rowid = lettre_id) et rassemble ses métadonnées,
+# les titres des publications dans lesquelles elle est éditée et le texte de ses transcriptions. L'index est mis à jour
+# dans la même transaction que chaque écriture faite par l'ORM (voir les fonctions d'écoute en fin de fichier).
+
+# Marqueurs utilisés par snippet() pour encadrer les termes trouvés : ils sont remplacés par des balises <mark> une
+# fois le texte échappé (voir surligner).
+DEBUT_SURLIGNAGE = "\ue000"
+FIN_SURLIGNAGE = "\ue001"
+
+CREATION_INDEX = """
+CREATE VIRTUAL TABLE IF NOT EXISTS lettre_recherche USING fts5(
+    numero, date, redacteur, lieu, publications, transcriptions,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# Requête (ré)indexant les lettres dont l'identifiant est dans la liste :ids.
+INDEXATION = """
+INSERT INTO lettre_recherche (rowid, numero, date, redacteur, lieu, publications, transcriptions)
+SELECT lettre.lettre_id, lettre.lettre_numero, lettre.lettre_date, lettre.lettre_redacteur, lettre.lettre_lieu,
+       (SELECT group_concat(publication.publication_titre || ' ' || coalesce(publication.publication_volume, ''), ' ')
+        FROM Source JOIN publication ON publication.publication_id = Source.source_publication_id
+        WHERE Source.source_lettre_id = lettre.lettre_id),
+       (SELECT group_concat(decompresser(transcription.transcription_texte), ' ')
+        FROM transcription
+        WHERE transcription.transcription_lettre_id = lettre.lettre_id)
+FROM lettre
+"""
+
+# Nombre maximal d'identifiants envoyés dans une même requête (limite du nombre de variables de SQLite).
+TAILLE_LOT_INDEXATION = 500
+
+
+def creer_index(connexion):
+    """
+    Crée la table d'index plein texte et y indexe toutes les lettres de la base.
+    :param connexion: connexion SQLAlchemy ouverte dans une transaction
+    """
+    connexion.execute(CREATION_INDEX)
+    connexion.execute("DELETE FROM lettre_recherche")
+    connexion.execute(INDEXATION)
+
+
+def indexer_lettres(connexion, lettre_ids):
+    """
+    (Ré)indexe des lettres : leur ancienne entrée est supprimée puis recalculée à partir des tables lettre, Source,
+    publication et transcription. Une lettre qui n'existe plus est simplement retirée de l'index.
+    :param connexion: connexion SQLAlchemy (ou session) ouverte dans la transaction de l'écriture
+    :param lettre_ids: identifiants des lettres à indexer
+    """
+    lettre_ids = sorted(set(lettre_ids))
+    for debut in range(0, len(lettre_ids), TAILLE_LOT_INDEXATION):
+        lot = lettre_ids[debut:debut + TAILLE_LOT_INDEXATION]
+        connexion.execute(
+            db.text("DELETE FROM lettre_recherche WHERE rowid IN :ids").bindparams(
+                db.bindparam("ids", expanding=True)), {"ids": lot})
+        connexion.execute(
+            db.text(INDEXATION + " WHERE lettre.lettre_id IN :ids").bindparams(
+                db.bindparam("ids", expanding=True)), {"ids": lot})
+
+
+def requete_fts(motclef):
+    """
+    Transforme le mot clé saisi par l'utilisateur en requête FTS5 : chaque mot devient un préfixe entre guillemets,
+    ce qui neutralise la syntaxe de FTS5 (opérateurs, parenthèses, etc.) et conserve une recherche sur le début des mots.
+    :param motclef: texte saisi par l'utilisateur
+    :return: requête FTS5, ou None si le mot clé ne contient aucun mot
+    :rtype: str or None
+    """
+    mots = re.findall(r"\w+", motclef)
+    if not mots:
+        return None
+    return " ".join('"{}"*'.format(mot) for mot in mots)
+
+
+def resultats_recherche(motclef):
+    """
+    Construit la sous-requête des lettres correspondant au mot clé, avec leur score de pertinence (bm25, plus le score
+    est faible, plus la lettre est pertinente) et un extrait du texte où les termes trouvés sont marqués.
+    :param motclef: texte saisi par l'utilisateur
+    :return: sous-requête aux colonnes lettre_id, score et extrait, à joindre à Lettre.lettre_id
+    """
+    requete = requete_fts(motclef) or '""'
+    return db.text(
+        "SELECT rowid AS lettre_id, bm25(lettre_recherche) AS score, "
+        "snippet(lettre_recherche, -1, :debut, :fin, '…', 16) AS extrait "
+        "FROM lettre_recherche WHERE lettre_recherche MATCH :requete"
+    ).bindparams(requete=requete, debut=DEBUT_SURLIGNAGE, fin=FIN_SURLIGNAGE).columns(
+        lettre_id=db.Integer, score=db.Float, extrait=db.Text
+    ).alias("resultats_recherche")
+
+
+def surligner(extrait):
+    """
+    Échappe un extrait renvoyé par snippet() et remplace les marqueurs par des balises <mark>.
+    :param extrait: extrait brut
+    :return: extrait HTML
+    :rtype: Markup
+    """
+    if not extrait:
+        return Markup("")
+    html = str(escape(extrait))
+    return Markup(html.replace(DEBUT_SURLIGNAGE, "<mark>").replace(FIN_SURLIGNAGE, "</mark>"))
+
+
+# Mise à jour de l'index au fil des écritures :
+# Avant l'envoi des modifications (flush), on note les lettres liées aux publications supprimées, puisque leurs liens
+# dans la table Source auront disparu après l'envoi. Après l'envoi, les lettres concernées par les objets créés,
+# modifiés ou supprimés sont réindexées avec la connexion de la session, donc dans la même transaction.
+@event.listens_for(db.session, "before_flush")
+def noter_publications_supprimees(session, contexte, instances):
+    publication_ids = [objet.publication_id for objet in session.deleted if isinstance(objet, Publication)]
+    if publication_ids:
+        lettre_ids = session.query(Source.c.source_lettre_id).filter(
+            Source.c.source_publication_id.in_(publication_ids)).all()
+        session.info.setdefault("lettres_a_indexer", set()).update(lettre_id for lettre_id, in lettre_ids)
+
+
+@event.listens_for(db.session, "after_flush")
+def mettre_a_jour_index(session, contexte):
+    lettre_ids = session.info.pop("lettres_a_indexer", set())
+    publication_ids = []
+
+    for objet in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(objet, Lettre):
+            lettre_ids.add(objet.lettre_id)
+        elif isinstance(objet, Transcription):
+            lettre_ids.add(objet.transcription_lettre_id)
+        elif isinstance(objet, Publication) and objet not in session.deleted:
+            publication_ids.append(objet.publication_id)
+
+    # Les lettres éditées dans une publication modifiée sont réindexées (titre et volume).
+    if publication_ids:
+        lettres_publiees = session.query(Source.c.source_lettre_id).filter(
+            Source.c.source_publication_id.in_(publication_ids)).all()
+        lettre_ids.update(lettre_id for lettre_id, in lettres_publiees)
+
+    lettre_ids.discard(None)
+    if lettre_ids:
+        indexer_lettres(session.connection(), lettre_ids)
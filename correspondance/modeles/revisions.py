@@ -0,0 +1,194 @@
+import datetime
+import difflib
+import json
+import re
+from flask import url_for
+from sqlalchemy import event, inspect
+
+from .. app import db
+from ..constantes import REVISIONS_INTERVALLE_COMPLET
+from ..modeles.donnees import Transcription, Contribution, TexteCompresse
+
+
+# Historique des révisions des transcriptions :
+# Chaque texte enregistré pour une transcription (création, puis chaque modification) devient une révision, numérotée
+# à partir de 1. Une révision est enregistrée soit en entier (révision complète), soit sous la forme d'un delta par
+# rapport à la dernière révision complète : la liste des passages repris de celle-ci et des passages nouveaux (voir
+# calculer_delta). Une révision complète est enregistrée toutes les REVISIONS_INTERVALLE_COMPLET révisions, ou dès que
+# le delta n'est plus nettement plus court que le texte : une version se reconstruit donc en lisant au plus deux
+# révisions (la révision demandée et sa révision complète), quel que soit le nombre de modifications.
+# Les révisions sont enregistrées dans la même transaction que chaque écriture faite par l'ORM (voir les fonctions
+# d'écoute en fin de fichier). Le texte d'une transcription antérieure à l'historique devient sa révision 1 lors de sa
+# première modification.
+class Revision(db.Model):
+    __tablename__ = "revision"
+    __table_args__ = (db.Index("ix_revision_revision_transcription_id", "revision_transcription_id", "revision_numero",
+                               unique=True),)
+    revision_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    revision_transcription_id = db.Column(db.Integer, db.ForeignKey('transcription.transcription_id'), nullable=False)
+    revision_numero = db.Column(db.Integer, nullable=False)
+    # Numéro de la révision complète dont la révision est un delta (None pour une révision complète).
+    revision_base = db.Column(db.Integer)
+    # Texte (révision complète) ou delta (JSON), enregistré compressé et lu à la demande.
+    revision_contenu = db.deferred(db.Column(TexteCompresse, nullable=False))
+    # Longueur du texte de la révision (en caractères).
+    revision_taille = db.Column(db.Integer, nullable=False)
+    revision_date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    revision_contribution_id = db.Column(db.Integer, db.ForeignKey('contribution.contribution_id'), index=True)
+    transcription = db.relationship("Transcription", backref=db.backref("revisions", cascade="all, delete-orphan",
+                                                                        lazy="dynamic"))
+    contribution = db.relationship("Contribution")
+
+    @staticmethod
+    def version(transcription_id, numero):
+        """
+        Reconstruit le texte d'une révision d'une transcription.
+        :param transcription_id: identifiant de la transcription
+        :param numero: numéro de la révision
+        :return: tuple (révision, texte), ou None si la révision n'existe pas
+        :rtype: tuple
+        """
+        revision = Revision.query.options(db.undefer(Revision.revision_contenu)).filter(
+            Revision.revision_transcription_id == transcription_id, Revision.revision_numero == numero).first()
+        if revision is None:
+            return None
+        if revision.revision_base is None:
+            return revision, revision.revision_contenu
+        base = db.session.query(Revision.revision_contenu).filter(
+            Revision.revision_transcription_id == transcription_id,
+            Revision.revision_numero == revision.revision_base).scalar()
+        return revision, appliquer_delta(base, json.loads(revision.revision_contenu))
+
+    def to_jsonapi_dict(self, texte=None):
+        """
+        Permet de récupérer les données d'une révision en JSON
+        :param texte: texte de la révision (voir Revision.version), ou None pour ne pas l'inclure
+        """
+        attributs = {
+            "Numero": self.revision_numero,
+            "Date": self.revision_date,
+            "Complete": self.revision_base is None,
+            "Taille": self.revision_taille,
+        }
+        if texte is not None:
+            attributs["Texte"] = texte
+        return {
+            "type": "Revision",
+            "id": self.revision_numero,
+            "attributes": attributs,
+            "links": {
+                "self": url_for("api_revision_transcription", transcription_id=self.revision_transcription_id,
+                                numero=self.revision_numero, _external=True)
+            },
+            "relationships": {
+                "editions": [self.contribution.author_to_json()] if self.contribution and
+                self.contribution.utilisateur else []
+            }
+        }
+
+
+def decouper(texte):
+    """
+    Découpe un texte en mots et en espaces : la concaténation des morceaux redonne le texte.
+    :rtype: list
+    """
+    return re.findall(r"\s+|\S+", texte)
+
+
+def calculer_delta(base, texte):
+    """
+    Calcule le delta d'un texte par rapport à un texte de base, mot à mot.
+    :param base: texte de base
+    :param texte: nouveau texte
+    :return: liste d'opérations : [début, fin] reprend les morceaux début à fin (exclue) de la base (voir decouper),
+    une chaîne est un passage nouveau
+    :rtype: list
+    """
+    morceaux_base = decouper(base)
+    morceaux = decouper(texte)
+    delta = []
+    # Les morceaux très fréquents (espaces, mots courants) ne servent pas de point de départ à la comparaison
+    # (autojunk) : le calcul reste rapide sur un long texte, et ils sont repris avec les passages identiques qui les
+    # entourent.
+    for operation, debut_base, fin_base, debut, fin in difflib.SequenceMatcher(
+            None, morceaux_base, morceaux).get_opcodes():
+        if operation == "equal":
+            delta.append([debut_base, fin_base])
+        elif operation in ("replace", "insert"):
+            delta.append("".join(morceaux[debut:fin]))
+    return delta
+
+
+def appliquer_delta(base, delta):
+    """
+    Reconstruit un texte à partir du texte de base et du delta renvoyé par calculer_delta.
+    :rtype: str
+    """
+    morceaux_base = decouper(base)
+    return "".join(operation if isinstance(operation, str) else "".join(morceaux_base[operation[0]:operation[1]])
+                   for operation in delta)
+
+
+def etat_revisions(session, transcription):
+    """
+    Retourne le numéro de la dernière révision d'une transcription et sa dernière révision complète.
+    :return: tuple (numéro ou None, tuple (numéro, texte) ou None)
+    """
+    if transcription.transcription_id is None:
+        return None, None
+    precedente = session.query(db.func.max(Revision.revision_numero)).filter(
+        Revision.revision_transcription_id == transcription.transcription_id).scalar()
+    complete = session.query(Revision.revision_numero, Revision.revision_contenu).filter(
+        Revision.revision_transcription_id == transcription.transcription_id,
+        Revision.revision_base.is_(None)).order_by(Revision.revision_numero.desc()).first()
+    return precedente, tuple(complete) if complete else None
+
+
+def ajouter_revision(session, transcription, texte, contribution=None, date=None, etat=None):
+    """
+    Ajoute à la session la révision suivante d'une transcription : complète, ou delta par rapport à la dernière
+    révision complète.
+    :param session: session SQLAlchemy
+    :param transcription: transcription modifiée
+    :param texte: texte de la révision
+    :param contribution: contribution enregistrant la modification (éventuellement pas encore envoyée), ou None
+    :param date: date de la révision (par défaut : maintenant)
+    :param etat: état des révisions précédentes (voir etat_revisions), s'il n'est pas encore enregistré dans la base
+    :return: la révision
+    """
+    precedente, complete = etat or etat_revisions(session, transcription)
+    numero = (precedente or 0) + 1
+    revision = Revision(transcription=transcription, revision_numero=numero, revision_taille=len(texte),
+                        contribution=contribution, revision_date=date or datetime.datetime.utcnow(),
+                        revision_contenu=texte)
+    if complete is not None and numero - complete[0] < REVISIONS_INTERVALLE_COMPLET:
+        delta = json.dumps(calculer_delta(complete[1], texte), ensure_ascii=False, separators=(",", ":"))
+        if len(delta) < len(texte) / 2:
+            revision.revision_base, revision.revision_contenu = complete[0], delta
+    session.add(revision)
+    return revision
+
+
+# Enregistrement des révisions au fil des écritures :
+# Avant l'envoi des modifications (flush), chaque transcription créée ou dont le texte a changé reçoit une révision,
+# reliée à la contribution qui enregistre la modification. L'ancien texte est chargé avant tout changement (voir
+# donnees.charger_ancienne_valeur), pour devenir la révision 1 d'une transcription qui n'avait pas encore d'historique.
+@event.listens_for(db.session, "before_flush")
+def noter_revisions(session, contexte, instances):
+    with session.no_autoflush:
+        for objet in list(session.new) + list(session.dirty):
+            if not isinstance(objet, Transcription) or objet in session.deleted:
+                continue
+            historique = inspect(objet).attrs.transcription_texte.history
+            if not historique.added or historique.added[0] is None or historique.added == historique.deleted:
+                continue
+            contribution = next((nouvelle for nouvelle in session.new if isinstance(nouvelle, Contribution)
+                                 and nouvelle.transcription is objet), None)
+            etat = etat_revisions(session, objet)
+            if etat[0] is None and historique.deleted and historique.deleted[0] is not None:
+                # Le texte d'avant l'historique est daté de la dernière contribution sur la transcription.
+                ajouter_revision(session, objet, historique.deleted[0], etat=etat, date=session.query(
+                    db.func.max(Contribution.contribution_date)).filter(
+                    Contribution.contribution_transcription_id == objet.transcription_id).scalar())
+                etat = (1, (1, historique.deleted[0]))
+            ajouter_revision(session, objet, historique.added[0], contribution, etat=etat)
@@ -0,0 +1,225 @@
+from .. app import db
+from ..constantes import LIEUX_COORDONNEES
+from ..modeles import recherche, statistiques, lieux, revisions, contributeurs
+from ..modeles.importation import lire_csv, FICHIERS_CSV
+from ..modeles.donnees import Lettre, Publication, intervalle_date, compresser_texte, decompresser_texte, apercu_texte
+
+
+# Mises à jour du schéma de la base de données :
+# La version du schéma est enregistrée dans la base elle-même (PRAGMA user_version). Chaque fonction de la liste
+# MIGRATIONS fait passer la base de la version n à la version n+1 ; les nouvelles migrations sont ajoutées à la fin
+# de la liste, sans jamais modifier les précédentes.
+
+def migration_index_recherche(connexion):
+    """
+    Version 1 : index plein texte des lettres (FTS5).
+    """
+    recherche.creer_index(connexion)
+
+
+def migration_statistiques(connexion):
+    """
+    Version 2 : table des compteurs du corpus.
+    """
+    statistiques.recalculer_statistiques(connexion)
+
+
+def migration_index_contribution_date(connexion):
+    """
+    Version 3 : index sur la date des contributions, utilisé pour calculer la date de dernière modification du corpus
+    (en-têtes ETag et Last-Modified).
+    """
+    connexion.execute("CREATE INDEX IF NOT EXISTS ix_contribution_contribution_date ON contribution (contribution_date)")
+
+
+def ajouter_cles_naturelles(connexion, table, colonne_id, colonne_cle, colonnes, calculer_cle):
+    """
+    Ajoute une colonne de clé naturelle à une table, la remplit pour les lignes existantes et la rend unique. Si la
+    table contient déjà des doublons, seule la première ligne (plus petit identifiant) reçoit la clé : les suivantes
+    gardent une clé vide (NULL), autorisée par l'index unique, et restent à fusionner à la main : leur clé n'est pas
+    recalculée lors de leurs modifications (voir donnees.py, cle_naturelle_vide).
+    """
+    connexion.execute("ALTER TABLE {} ADD COLUMN {} TEXT".format(table, colonne_cle))
+    cles = {}
+    for ligne in connexion.execute("SELECT {}, {} FROM {} ORDER BY {}".format(
+            colonne_id, ", ".join(colonnes), table, colonne_id)):
+        cles.setdefault(calculer_cle(*ligne[1:]), ligne[0])
+    if cles:
+        connexion.execute(db.text("UPDATE {} SET {} = :cle WHERE {} = :id".format(table, colonne_cle, colonne_id)),
+                          [{"cle": cle, "id": identifiant} for cle, identifiant in cles.items()])
+    connexion.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_{0}_{1} ON {0} ({1})".format(table, colonne_cle))
+
+
+def migration_cles_naturelles(connexion):
+    """
+    Version 4 : clés naturelles des lettres et des publications, avec un index unique, pour rechercher les doublons
+    sans parcourir les tables et empêcher leur enregistrement simultané.
+    """
+    ajouter_cles_naturelles(connexion, "lettre", "lettre_id", "lettre_cle",
+                            ("lettre_numero", "lettre_redacteur", "lettre_lieu", "lettre_date"), Lettre.calculer_cle)
+    ajouter_cles_naturelles(connexion, "publication", "publication_id", "publication_cle",
+                            ("publication_titre", "publication_volume"), Publication.calculer_cle)
+
+
+# Index secondaires déclarés dans les modèles (index=True) : clés étrangères et colonnes de tri et de filtre.
+INDEX_SECONDAIRES = [
+    "CREATE INDEX IF NOT EXISTS ix_transcription_transcription_lettre_id ON transcription (transcription_lettre_id)",
+    "CREATE INDEX IF NOT EXISTS ix_contribution_contribution_lettre_id ON contribution (contribution_lettre_id)",
+    "CREATE INDEX IF NOT EXISTS ix_contribution_contribution_publication_id "
+    "ON contribution (contribution_publication_id)",
+    "CREATE INDEX IF NOT EXISTS ix_contribution_contribution_transcription_id "
+    "ON contribution (contribution_transcription_id)",
+    "CREATE INDEX IF NOT EXISTS ix_contribution_contribution_ut_id ON contribution (contribution_ut_id)",
+    "CREATE INDEX IF NOT EXISTS ix_source_source_publication_id ON source (source_publication_id, source_lettre_id)",
+    "CREATE INDEX IF NOT EXISTS ix_lettre_lettre_date ON lettre (lettre_date)",
+    "CREATE INDEX IF NOT EXISTS ix_lettre_lettre_redacteur ON lettre (lettre_redacteur)",
+    "CREATE INDEX IF NOT EXISTS ix_lettre_lettre_lieu ON lettre (lettre_lieu)",
+]
+
+
+def migration_index_secondaires(connexion):
+    """
+    Version 5 : index des clés étrangères (transcriptions d'une lettre, contributions d'un objet, lettres d'une
+    publication) et des colonnes de tri des lettres.
+    """
+    for creation in INDEX_SECONDAIRES:
+        connexion.execute(creation)
+
+
+def migration_intervalles_dates(connexion):
+    """
+    Version 6 : premier et dernier jour possibles de la date d'envoi des lettres (voir intervalle_date), avec un
+    index, pour rechercher les lettres d'une période.
+    """
+    connexion.execute("ALTER TABLE lettre ADD COLUMN lettre_date_debut INTEGER")
+    connexion.execute("ALTER TABLE lettre ADD COLUMN lettre_date_fin INTEGER")
+    intervalles = []
+    for lettre_id, lettre_date in connexion.execute("SELECT lettre_id, lettre_date FROM lettre"):
+        debut, fin = intervalle_date(lettre_date)
+        if debut is not None:
+            intervalles.append({"debut": debut, "fin": fin, "id": lettre_id})
+    if intervalles:
+        connexion.execute(db.text("UPDATE lettre SET lettre_date_debut = :debut, lettre_date_fin = :fin "
+                                  "WHERE lettre_id = :id"), intervalles)
+    connexion.execute("CREATE INDEX IF NOT EXISTS ix_lettre_lettre_date_debut "
+                      "ON lettre (lettre_date_debut, lettre_date_fin)")
+
+
+def migration_lieux(connexion):
+    """
+    Version 7 : table des lieux d'envoi, avec leurs coordonnées (fichier LIEUX_COORDONNEES) et leur nombre de lettres,
+    pour construire la carte des lettres.
+    """
+    lieux.creer_table(connexion)
+    nom, separateur, colonnes = FICHIERS_CSV["lieu"]
+    lieux.enregistrer_coordonnees(connexion, lire_csv(LIEUX_COORDONNEES, separateur, colonnes))
+    lieux.recalculer_lieux(connexion)
+
+
+def migration_compression_transcriptions(connexion):
+    """
+    Version 8 : texte des transcriptions enregistré compressé (voir donnees.TexteCompresse). La place libérée n'est
+    rendue au système qu'après la commande compacter-base (VACUUM).
+    """
+    lignes = connexion.execute("SELECT transcription_id, transcription_texte FROM transcription "
+                               "WHERE typeof(transcription_texte) = 'text'").fetchall()
+    if lignes:
+        connexion.execute(db.text("UPDATE transcription SET transcription_texte = :texte WHERE transcription_id = :id"),
+                          [{"texte": compresser_texte(texte), "id": transcription_id}
+                           for transcription_id, texte in lignes])
+
+
+def migration_apercu_transcriptions(connexion):
+    """
+    Version 9 : extrait et nombre de mots des transcriptions (voir donnees.apercu_texte), pour afficher les listes
+    sans lire le texte complet.
+    """
+    connexion.execute("ALTER TABLE transcription ADD COLUMN transcription_extrait TEXT")
+    connexion.execute("ALTER TABLE transcription ADD COLUMN transcription_mots INTEGER")
+    apercus = []
+    for transcription_id, texte in connexion.execute("SELECT transcription_id, transcription_texte FROM transcription"):
+        extrait, mots = apercu_texte(decompresser_texte(texte))
+        apercus.append({"extrait": extrait, "mots": mots, "id": transcription_id})
+    if apercus:
+        connexion.execute(db.text("UPDATE transcription SET transcription_extrait = :extrait, transcription_mots = :mots "
+                                  "WHERE transcription_id = :id"), apercus)
+
+
+def migration_revisions(connexion):
+    """
+    Version 10 : table des révisions des transcriptions (voir revisions.py). Le texte actuel d'une transcription devient
+    sa première révision lors de sa prochaine modification.
+    """
+    revisions.Revision.__table__.create(connexion, checkfirst=True)
+
+
+def migration_contributeurs(connexion):
+    """
+    Version 11 : index des contributions par utilisateur et par date, qui remplace l'index par utilisateur seul, pour
+    paginer l'historique d'un contributeur ; table des compteurs des contributeurs (voir contributeurs.py).
+    """
+    connexion.execute("CREATE INDEX IF NOT EXISTS ix_contribution_contribution_ut_id_date "
+                      "ON contribution (contribution_ut_id, contribution_date)")
+    connexion.execute("DROP INDEX IF EXISTS ix_contribution_contribution_ut_id")
+    contributeurs.recalculer_contributeurs(connexion)
+
+
+MIGRATIONS = [
+    migration_index_recherche,
+    migration_statistiques,
+    migration_index_contribution_date,
+    migration_cles_naturelles,
+    migration_index_secondaires,
+    migration_intervalles_dates,
+    migration_lieux,
+    migration_compression_transcriptions,
+    migration_apercu_transcriptions,
+    migration_revisions,
+    migration_contributeurs,
+]
+
+
+def version_schema(connexion):
+    """
+    Retourne la version du schéma de la base de données
+    :param connexion: connexion SQLAlchemy
+    :rtype: int
+    """
+    return connexion.execute("PRAGMA user_version").scalar()
+
+
+def mettre_a_jour_schema():
+    """
+    Applique, dans l'ordre, les migrations qui n'ont pas encore été appliquées à la base de données. Les migrations
+    sont appliquées dans une seule transaction, qui verrouille la base en écriture dès son début (BEGIN IMMEDIATE) :
+    si l'une d'elles échoue, aucune n'est enregistrée (y compris les ALTER TABLE, que le module sqlite3 n'inclut pas
+    de lui-même dans une transaction), et deux processus qui mettent la base à jour en même temps appliquent les
+    migrations l'un après l'autre, le second relisant la version une fois le verrou obtenu.
+    :return: liste des numéros de version appliqués
+    :rtype: list
+    """
+    versions_appliquees = []
+    with db.engine.connect() as connexion:
+        # Base déjà à jour : aucun verrou n'est pris.
+        if version_schema(connexion) >= len(MIGRATIONS):
+            return versions_appliquees
+        with connexion.begin():
+            connexion.execute("BEGIN IMMEDIATE")
+            version = version_schema(connexion)
+            for numero, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                migration(connexion)
+                connexion.execute("PRAGMA user_version = {}".format(numero))
+                versions_appliquees.append(numero)
+    return versions_appliquees
+
+
+def index_manquants(connexion):
+    """
+    Compare les index déclarés dans les modèles à ceux de la base de données.
+    :param connexion: connexion SQLAlchemy
+    :return: liste triée des noms des index déclarés mais absents de la base
+    :rtype: list
+    """
+    existants = {nom.lower() for nom, in connexion.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    return sorted(index.name for table in db.metadata.tables.values() for index in table.indexes
+                  if index.name.lower() not in existants)
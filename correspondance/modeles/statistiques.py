@@ -0,0 +1,145 @@
+import time
+from collections import Counter
+from sqlalchemy import event
+
+from .. app import db
+from ..modeles.donnees import Lettre, Publication, Transcription, Contribution
+
+
+# Table des statistiques du corpus :
+# Chaque ligne est un compteur (nombre de lettres, de transcriptions, etc.). Les compteurs sont mis à jour dans la même
+# transaction que chaque création ou suppression faite par l'ORM (voir la fonction d'écoute en fin de fichier), ce qui
+# permet d'afficher les chiffres du corpus sans parcourir les tables.
+class Statistique(db.Model):
+    __tablename__ = "statistique"
+    statistique_nom = db.Column(db.Text, primary_key=True)
+    statistique_valeur = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def valeurs():
+        """
+        Retourne la valeur de tous les compteurs
+        :return: dictionnaire {nom du compteur: valeur}
+        :rtype: dict
+        """
+        compteurs = dict.fromkeys(CALCUL_COMPTEURS, 0)
+        compteurs.update(db.session.query(Statistique.statistique_nom, Statistique.statistique_valeur).all())
+        return compteurs
+
+
+
+def version_donnees():
+    """
+    Retourne la version des données, commune à tous les processus du serveur puisqu'elle est lue dans la base :
+    l'identifiant de la dernière contribution (toute écriture faite par l'application en enregistre une, et les
+    contributions ne sont jamais supprimées), augmenté du nombre d'imports faits hors de l'application. Elle augmente
+    à chaque écriture, et elle est lue dans les index, sans parcourir la table contribution.
+    :rtype: int
+    """
+    dernier_identifiant = db.session.query(db.func.max(Contribution.contribution_id)).as_scalar()
+    importations = db.session.query(Statistique.statistique_valeur).filter(
+        Statistique.statistique_nom == "importations").as_scalar()
+    return db.session.query(db.func.coalesce(dernier_identifiant, 0) + db.func.coalesce(importations, 0)).scalar()
+
+# Requêtes de calcul complet de chaque compteur, utilisées pour initialiser la table ou la recalculer après un import.
+CALCUL_COMPTEURS = {
+    "lettres": "SELECT count(*) FROM lettre",
+    "transcriptions": "SELECT count(*) FROM transcription",
+    "publications": "SELECT count(*) FROM publication",
+    "contributions": "SELECT count(*) FROM contribution",
+    "contributeurs": "SELECT count(DISTINCT contribution_ut_id) FROM contribution",
+}
+
+# Compteur modifié par la création ou la suppression d'un objet de chaque classe.
+COMPTEURS_PAR_CLASSE = {
+    Lettre: "lettres",
+    Transcription: "transcriptions",
+    Publication: "publications",
+    Contribution: "contributions",
+}
+
+
+def recalculer_statistiques(connexion):
+    """
+    Recalcule tous les compteurs à partir du contenu des tables.
+    :param connexion: connexion SQLAlchemy ouverte dans une transaction
+    """
+    connexion.execute("CREATE TABLE IF NOT EXISTS statistique ("
+                      "statistique_nom TEXT PRIMARY KEY, statistique_valeur INTEGER NOT NULL DEFAULT 0)")
+    for nom, calcul in CALCUL_COMPTEURS.items():
+        connexion.execute(
+            db.text("INSERT OR REPLACE INTO statistique (statistique_nom, statistique_valeur) "
+                    "VALUES (:nom, ({}))".format(calcul)), {"nom": nom})
+
+
+def modifier_compteurs(connexion, variations):
+    """
+    Ajoute une variation (positive ou négative) à des compteurs.
+    :param connexion: connexion SQLAlchemy (ou session) ouverte dans la transaction de l'écriture
+    :param variations: dictionnaire {nom du compteur: variation}
+    """
+    for nom, variation in variations.items():
+        if variation:
+            connexion.execute(
+                db.text("UPDATE statistique SET statistique_valeur = statistique_valeur + :variation "
+                        "WHERE statistique_nom = :nom"), {"nom": nom, "variation": variation})
+
+
+def noter_importation(connexion):
+    """
+    Incrémente le compteur des imports faits hors de l'application (ex : commande import-corpus). Ce compteur entre
+    dans le calcul des ETag (voir routes/validation.py) : un import, qui n'enregistre pas de contribution, modifie
+    tout de même les ETag des pages.
+    :param connexion: connexion SQLAlchemy ouverte dans la transaction de l'import
+    """
+    connexion.execute("INSERT INTO statistique (statistique_nom, statistique_valeur) VALUES ('importations', 1) "
+                      "ON CONFLICT (statistique_nom) DO UPDATE SET statistique_valeur = statistique_valeur + 1")
+    noter_modification_globale(connexion)
+
+
+def noter_modification_globale(connexion):
+    """
+    Enregistre la date (en secondes depuis le 1er janvier 1970, UTC) de la dernière écriture qui modifie des pages
+    sans laisser de contribution datée sur elles : une suppression (les contributions de l'objet supprimé en sont
+    détachées) ou un import. Cette date entre dans le calcul de l'en-tête Last-Modified (voir routes/validation.py).
+    :param connexion: connexion SQLAlchemy (ou session) ouverte dans la transaction de l'écriture
+    """
+    connexion.execute(
+        db.text("INSERT INTO statistique (statistique_nom, statistique_valeur) "
+                "VALUES ('derniere_modification_globale', :date) ON CONFLICT (statistique_nom) "
+                "DO UPDATE SET statistique_valeur = max(statistique_valeur, excluded.statistique_valeur)"),
+        {"date": int(time.time())})
+
+
+# Mise à jour des compteurs au fil des écritures :
+# Après l'envoi des modifications (flush), les objets créés et supprimés sont comptés par classe. Un utilisateur devient
+# contributeur à sa première contribution : on compare son nombre de contributions avant et après l'envoi. Une
+# suppression enregistre aussi sa date (voir noter_modification_globale).
+@event.listens_for(db.session, "after_flush")
+def mettre_a_jour_compteurs(session, contexte):
+    variations = Counter()
+    contributions_par_utilisateur = Counter()
+
+    for objets, sens in ((session.new, 1), (session.deleted, -1)):
+        for objet in objets:
+            nom = COMPTEURS_PAR_CLASSE.get(type(objet))
+            if nom:
+                variations[nom] += sens
+            if isinstance(objet, Contribution) and objet.contribution_ut_id is not None:
+                contributions_par_utilisateur[objet.contribution_ut_id] += sens
+
+    for ut_id, variation in contributions_par_utilisateur.items():
+        if not variation:
+            continue
+        apres = session.query(db.func.count(Contribution.contribution_id)).filter(
+            Contribution.contribution_ut_id == ut_id).scalar()
+        avant = apres - variation
+        if avant == 0 and apres > 0:
+            variations["contributeurs"] += 1
+        elif avant > 0 and apres == 0:
+            variations["contributeurs"] -= 1
+
+    if variations:
+        modifier_compteurs(session.connection(), variations)
+    if session.deleted:
+        noter_modification_globale(session.connection())
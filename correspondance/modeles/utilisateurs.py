@@ -1,7 +1,7 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 
 from .. app import db, login
+from ..hachage import hacheur, HachageOccupe
 
 
 # Table des utilisateurs :
@@ -21,12 +21,24 @@ class Utilisateur(UserMixin, db.Model):
         :param motdepasse: Mot de passe de l'utilisateur
         :returns: Si réussite, données de l'utilisateur. Sinon None
         :rtype: User or None
+        :raises HachageOccupe: si trop de mots de passe sont déjà en cours de vérification (voir hachage.py)
         """
         # Vérification que le login et le mot de passe correspondent à un utilisateur enregistré dans la BD :
         utilisateur = Utilisateur.query.filter(Utilisateur.ut_login == login).first()
-        if utilisateur and check_password_hash(utilisateur.ut_mdp, motdepasse):
-            return utilisateur
-        return None
+        if not utilisateur or not motdepasse or not hacheur.verifier(utilisateur.ut_mdp, motdepasse):
+            return None
+        # Si l'empreinte du mot de passe a été calculée avec d'anciens paramètres (méthode, coût, sel), elle est
+        # recalculée avec ceux de la configuration, le mot de passe étant connu à ce moment seulement. En cas d'échec,
+        # l'utilisateur est tout de même connecté et l'empreinte sera recalculée à la connexion suivante.
+        if hacheur.a_recalculer(utilisateur.ut_mdp):
+            try:
+                utilisateur.ut_mdp = hacheur.hacher(motdepasse)
+                db.session.commit()
+            except HachageOccupe:
+                pass
+            except Exception:
+                db.session.rollback()
+        return utilisateur
 
     @staticmethod
     def nouvel_utilisateur(login, email, nom, motdepasse):
@@ -71,12 +83,19 @@ class Utilisateur(UserMixin, db.Model):
             # Renvoi False et la liste erreurs.
             return False, erreurs
 
-        # Si il n'y a pas d'erreur, création d'un nouvel utilisateur :
+        # Si il n'y a pas d'erreur, calcul de l'empreinte du mot de passe (refusé si trop de mots de passe sont déjà
+        # en cours de hachage, voir hachage.py) :
+        try:
+            empreinte = hacheur.hacher(motdepasse)
+        except HachageOccupe:
+            return False, ["Trop d'inscriptions sont en cours, veuillez réessayer dans quelques instants"]
+
+        # Création d'un nouvel utilisateur :
         utilisateur = Utilisateur(
             ut_nom=nom,
             ut_login=login,
             ut_mail=email,
-            ut_mdp=generate_password_hash(motdepasse)
+            ut_mdp=empreinte
         )
 
         try:
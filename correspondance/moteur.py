@@ -0,0 +1,92 @@
+# Profil du moteur de base de données SQLite :
+# Chaque connexion ouverte par l'application reçoit les instructions PRAGMA de la configuration SQLITE_PRAGMAS (voir
+# constantes.py), ex : journal en mode WAL, pour que les lectures ne soient pas bloquées par une écriture, et délai
+# d'attente du verrou (busy_timeout), pour que les écritures simultanées attendent leur tour au lieu d'échouer avec
+# l'erreur "database is locked". Les connexions sont gardées ouvertes d'une requête à l'autre (pool), ce qui conserve
+# leur cache de pages, au lieu d'être rouvertes à chaque requête.
+# Les fonctions Python déclarées avec fonction_sqlite (ex : décompression du texte des transcriptions) sont ajoutées à
+# chaque connexion, pour être utilisées dans les requêtes SQL.
+# Une connexion SQLite ne doit pas être partagée entre deux processus : avant la création d'un processus (fork, ex : les
+# processus de travail d'un serveur qui a préchargé l'application), les connexions ouvertes sont fermées, et chaque
+# processus ouvre les siennes.
+import os
+import threading
+import weakref
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+
+def appliquer_pragmas(connexion, pragmas):
+    """
+    Exécute les instructions PRAGMA sur une connexion SQLite qui vient d'être ouverte.
+    :param connexion: connexion sqlite3
+    :param pragmas: dictionnaire {nom: valeur}, ex : {"journal_mode": "wal"}
+    """
+    curseur = connexion.cursor()
+    try:
+        for nom, valeur in pragmas.items():
+            curseur.execute("PRAGMA {} = {}".format(nom, valeur))
+    finally:
+        curseur.close()
+
+
+class SQLAlchemySQLite(SQLAlchemy):
+    """
+    Extension Flask-SQLAlchemy appliquant le profil SQLite de l'application : pool de connexions partagées entre les
+    fils d'exécution (taille donnée par SQLALCHEMY_POOL_SIZE et SQLALCHEMY_MAX_OVERFLOW) et instructions PRAGMA
+    (SQLITE_PRAGMAS) exécutées à l'ouverture de chaque connexion. Sans pool configuré, le comportement de
+    Flask-SQLAlchemy (une nouvelle connexion à chaque requête) est conservé.
+    """
+    def __init__(self, *args, **kwargs):
+        self.moteurs_configures = weakref.WeakSet()
+        self.fonctions_sqlite = {}
+        self.verrou_moteurs = threading.Lock()
+        super().__init__(*args, **kwargs)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=self.fermer_connexions)
+
+    def apply_driver_hacks(self, app, info, options):
+        super().apply_driver_hacks(app, info, options)
+        # Flask-SQLAlchemy ne choisit un pool que pour les bases en mémoire (StaticPool) ou sans taille de pool
+        # (NullPool) : avec une taille de pool, les connexions sont gardées dans une file (QueuePool) et peuvent être
+        # utilisées successivement par plusieurs fils d'exécution.
+        if info.drivername == "sqlite" and "poolclass" not in options:
+            options["poolclass"] = QueuePool
+            options.setdefault("connect_args", {})["check_same_thread"] = False
+
+    def get_engine(self, app=None, bind=None):
+        moteur = super().get_engine(app, bind)
+        if moteur.dialect.name == "sqlite" and moteur not in self.moteurs_configures:
+            with self.verrou_moteurs:
+                if moteur not in self.moteurs_configures:
+                    pragmas = dict(self.get_app(app).config.get("SQLITE_PRAGMAS") or {})
+
+                    @event.listens_for(moteur, "connect")
+                    def configurer_connexion(connexion, enregistrement):
+                        appliquer_pragmas(connexion, pragmas)
+                        for nom, (nombre_arguments, fonction) in self.fonctions_sqlite.items():
+                            connexion.create_function(nom, nombre_arguments, fonction, deterministic=True)
+
+                    self.moteurs_configures.add(moteur)
+        return moteur
+
+    def fonction_sqlite(self, nom, nombre_arguments):
+        """
+        Décorateur déclarant une fonction Python utilisable dans les requêtes SQL sous le nom donné. La fonction est
+        ajoutée aux connexions ouvertes après sa déclaration.
+        :param nom: nom de la fonction en SQL
+        :param nombre_arguments: nombre d'arguments de la fonction
+        """
+        def decorateur(fonction):
+            self.fonctions_sqlite[nom] = (nombre_arguments, fonction)
+            return fonction
+        return decorateur
+
+    def fermer_connexions(self):
+        """
+        Ferme les connexions gardées dans le pool de chaque moteur (les connexions en cours d'utilisation ne sont pas
+        concernées). Appelée avant chaque fork.
+        """
+        for moteur in list(self.moteurs_configures):
+            moteur.dispose()
@@ -0,0 +1,219 @@
+# Service de l'API en lecture par un serveur asyncio (ASGI) :
+# Un serveur ASGI (ex : uvicorn) garde ouvertes autant de connexions que nécessaire dans une seule boucle d'événements,
+# sans leur réserver un fil d'exécution chacune. La passerelle reçoit les requêtes de lecture (GET, HEAD) adressées à
+# l'API et les fait exécuter par l'application Flask (mêmes routes, même cache, même JSON) dans un nombre borné de fils
+# d'exécution, pas plus nombreux que les connexions du pool de la base de données : les requêtes supplémentaires
+# attendent leur tour dans la boucle d'événements, au lieu d'occuper un fil ou d'ouvrir une connexion de plus.
+# Une réponse envoyée en flux (ex : collection complète) est produite morceau par morceau dans le fil qui exécute la
+# route (le contexte de la requête Flask est propre à ce fil) et transmise au client par une file bornée : un client
+# lent ralentit la production de sa réponse sans la garder en mémoire, et un client qui se déconnecte libère le fil et
+# sa connexion à la base de données dès le morceau suivant.
+# Une collection complète (sans pagination) ou un export occupe son fil pendant toute sa production : ces requêtes ont
+# leurs propres fils (ASGI_FILS_FLUX), en plus de ceux des autres requêtes. Des moissonneurs qui téléchargent le corpus
+# en même temps attendent alors leur tour entre eux, sans retarder les requêtes courtes.
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from .constantes import API_ROUTE, ASGI_FILS, ASGI_FILS_FLUX, ASGI_TAMPON, ASGI_TAILLE_MORCEAU
+
+
+# Routes de l'API (après le préfixe) dont la réponse est une collection envoyée en entier, en flux, si le paramètre
+# page[size] n'est pas renseigné (voir routes/api.py), et routes toujours envoyées en flux.
+COLLECTIONS_EN_FLUX = ("/lettres", "/publications", "/transcriptions", "/recherche")
+ROUTES_EN_FLUX = ("/export",)
+
+
+class ClientDeconnecte(Exception):
+    """
+    Le client a fermé la connexion avant la fin de la réponse.
+    """
+
+
+def environ_wsgi(scope):
+    """
+    Construit l'environnement WSGI d'une requête HTTP ASGI sans corps (lecture).
+    :param scope: description de la requête par le serveur ASGI
+    :return: dictionnaire environ (PEP 3333)
+    :rtype: dict
+    """
+    serveur = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        # WSGI transmet le chemin sous la forme d'octets décodés en latin-1.
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": serveur[0],
+        "SERVER_PORT": str(serveur[1]),
+        "SERVER_PROTOCOL": "HTTP/{}".format(scope.get("http_version", "1.1")),
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(b""),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for nom, valeur in scope.get("headers", []):
+        nom = nom.decode("latin-1").upper().replace("-", "_")
+        valeur = valeur.decode("latin-1")
+        if nom in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[nom] = valeur
+            continue
+        cle = "HTTP_" + nom
+        # Les en-têtes répétés sont réunis, séparés par des virgules.
+        environ[cle] = environ[cle] + "," + valeur if cle in environ else valeur
+    return environ
+
+
+class PasserelleASGI:
+    """
+    Application ASGI servant les routes de lecture de l'API d'une application WSGI (Flask) : les autres routes et
+    méthodes sont refusées.
+    :param application: application WSGI
+    :param prefixe: préfixe des chemins servis
+    :param fils: nombre maximal de requêtes exécutées en même temps (fils d'exécution), hors collections complètes
+    :param fils_flux: nombre maximal de collections complètes et d'exports produits en même temps
+    :param tampon: nombre de morceaux de réponse produits d'avance pour un client
+    :param taille_morceau: taille (en octets) à partir de laquelle les données produites sont envoyées au client
+    """
+    def __init__(self, application, prefixe=API_ROUTE, fils=ASGI_FILS, fils_flux=ASGI_FILS_FLUX, tampon=ASGI_TAMPON,
+                 taille_morceau=ASGI_TAILLE_MORCEAU):
+        self.application = application
+        self.prefixe = prefixe
+        self.tampon = tampon
+        self.taille_morceau = taille_morceau
+        self.executeur = ThreadPoolExecutor(max_workers=fils, thread_name_prefix="passerelle")
+        self.executeur_flux = ThreadPoolExecutor(max_workers=fils_flux, thread_name_prefix="passerelle-flux")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.cycle_de_vie(receive, send)
+        elif scope["type"] == "http":
+            if scope["path"] != self.prefixe and not scope["path"].startswith(self.prefixe + "/"):
+                await self.erreur(send, 404, [])
+            elif scope["method"] not in ("GET", "HEAD"):
+                await self.erreur(send, 405, [(b"allow", b"GET, HEAD")])
+            else:
+                await self.servir(scope, receive, send)
+
+    async def cycle_de_vie(self, receive, send):
+        """
+        Répond aux messages de démarrage et d'arrêt du serveur : à l'arrêt, les requêtes en cours sont terminées.
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for executeur in (self.executeur, self.executeur_flux):
+                    await asyncio.get_running_loop().run_in_executor(None, executeur.shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def erreur(send, statut, entetes):
+        """
+        Envoie une réponse d'erreur JSON, sans exécuter l'application.
+        """
+        corps = b'{"erreur": "Unable to perform the query"}'
+        await send({"type": "http.response.start", "status": statut,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(corps)).encode("latin-1"))] + entetes})
+        await send({"type": "http.response.body", "body": corps})
+
+    def en_flux(self, scope):
+        """
+        Indique si la requête demande une collection complète ou un export, produits en flux.
+        :rtype: bool
+        """
+        route = scope["path"][len(self.prefixe):].rstrip("/")
+        return route in ROUTES_EN_FLUX or (route in COLLECTIONS_EN_FLUX and "page[size]" not in parse_qs(
+            scope.get("query_string", b"").decode("latin-1")))
+
+    async def servir(self, scope, receive, send):
+        """
+        Exécute la requête dans un fil de l'exécuteur et transmet la réponse au client au fil de sa production.
+        """
+        boucle = asyncio.get_running_loop()
+        file = asyncio.Queue(maxsize=self.tampon)
+        abandon = threading.Event()
+
+        def transmettre(message):
+            # Appelé depuis le fil d'exécution : attend qu'une place se libère dans la file (client lent).
+            if abandon.is_set():
+                raise ClientDeconnecte()
+            asyncio.run_coroutine_threadsafe(file.put(message), boucle).result()
+
+        def executer():
+            def start_response(statut, entetes, exc_info=None):
+                transmettre(("debut", int(statut.split(" ", 1)[0]),
+                             [(nom.lower().encode("latin-1"), valeur.encode("latin-1")) for nom, valeur in entetes]))
+            try:
+                reponse = self.application(environ_wsgi(scope), start_response)
+                try:
+                    # Les morceaux de la réponse sont regroupés jusqu'à ASGI_TAILLE_MORCEAU octets : chaque passage
+                    # d'un morceau vers la boucle d'événements a un coût fixe.
+                    morceaux, taille = [], 0
+                    for morceau in reponse:
+                        morceaux.append(morceau)
+                        taille += len(morceau)
+                        if taille >= self.taille_morceau:
+                            transmettre(("corps", b"".join(morceaux)))
+                            morceaux, taille = [], 0
+                    transmettre(("fin", b"".join(morceaux)))
+                finally:
+                    # Fermer la réponse termine la requête Flask (fermeture de la session de base de données).
+                    if hasattr(reponse, "close"):
+                        reponse.close()
+            except ClientDeconnecte:
+                pass
+            except Exception as erreur:
+                if not abandon.is_set():
+                    transmettre(("erreur", erreur))
+
+        async def surveiller_deconnexion():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        execution = boucle.run_in_executor(self.executeur_flux if self.en_flux(scope) else self.executeur, executer)
+        surveillance = asyncio.ensure_future(surveiller_deconnexion())
+        debut = False
+        try:
+            while True:
+                lecture = asyncio.ensure_future(file.get())
+                await asyncio.wait([lecture, surveillance], return_when=asyncio.FIRST_COMPLETED)
+                if not lecture.done():
+                    # Le client s'est déconnecté.
+                    lecture.cancel()
+                    return
+                nature, *contenu = lecture.result()
+                if nature == "debut":
+                    await send({"type": "http.response.start", "status": contenu[0], "headers": contenu[1]})
+                    debut = True
+                elif nature == "corps":
+                    await send({"type": "http.response.body", "body": contenu[0], "more_body": True})
+                elif nature == "fin":
+                    await send({"type": "http.response.body", "body": contenu[0], "more_body": False})
+                    return
+                else:
+                    # Erreur de l'application : réponse 500 si rien n'a encore été envoyé, sinon la réponse est
+                    # interrompue (le serveur ferme la connexion).
+                    if not debut:
+                        await self.erreur(send, 500, [])
+                    raise contenu[0]
+        finally:
+            abandon.set()
+            surveillance.cancel()
+            # Le fil d'exécution qui attend une place dans la file est libéré ; il s'arrête au morceau suivant.
+            while not file.empty():
+                file.get_nowait()
+            try:
+                await execution
+            except ClientDeconnecte:
+                pass
@@ -1,11 +1,22 @@
 # Import des modules Flask et sqlaclchemy nécessaire au fonctionnement de l'application
-from flask import request, jsonify
-from sqlalchemy import or_
+from flask import request, jsonify, json, Response, stream_with_context, url_for
+from flask_login import current_user
 
 # Import de l'application, des constantes et des classes.
-from ..app import app
-from ..constantes import API_ROUTE
-from ..modeles.donnees import Lettre, Publication, Transcription
+from ..app import app, db
+from ..constantes import API_ROUTE, API_TAILLE_LOT, API_TAILLE_PAGE_MAX, API_TAILLE_MAX_ECRITURE, \
+    API_TAILLE_PAGE_CONTRIBUTIONS
+from ..modeles.donnees import Lettre, Publication, Transcription, Contribution
+from ..modeles.recherche import resultats_recherche, surligner
+from ..modeles.export import exporter_lettres, FORMATS_EXPORT
+from ..modeles.lieux import Lieu
+from ..modeles.revisions import Revision
+from ..modeles.contributeurs import Contributeur
+from ..modeles.facettes import lire_filtres, conditions_filtres, facettes_recherche
+from .cache import reponse_en_cache, etiquettes_collection, etiquettes_lettre, etiquettes_publication, \
+    etiquettes_transcription, etiquettes_contributeur
+from .validation import reponse_conditionnelle, validateur_global, validateur_lettre, validateur_publication, \
+    validateur_transcription, validateur_contributeur
 
 
 def Json_404():
@@ -14,123 +25,490 @@ def Json_404():
     return response
 
 
+def objet_de(ligne):
+    """
+    Retourne l'objet d'une ligne de résultat, qui peut être accompagné de colonnes supplémentaires (score, etc.)
+    :param ligne: objet ou tuple (objet, colonnes supplémentaires)
+    """
+    return ligne[0] if isinstance(ligne, tuple) else ligne
+
+
+def parcourir_par_lots(query, cle, taille_lot=API_TAILLE_LOT):
+    """
+    Parcourt les résultats d'une requête par lots de taille fixe, triés selon leur clé primaire.
+    Chaque lot est récupéré avec une condition "cle > dernière clé lue" plutôt qu'avec un OFFSET : le coût d'un lot
+    reste le même quel que soit sa position dans la table, et seuls les objets du lot courant sont gardés en mémoire.
+    :param query: requête SQLAlchemy à parcourir
+    :param cle: colonne de clé primaire servant au tri et à la reprise (ex : Lettre.lettre_id)
+    :param taille_lot: nombre d'objets chargés à chaque requête
+    :return: générateur des objets de la requête
+    """
+    derniere_cle = None
+    while True:
+        lot = query
+        if derniere_cle is not None:
+            lot = lot.filter(cle > derniere_cle)
+        lot = lot.order_by(cle).limit(taille_lot).all()
+
+        # Si le lot est vide, tous les résultats ont été parcourus.
+        if not lot:
+            return
+
+        for objet in lot:
+            yield objet
+
+        # Si le lot est incomplet, il n'y a plus de résultat à charger.
+        if len(lot) < taille_lot:
+            return
+        derniere_cle = getattr(objet_de(lot[-1]), cle.key)
+
+
+def Json_400(erreur):
+    response = jsonify({"erreur": erreur})
+    response.status_code = 400
+    return response
+
+
+def lire_champs():
+    """
+    Lit les paramètres fields[type] de la requête (JSON:API sparse fieldsets), ex : fields[Lettre]=date,lieu.
+    :return: tuple (dictionnaire {type de ressource: ensemble des champs demandés}, None)
+             ou (None, message d'erreur) si un type ou un champ est inconnu
+    """
+    types = {"Lettre": Lettre, "Publication": Publication, "Transcription": Transcription}
+    champs = {}
+    for parametre, valeur in request.args.items():
+        if not (parametre.startswith("fields[") and parametre.endswith("]")):
+            continue
+        type_ressource = parametre[len("fields["):-1]
+
+        # Définition des erreurs : le type et les champs demandés doivent exister.
+        if type_ressource not in types:
+            return None, "Type de ressource inconnu : {}".format(type_ressource)
+        classe = types[type_ressource]
+        noms = {nom.strip() for nom in valeur.split(",") if nom.strip()}
+        inconnus = noms - set(classe.ATTRIBUTS_JSONAPI) - set(classe.RELATIONS_JSONAPI)
+        if inconnus:
+            return None, "Champ(s) inconnu(s) pour {} : {}".format(type_ressource, ", ".join(sorted(inconnus)))
+
+        champs[type_ressource] = noms
+    return champs, None
+
+
+def lien_page(**parametres):
+    """
+    Construit le lien vers une autre page de la collection courante en conservant les paramètres de la requête
+    (mot clé, etc.) et en remplaçant les paramètres de pagination.
+    :param parametres: paramètres de pagination du lien (ex : {"page[after]": 20})
+    :return: URL absolue de la page
+    """
+    arguments = {cle: valeur for cle, valeur in request.args.items() if not cle.startswith("page[")}
+    arguments.update(parametres)
+    return url_for(request.endpoint, _external=True, **request.view_args, **arguments)
+
+
+def lire_pagination(taille_defaut=""):
+    """
+    Lit les paramètres de pagination page[size], page[after] et page[before].
+    :param taille_defaut: taille de page utilisée si page[size] n'est pas renseigné
+    :return: tuple (taille, identifiant after ou None, identifiant before ou None, message d'erreur ou None)
+    """
+    taille = request.args.get("page[size]", str(taille_defaut))
+    apres = request.args.get("page[after]", None)
+    avant = request.args.get("page[before]", None)
+
+    # Définition des erreurs : les paramètres de pagination doivent être des nombres entiers.
+    if not taille.isdigit() or not 0 < int(taille) <= API_TAILLE_PAGE_MAX:
+        return None, None, None, "page[size] doit être un entier compris entre 1 et {}".format(API_TAILLE_PAGE_MAX)
+    if (apres is not None and not apres.isdigit()) or (avant is not None and not avant.isdigit()):
+        return None, None, None, "page[after] et page[before] doivent être des identifiants"
+    if apres is not None and avant is not None:
+        return None, None, None, "page[after] et page[before] ne peuvent pas être utilisés ensemble"
+    return int(taille), apres, avant, None
+
+
+def paginer(query, cle):
+    """
+    Récupère une page de la collection selon les paramètres page[size], page[after] et page[before].
+    La page est sélectionnée par un curseur sur la clé primaire ("cle > page[after]" ou "cle < page[before]") : une
+    page lointaine coûte autant que la première, contrairement à un OFFSET qui doit relire toutes les lignes précédentes.
+    :param query: requête SQLAlchemy renvoyant les objets de la collection
+    :param cle: colonne de clé primaire de la collection
+    :return: tuple (objets de la page, liens de pagination) ou (None, message d'erreur)
+    """
+    taille, apres, avant, erreur = lire_pagination()
+    if erreur:
+        return None, erreur
+
+    # Une ligne de plus que la taille de la page est lue pour savoir si une page suit dans le sens de lecture.
+    if avant is not None:
+        objets = query.filter(cle < int(avant)).order_by(cle.desc()).limit(taille + 1).all()
+        encore = len(objets) > taille
+        objets = list(reversed(objets[:taille]))
+    else:
+        if apres is not None:
+            query_page = query.filter(cle > int(apres))
+        else:
+            query_page = query
+        objets = query_page.order_by(cle).limit(taille + 1).all()
+        encore = len(objets) > taille
+        objets = objets[:taille]
+
+    liens = {
+        "self": request.url,
+        "first": lien_page(**{"page[size]": taille})
+    }
+    if objets:
+        premiere_cle = getattr(objet_de(objets[0]), cle.key)
+        derniere_cle = getattr(objet_de(objets[-1]), cle.key)
+        # Dans le sens inverse de la lecture, une simple vérification d'existence suffit.
+        if avant is not None:
+            precedente = encore
+            suivante = db.session.query(query.filter(cle > derniere_cle).exists()).scalar()
+        else:
+            suivante = encore
+            precedente = apres is not None and db.session.query(query.filter(cle < premiere_cle).exists()).scalar()
+        if suivante:
+            liens["next"] = lien_page(**{"page[size]": taille, "page[after]": derniere_cle})
+        if precedente:
+            liens["prev"] = lien_page(**{"page[size]": taille, "page[before]": premiere_cle})
+
+    return objets, liens
+
+
+def paginer_contributions(query):
+    """
+    Récupère une page de contributions, de la plus récente à la plus ancienne, selon les paramètres page[size] (par
+    défaut API_TAILLE_PAGE_CONTRIBUTIONS), page[after] et page[before]. Les curseurs sont des identifiants de
+    contribution : la page reprend après (ou avant) la date et l'identifiant de cette contribution, dans l'ordre de
+    l'index des dates (ou de l'index par utilisateur et par date) ; une page lointaine coûte autant que la première.
+    :param query: requête SQLAlchemy renvoyant les contributions
+    :return: tuple (contributions de la page, liens de pagination) ou (None, message d'erreur)
+    """
+    taille, apres, avant, erreur = lire_pagination(API_TAILLE_PAGE_CONTRIBUTIONS)
+    if erreur:
+        return None, erreur
+
+    # Le curseur est la paire (date, identifiant) : plusieurs contributions peuvent avoir la même date.
+    cle = db.tuple_(Contribution.contribution_date, Contribution.contribution_id)
+
+    def position(contribution_id):
+        date = db.session.query(Contribution.contribution_date).filter(
+            Contribution.contribution_id == contribution_id).scalar()
+        return db.tuple_(db.bindparam(None, date, type_=db.DateTime), contribution_id) if date else None
+
+    identifiant = avant if avant is not None else apres
+    curseur = position(int(identifiant)) if identifiant is not None else None
+    if identifiant is not None and curseur is None:
+        return None, "page[after] et page[before] doivent être des identifiants de contributions existantes"
+
+    # Une ligne de plus que la taille de la page est lue pour savoir si une page suit dans le sens de lecture.
+    if avant is not None:
+        objets = query.filter(cle > curseur).order_by(Contribution.contribution_date, Contribution.contribution_id)\
+            .limit(taille + 1).all()
+        encore = len(objets) > taille
+        objets = list(reversed(objets[:taille]))
+    else:
+        if curseur is not None:
+            query_page = query.filter(cle < curseur)
+        else:
+            query_page = query
+        objets = query_page.order_by(Contribution.contribution_date.desc(), Contribution.contribution_id.desc())\
+            .limit(taille + 1).all()
+        encore = len(objets) > taille
+        objets = objets[:taille]
+
+    liens = {
+        "self": request.url,
+        "first": lien_page(**{"page[size]": taille})
+    }
+    if objets:
+        # Dans le sens inverse de la lecture, une simple vérification d'existence suffit.
+        if avant is not None:
+            precedente = encore
+            suivante = db.session.query(query.filter(cle < position(objets[-1].contribution_id)).exists()).scalar()
+        else:
+            suivante = encore
+            precedente = apres is not None and db.session.query(
+                query.filter(cle > position(objets[0].contribution_id)).exists()).scalar()
+        if suivante:
+            liens["next"] = lien_page(**{"page[size]": taille, "page[after]": objets[-1].contribution_id})
+        if precedente:
+            liens["prev"] = lien_page(**{"page[size]": taille, "page[before]": objets[0].contribution_id})
+
+    return objets, liens
+
+
+def Json_collection(query, cle, champs=None, meta=None, meta_collection=None):
+    """
+    Renvoie une réponse JSON:API contenant une collection, écrite morceau par morceau au fil de la lecture de la base
+    de données : le document complet n'est jamais construit en mémoire.
+    Si le paramètre page[size] est renseigné, seule la page demandée est renvoyée, avec les liens next/prev.
+    :param query: requête SQLAlchemy renvoyant les objets de la collection
+    :param cle: colonne de clé primaire de la collection
+    :param champs: champs demandés par type de ressource (paramètres fields[type])
+    :param meta: fonction construisant le bloc "meta" d'une ressource à partir de sa ligne de résultat
+    :param meta_collection: bloc "meta" de la collection (ex : facettes de la recherche), ou None
+    :return: réponse Flask envoyée en flux
+    """
+    if "page[size]" in request.args:
+        objets, liens = paginer(query, cle)
+        if objets is None:
+            return Json_400(liens)
+    else:
+        objets = parcourir_par_lots(query, cle)
+        liens = {"self": request.url}
+    return Json_flux(objets, liens, champs, meta, meta_collection)
+
+
+def Json_flux(objets, liens, champs=None, meta=None, meta_collection=None):
+    """
+    Renvoie une réponse JSON:API contenant les objets donnés, écrite morceau par morceau au fil de leur lecture.
+    :param objets: itérable des objets (ou des lignes de résultat) de la collection
+    :param liens: bloc "links" de la collection
+    :return: réponse Flask envoyée en flux (voir Json_collection pour les autres paramètres)
+    """
+    def generer():
+        yield '{"links": ' + json.dumps(liens) + ', '
+        if meta_collection:
+            yield '"meta": ' + json.dumps(meta_collection) + ', '
+        yield '"data": ['
+        premier = True
+        for ligne in objets:
+            if not premier:
+                yield ", "
+            premier = False
+            donnees = objet_de(ligne).to_jsonapi_dict(champs)
+            if meta:
+                donnees["meta"] = meta(ligne)
+            yield json.dumps(donnees)
+        yield "]}"
+
+    # stream_with_context conserve le contexte de la requête (nécessaire à url_for) pendant l'envoi.
+    return Response(stream_with_context(generer()), mimetype="application/json")
+
+
 @app.route(API_ROUTE+"/lettres")
+@reponse_en_cache(etiquettes_collection("lettre", "publication", "transcription"))
+@reponse_conditionnelle(validateur_global)
 def api_lettres():
     """
     Récupérer les données de toutes les lettres en JSON
     """
-    query = Lettre.query
+    champs, erreur = lire_champs()
+    if erreur:
+        return Json_400(erreur)
 
-    try:
-        lettres = query
+    # Limitation à une période (paramètres date_from et date_to).
+    periode, erreurs = Lettre.filtre_periode(request.args.get("date_from"), request.args.get("date_to"))
+    if erreurs:
+        return Json_400(", ".join(erreurs))
 
-    except Exception:
-        return Json_404()
+    query = Lettre.query.options(*Lettre.options_jsonapi(champs)).filter(*periode)
 
-    dict_lettres = {
-            "links": {
-                "self": request.url
-            },
-            "data": [
-                lettres.to_jsonapi_dict()
-                for lettres in lettres
-            ]
-        }
+    return Json_collection(query, Lettre.lettre_id, champs)
 
-    response = jsonify(dict_lettres)
 
+@app.route(API_ROUTE+"/lettres", methods=["POST"])
+def api_lettres_ecriture():
+    """
+    Créer ou modifier un lot de lettres, avec leurs publications et leurs transcriptions, en une seule requête.
+    Le corps de la requête est une liste JSON (ou un objet {"data": liste}) de lettres de la forme
+    {"id" (seulement pour une modification), "numero", "auteur", "lieu", "date", "publications": [identifiants],
+    "transcriptions": [textes]}. La réponse donne le résultat de chaque lettre, dans l'ordre de la requête.
+    """
+    if not current_user.is_authenticated:
+        response = jsonify({"erreur": "Vous devez être connecté-e pour contribuer"})
+        response.status_code = 401
+        return response
+
+    elements = request.get_json(silent=True)
+    if isinstance(elements, dict):
+        elements = elements.get("data")
+    if not isinstance(elements, list) or not elements:
+        return Json_400("Le corps de la requête doit être une liste JSON de lettres")
+    if len(elements) > API_TAILLE_MAX_ECRITURE:
+        return Json_400("Au plus {} lettres peuvent être envoyées en une fois".format(API_TAILLE_MAX_ECRITURE))
+
+    status, resultats = Lettre.enregistrer_lot(elements)
+    for resultat in resultats:
+        if resultat["id"] is not None:
+            resultat["links"] = {"json": url_for("api_lettre_unique", lettre_id=resultat["id"], _external=True)}
+        if "conflit" in resultat:
+            resultat["conflit"] = {"id": resultat["conflit"], "links": {
+                "json": url_for("api_lettre_unique", lettre_id=resultat["conflit"], _external=True)}}
+
+    meta = {statut: sum(1 for resultat in resultats if resultat["statut"] == statut)
+            for statut in ("creee", "modifiee", "rejetee")}
+    response = jsonify({"data": resultats, "meta": meta})
+    if status is False:
+        # Une lettre identique a été enregistrée entre-temps par une autre requête : le lot est en conflit avec elle.
+        response.status_code = 409 if any("conflit" in resultat for resultat in resultats) else 500
+    elif meta["rejetee"]:
+        # Certaines lettres ont été rejetées : la requête est en partie invalide.
+        response.status_code = 422 if meta["rejetee"] == len(resultats) else 207
+    else:
+        response.status_code = 201 if meta["creee"] else 200
     return response
 
 
 @app.route(API_ROUTE+"/lettres/<lettre_id>")
+@reponse_en_cache(etiquettes_lettre)
+@reponse_conditionnelle(validateur_lettre)
 def api_lettre_unique(lettre_id):
     """
     Récupérer les données de la lettre en JSON
     """
+    champs, erreur = lire_champs()
+    if erreur:
+        return Json_400(erreur)
+
     try:
-        query = Lettre.query.get(lettre_id)
-        return jsonify(query.to_jsonapi_dict())
+        query = Lettre.query.options(*Lettre.options_jsonapi(champs)).get(lettre_id)
+        return jsonify(query.to_jsonapi_dict(champs))
     except:
         return Json_404()
 
 
 @app.route(API_ROUTE+"/publications")
+@reponse_en_cache(etiquettes_collection("publication"))
+@reponse_conditionnelle(validateur_global)
 def api_publications():
     """
     Récupérer les données de toutes les publications en JSON
     """
-    query = Publication.query
-    try:
-        publications = query
+    champs, erreur = lire_champs()
+    if erreur:
+        return Json_400(erreur)
 
-    except Exception:
-        return Json_404()
+    query = Publication.query.options(*Publication.options_jsonapi(champs))
 
-    dict_publications = {
-            "links": {
-                "self": request.url
-            },
-            "data": [
-                publications.to_jsonapi_dict()
-                for publications in publications
-            ]
-        }
-
-    response = jsonify(dict_publications)
-    return response
+    return Json_collection(query, Publication.publication_id, champs)
 
 
 @app.route(API_ROUTE+"/publications/<publication_id>")
+@reponse_en_cache(etiquettes_publication)
+@reponse_conditionnelle(validateur_publication)
 def api_publication_unique(publication_id):
     """
     Récupérer les données de la publication en JSON
     """
+    champs, erreur = lire_champs()
+    if erreur:
+        return Json_400(erreur)
+
     try:
-        query = Publication.query.get(publication_id)
-        return jsonify(query.to_jsonapi_dict())
+        query = Publication.query.options(*Publication.options_jsonapi(champs)).get(publication_id)
+        return jsonify(query.to_jsonapi_dict(champs))
     except:
         return Json_404()
 
 
 @app.route(API_ROUTE+"/transcriptions")
+@reponse_en_cache(etiquettes_collection("transcription"))
+@reponse_conditionnelle(validateur_global)
 def api_transcriptions():
     """
     Récupérer les données de toutes les transcriptions en JSON
     """
-    query = Transcription.query
-    try:
-        transcriptions = query
+    champs, erreur = lire_champs()
+    if erreur:
+        return Json_400(erreur)
 
-    except Exception:
-        return Json_404()
+    query = Transcription.query.options(*Transcription.options_jsonapi(champs))
 
-    dict_transcriptions = {
-            "links": {
-                "self": request.url
-            },
-            "data": [
-                transcriptions.to_jsonapi_dict()
-                for transcriptions in transcriptions
-            ]
-        }
-
-    response = jsonify(dict_transcriptions)
-    return response
+    return Json_collection(query, Transcription.transcription_id, champs)
 
 
 @app.route(API_ROUTE+"/transcriptions/<transcription_id>")
+@reponse_en_cache(etiquettes_transcription)
+@reponse_conditionnelle(validateur_transcription)
 def api_transcription_unique(transcription_id):
     """
     Récupérer les données de la transcription en JSON
     """
+    champs, erreur = lire_champs()
+    if erreur:
+        return Json_400(erreur)
+
     try:
-        query = Transcription.query.get(transcription_id)
-        return jsonify(query.to_jsonapi_dict())
+        query = Transcription.query.options(*Transcription.options_jsonapi(champs)).get(transcription_id)
+        return jsonify(query.to_jsonapi_dict(champs))
     except:
         return Json_404()
 
 
+@app.route(API_ROUTE+"/transcriptions/<transcription_id>/revisions")
+@reponse_en_cache(etiquettes_transcription)
+@reponse_conditionnelle(validateur_transcription)
+def api_revisions_transcription(transcription_id):
+    """
+    Récupérer la liste des révisions d'une transcription en JSON, sans leur texte
+    """
+    transcription = Transcription.query.get(transcription_id)
+    if transcription is None:
+        return Json_404()
+
+    return jsonify({
+        "data": [revision.to_jsonapi_dict() for revision in transcription.revisions.options(
+            db.joinedload(Revision.contribution).joinedload(Contribution.utilisateur))
+            .order_by(Revision.revision_numero)],
+        "links": {"self": request.url}
+    })
+
+
+@app.route(API_ROUTE+"/transcriptions/<transcription_id>/revisions/<int:numero>")
+@reponse_en_cache(etiquettes_transcription)
+@reponse_conditionnelle(validateur_transcription)
+def api_revision_transcription(transcription_id, numero):
+    """
+    Récupérer une révision d'une transcription en JSON, avec son texte reconstruit
+    """
+    version = Revision.version(transcription_id, numero)
+    if version is None:
+        return Json_404()
+    revision, texte = version
+    return jsonify(revision.to_jsonapi_dict(texte))
+
+
+@app.route(API_ROUTE+"/contributions")
+@reponse_en_cache(etiquettes_collection("contribution"))
+@reponse_conditionnelle(validateur_global)
+def api_contributions():
+    """
+    Récupérer l'historique des contributions en JSON, de la plus récente à la plus ancienne, page par page
+    """
+    query = Contribution.query.options(db.joinedload(Contribution.utilisateur))
+
+    # Limitation aux contributions d'un utilisateur (paramètre contributeur).
+    contributeur = request.args.get("contributeur", None)
+    if contributeur is not None:
+        if not contributeur.isdigit():
+            return Json_400("contributeur doit être l'identifiant d'un utilisateur")
+        query = query.filter(Contribution.contribution_ut_id == int(contributeur))
+
+    objets, liens = paginer_contributions(query)
+    if objets is None:
+        return Json_400(liens)
+    return Json_flux(objets, liens)
+
+
+@app.route(API_ROUTE+"/contributeurs/<ut_id>")
+@reponse_en_cache(etiquettes_contributeur)
+@reponse_conditionnelle(validateur_contributeur)
+def api_contributeur_unique(ut_id):
+    """
+    Récupérer les données d'un contributeur et le nombre de ses contributions par type d'objet en JSON
+    """
+    contributeur = Contributeur.query.options(db.joinedload(Contributeur.utilisateur)).get(ut_id)
+    if contributeur is None:
+        return Json_404()
+    return jsonify(contributeur.to_jsonapi_dict())
+
+
 @app.route(API_ROUTE+"/recherche")
+@reponse_en_cache(etiquettes_collection("lettre", "publication", "transcription"))
+@reponse_conditionnelle(validateur_global)
 def api_lettres_recherche():
     """
     Route permettant d'avoir le résultat d'une recherche en JSON
@@ -138,32 +516,60 @@ def api_lettres_recherche():
     # Récupération du mot clé renseigné par l'utilisateur.
     motclef = request.args.get("keyword", None)
 
-    # Si il y a un mot clé, on filtre grâce à .like les résultats de la recherche.
+    champs, erreur = lire_champs()
+    if erreur:
+        return Json_400(erreur)
+
+    # Filtres : période (date_from et date_to), rédacteur (auteur), lieu et publication (identifiant).
+    filtres = lire_filtres(request.args)
+    conditions, erreurs = conditions_filtres(filtres)
+    if erreurs:
+        return Json_400(", ".join(erreurs))
+    # Les facettes (nombre de lettres par rédacteur, lieu, année et publication) des résultats et du corpus sont
+    # renvoyées dans le bloc "meta" de la collection.
+    meta_collection = {"facettes": facettes_recherche(motclef, filtres)}
+
+    # Chargement des lettres et de leurs relations par lots.
+    query = Lettre.query.options(*Lettre.options_jsonapi(champs)).filter(*conditions)
+
+    # Si il y a un mot clé, seules les lettres trouvées dans l'index plein texte sont renvoyées. Chaque lettre est
+    # accompagnée de son score de pertinence (bm25) et d'un extrait où les termes trouvés sont surlignés.
     if motclef:
-        query = Lettre.query.filter(or_(Lettre.lettre_numero.like("%{}%".format(motclef)),
-                                        Lettre.lettre_date.like("%{}%".format(motclef)),
-                                        Lettre.lettre_redacteur.like("%{}%".format(motclef)),
-                                        Lettre.lettre_lieu.like("%{}%".format(motclef)),
-                                        Lettre.lettre_volume.any(Publication.publication_titre.like("%{}%".format(
-                                            motclef)))))
-    else:
-        query = Lettre.query
+        trouvees = resultats_recherche(motclef)
+        query = query.join(trouvees, trouvees.c.lettre_id == Lettre.lettre_id).add_columns(trouvees.c.score,
+                                                                                           trouvees.c.extrait)
+        return Json_collection(query, Lettre.lettre_id, champs,
+                               meta=lambda ligne: {"score": ligne.score, "extrait": surligner(ligne.extrait)},
+                               meta_collection=meta_collection)
 
-    try:
-        resultats = query
+    return Json_collection(query, Lettre.lettre_id, champs, meta_collection=meta_collection)
 
-    except Exception:
-        return Json_404()
 
-    dict_resultats = {
-        "links": {
-            "self": request.url
-        },
-        "data": [
-            lettres.to_jsonapi_dict()
-            for lettres in resultats
-        ]
-    }
+@app.route(API_ROUTE+"/carte")
+@reponse_en_cache(etiquettes_collection("lettre"))
+@reponse_conditionnelle(validateur_global)
+def api_carte():
+    """
+    Route permettant d'avoir la carte des lettres en GeoJSON : un point par lieu d'envoi, avec son nombre de lettres.
+    Les nombres sont lus dans la table des lieux, tenue à jour à chaque écriture (voir modeles/lieux.py).
+    """
+    return Response(json.dumps(Lieu.carte(), separators=(",", ":")), mimetype="application/geo+json")
 
-    response = jsonify(dict_resultats)
-    return response
+
+@app.route(API_ROUTE+"/export")
+@reponse_conditionnelle(validateur_global)
+def api_export():
+    """
+    Route permettant de télécharger l'ensemble du corpus (lettres, publications, transcriptions et contributions) en
+    NDJSON (par défaut) ou en CSV (paramètre format=csv). L'export est envoyé en flux, au fil de la lecture de la base.
+    """
+    format_export = request.args.get("format", "ndjson")
+    if format_export not in FORMATS_EXPORT:
+        return Json_400("Format d'export inconnu : {} (formats possibles : {})".format(
+            format_export, ", ".join(FORMATS_EXPORT)))
+    formater, mimetype = FORMATS_EXPORT[format_export]
+
+    lignes = formater(exporter_lettres(db.session, API_TAILLE_LOT))
+    reponse = Response(stream_with_context(lignes), mimetype=mimetype)
+    reponse.headers["Content-Disposition"] = "attachment; filename=correspondance.{}".format(format_export)
+    return reponse
@@ -0,0 +1,171 @@
+# Cache des réponses des routes de lecture :
+# Les pages et les réponses de l'API sont gardées en mémoire (voir cache.py), indexées par la route et ses paramètres
+# normalisés. Chaque réponse est étiquetée avec les objets dont elle dépend, ex : ("lettre", 5) pour la page de la
+# lettre 5, ou ("lettre", "*") pour une collection de lettres. Lorsqu'une écriture est validée (commit), les réponses
+# étiquetées avec les objets modifiés, ou avec leur collection, sont retirées du cache. Les écritures des autres
+# processus sont vues grâce à la version des données lue dans la base à chaque lecture du cache (voir cache.py).
+from functools import wraps
+from flask import request, session, make_response, jsonify, Response
+from flask_login import current_user
+from sqlalchemy import event
+
+from ..app import app, db
+from ..cache import cache
+from ..constantes import API_ROUTE
+from ..modeles.donnees import Lettre, Contribution, Publication, Transcription, Source
+from ..modeles.statistiques import version_donnees
+
+
+# Fonctions retournant les étiquettes d'une réponse à partir des paramètres de sa route :
+
+def etiquettes_collection(*types):
+    """
+    Étiquettes d'une collection : la réponse dépend de tous les objets des types donnés.
+    """
+    def etiquettes(**parametres):
+        return {(type_objet, "*") for type_objet in types}
+    return etiquettes
+
+
+def etiquettes_lettre(lettre_id, **parametres):
+    """
+    Étiquettes d'une lettre : la lettre, ses publications et ses transcriptions.
+    """
+    etiquettes = {("lettre", int(lettre_id))}
+    etiquettes.update(("publication", publication_id) for publication_id, in db.session.query(
+        Source.c.source_publication_id).filter(Source.c.source_lettre_id == lettre_id))
+    etiquettes.update(("transcription", transcription_id) for transcription_id, in db.session.query(
+        Transcription.transcription_id).filter(Transcription.transcription_lettre_id == lettre_id))
+    return etiquettes
+
+
+def etiquettes_publication(publication_id, **parametres):
+    """
+    Étiquettes d'une publication : la publication et les lettres qu'elle édite.
+    """
+    etiquettes = {("publication", int(publication_id))}
+    etiquettes.update(("lettre", lettre_id) for lettre_id, in db.session.query(
+        Source.c.source_lettre_id).filter(Source.c.source_publication_id == publication_id))
+    return etiquettes
+
+
+def etiquettes_transcription(transcription_id, **parametres):
+    """
+    Étiquettes d'une transcription : la transcription et la lettre transcrite.
+    """
+    etiquettes = {("transcription", int(transcription_id))}
+    etiquettes.update(("lettre", lettre_id) for lettre_id, in db.session.query(
+        Transcription.transcription_lettre_id).filter(Transcription.transcription_id == transcription_id))
+    return etiquettes
+
+
+def etiquettes_contributeur(ut_id, **parametres):
+    """
+    Étiquettes d'un contributeur : ses contributions (et leurs compteurs).
+    """
+    return {("contributeur", int(ut_id))}
+
+
+def cle_requete():
+    """
+    Construit la clé de cache de la requête courante : route, paramètres de la route et paramètres de l'URL triés
+    (l'ordre des paramètres dans l'URL ne change pas la réponse).
+    """
+    return (request.endpoint, request.method == "HEAD", tuple(sorted((request.view_args or {}).items())),
+            tuple(sorted(request.args.items(multi=True))))
+
+
+def reponse_en_cache(etiquettes):
+    """
+    Décorateur de route gardant les réponses en cache. Seules les lectures de visiteurs non connectés, sans message
+    (flash) en attente, sont concernées : les autres pages dépendent de l'utilisateur.
+    :param etiquettes: fonction recevant les paramètres de la route et retournant les étiquettes de la réponse
+    """
+    def decorateur(fonction):
+        @wraps(fonction)
+        def route(*args, **kwargs):
+            if request.method not in ("GET", "HEAD") or current_user.is_authenticated or session.get("_flashes"):
+                return fonction(*args, **kwargs)
+
+            cle = cle_requete()
+            version = version_donnees()
+            entree = cache.lire(cle, version)
+            if entree is not None:
+                reponse = Response(entree["contenu"], status=entree["statut"], headers=entree["entetes"])
+                reponse.headers["X-Cache"] = "HIT"
+                # La réponse en cache porte l'ETag calculé lors de son enregistrement.
+                return reponse.make_conditional(request)
+
+            generation = cache.generation
+            reponse = make_response(fonction(*args, **kwargs))
+            reponse.headers["X-Cache"] = "MISS"
+            if reponse.status_code != 200:
+                return reponse
+            etiquettes_reponse = etiquettes(**kwargs)
+            entetes = [(nom, valeur) for nom, valeur in reponse.headers if nom != "X-Cache"]
+
+            # Le contenu est enregistré au fur et à mesure de son envoi : les réponses envoyées en flux le restent.
+            def enregistrer(morceaux):
+                contenu = []
+                taille = 0
+                for morceau in morceaux:
+                    taille += len(morceau)
+                    if taille <= cache.taille_max_reponse:
+                        contenu.append(morceau)
+                    yield morceau
+                if taille <= cache.taille_max_reponse:
+                    cache.ecrire(cle, generation, version, etiquettes_reponse, reponse.status_code, entetes,
+                                 b"".join(contenu))
+
+            reponse.response = enregistrer(reponse.iter_encoded())
+            return reponse
+        return route
+    return decorateur
+
+
+# Invalidation du cache au fil des écritures :
+# Après chaque envoi des modifications (flush), on note les objets créés, modifiés ou supprimés, ainsi que les objets
+# visés par les nouvelles contributions. Les réponses qui en dépendent sont retirées du cache une fois la transaction
+# validée ; si elle est annulée, rien n'est retiré.
+TYPES_CACHE = {Lettre: "lettre", Publication: "publication", Transcription: "transcription"}
+
+
+@event.listens_for(db.session, "after_flush")
+def noter_objets_modifies(session, contexte):
+    objets_modifies = session.info.setdefault("cache_a_invalider", set())
+    for objet in list(session.new) + list(session.dirty) + list(session.deleted):
+        type_objet = TYPES_CACHE.get(type(objet))
+        if type_objet:
+            objets_modifies.add((type_objet, objet.get_id()))
+        if isinstance(objet, Transcription):
+            objets_modifies.add(("lettre", objet.transcription_lettre_id))
+        if isinstance(objet, Contribution):
+            objets_modifies.update([("lettre", objet.contribution_lettre_id),
+                                    ("publication", objet.contribution_publication_id),
+                                    ("transcription", objet.contribution_transcription_id),
+                                    ("contribution", objet.contribution_id),
+                                    ("contributeur", objet.contribution_ut_id)])
+
+
+@event.listens_for(db.session, "after_commit")
+def invalider_cache(session):
+    objets_modifies = session.info.pop("cache_a_invalider", set())
+    etiquettes = set()
+    for type_objet, identifiant in objets_modifies:
+        if identifiant is not None:
+            etiquettes.update([(type_objet, identifiant), (type_objet, "*")])
+    if etiquettes:
+        cache.invalider(etiquettes)
+
+
+@event.listens_for(db.session, "after_rollback")
+def oublier_objets_modifies(session):
+    session.info.pop("cache_a_invalider", None)
+
+
+@app.route(API_ROUTE+"/cache")
+def api_cache():
+    """
+    Récupérer les statistiques du cache des réponses en JSON
+    """
+    return jsonify({"cache": cache.statistiques()})
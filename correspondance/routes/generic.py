@@ -1,14 +1,21 @@
 # Import des modules Flask nécessaire au fonctionnement de l'application
 from flask import render_template, request, flash, redirect, url_for
-from sqlalchemy import or_
 from flask_login import login_user, current_user, logout_user, login_required
 
 # Import de l'application
 from ..app import app, login, db
 
 # Import des classes nécessaires contenues dans le module modeles :
-from ..modeles.donnees import Lettre, Contribution, Publication, Transcription
+from ..modeles.donnees import Lettre, Contribution, Publication, Transcription, Source
 from ..modeles.utilisateurs import Utilisateur
+from ..hachage import HachageOccupe
+from ..modeles.recherche import resultats_recherche, surligner
+from ..modeles.facettes import lire_filtres, conditions_filtres, facettes_recherche
+from ..modeles.statistiques import Statistique
+from .cache import reponse_en_cache, etiquettes_collection, etiquettes_lettre, etiquettes_publication, \
+    etiquettes_transcription
+from .validation import reponse_conditionnelle, validateur_global, validateur_lettre, validateur_publication, \
+    validateur_transcription
 
 # Import des constantes
 from ..constantes import RESULTATS_PAR_PAGE
@@ -16,24 +23,25 @@ from ..constantes import RESULTATS_PAR_PAGE
 
 # Route pour l'accueil : nous y affichons les 5 dernières lettres ajoutées et les 5 dernières transcriptions ajoutées.
 @app.route('/')
+@reponse_en_cache(etiquettes_collection("lettre", "publication", "transcription"))
+@reponse_conditionnelle(validateur_global)
 def accueil():
     """"
     Route affichant la page accueil
     """
-    # La variable toutes_les_lettres récupèrent toutes les lettres de la DB.
-    toutes_les_lettres = Lettre.query.all()
+    # La variable statistiques récupère les compteurs du corpus (nombre de lettres, de transcriptions, etc.),
+    # tenus à jour à chaque écriture : la page ne parcourt pas les tables.
+    statistiques = Statistique.valeurs()
     # La variable dernieres_lettres récupèrent les 5 dernières lettres ajoutées.
     # On les récupère grâce à l'ordre décroissant de la valeur de lettre_id,
     # un identifiant automatiquement assigné lors de leur création.
     dernieres_lettres = Lettre.query.order_by(Lettre.lettre_id.desc()).limit(5).all()
 
-    # Même procédé pour les transcriptions :
-    toutes_les_transcriptions = Transcription.query.all()
+    # Même procédé pour les transcriptions (leur texte n'est pas chargé : la page affiche leur extrait) :
     dernieres_transcriptions = Transcription.query.order_by(Transcription.transcription_id.desc()).limit(5).all()
 
     return render_template('pages/accueil.html', nom="Correspondance jésuite", dernieres_lettres=dernieres_lettres,
-                           toutes_les_lettres=toutes_les_lettres, dernieres_transcriptions=dernieres_transcriptions,
-                           toutes_les_transcriptions=toutes_les_transcriptions)
+                           dernieres_transcriptions=dernieres_transcriptions, statistiques=statistiques)
 
 
 @app.route('/projet')
@@ -48,6 +56,8 @@ def projet():
 
 # Route pour afficher l'ensemble des lettres, présentées sous la forme de tableau avec une pagination.
 @app.route('/lettres', methods=["POST", "GET"])
+@reponse_en_cache(etiquettes_collection("lettre", "publication"))
+@reponse_conditionnelle(validateur_global)
 def lettres():
     """"
     Route affichant 10 lettres par pages grâce à la méthode paginate.
@@ -65,17 +75,24 @@ def lettres():
     # - page = correspondant au numéro de page.
     # - per_page : correspondant au nombre de résultat maximal par page.
     # Sa valeur ici est la variable définit dans le fichier constantes.py.
-    lettres = Lettre.query.paginate(page=page, per_page=RESULTATS_PAR_PAGE)
-    # Définition de la variable publications permettant l'affichage des données de la classe Publication
-    # appelées dans le template.
-    publications = Publication.query.all()
-
+    # Les lettres peuvent être limitées à une période (paramètres date_from et date_to, ex : date_from=1558-07) :
+    # les lettres sont alors lues dans l'index des dates.
+    date_from = request.args.get("date_from", None)
+    date_to = request.args.get("date_to", None)
+    periode, erreurs = Lettre.filtre_periode(date_from, date_to)
+    if erreurs:
+        flash("Les erreurs suivantes ont été rencontrées : " + ",".join(erreurs), "danger")
+    lettres = Lettre.query.filter(*periode).paginate(page=page, per_page=RESULTATS_PAR_PAGE)
+
+    # Les publications de chaque lettre sont lues par le template (lettre.lettre_volume).
     return render_template('pages/lettre/lettres.html', nom="Correspondance jésuite",
-                           lettres=lettres, publications=publications)
+                           lettres=lettres, date_from=date_from, date_to=date_to)
 
 
 # Route vers chacune des lettres grâce à leur id.
 @app.route("/lettres/<int:lettre_id>", methods=["POST", "GET"])
+@reponse_en_cache(etiquettes_lettre)
+@reponse_conditionnelle(validateur_lettre)
 def unique_lettre(lettre_id):
     """
     Route permettant l'affichage des données d'une seule lettre
@@ -86,13 +103,16 @@ def unique_lettre(lettre_id):
     # Récupération de la lettre grâce à lettre_id en utilisant .get()
     unique_lettre = Lettre.query.get(lettre_id)
 
-    # Jointure pour afficher les données de la table publication qui concernent cette lettre.
-    publication = Publication.query.filter(db.and_(Publication.publication_id == Lettre.lettre_volume,
-                                                   Lettre.lettre_id == lettre_id)).first()
+    # Jointure pour afficher les données de la table publication qui concernent cette lettre (par la table source,
+    # dont la clé primaire commence par l'identifiant de la lettre).
+    publication = Publication.query.join(Source, Source.c.source_publication_id == Publication.publication_id)\
+        .filter(Source.c.source_lettre_id == lettre_id).first()
 
     # Jointure pour afficher les données de la table transcription qui concernent cette lettre.
-    transcription = Transcription.query.filter(db.and_(Transcription.transcription_lettre_id == Lettre.lettre_id,
-                                                       Lettre.lettre_id == lettre_id)).first()
+    # Le texte, chargé à la demande par défaut, est lu avec la transcription (undefer).
+    transcription = Transcription.query.options(db.undefer(Transcription.transcription_texte))\
+        .filter(db.and_(Transcription.transcription_lettre_id == Lettre.lettre_id, Lettre.lettre_id == lettre_id))\
+        .first()
 
     return render_template("pages/lettre/lettre.html", nom="Correspondance jésuite",
                            lettre=unique_lettre, publication=publication, transcription=transcription)
@@ -100,13 +120,17 @@ def unique_lettre(lettre_id):
 
 # Route permettant la recherche dans les lettres.
 @app.route("/recherche", methods=["POST", "GET"])
+@reponse_en_cache(etiquettes_collection("lettre", "publication", "transcription"))
+@reponse_conditionnelle(validateur_global)
 def recherche():
     """
         Route permettant la recherche dans les lettres
         :return: template HTML (recherche.html)
     """
-    # Utilisation de .get() pour récupérer le mot-clé (keyword) envoyé par l'utilisateur.
+    # Utilisation de .get() pour récupérer le mot-clé (keyword) envoyé par l'utilisateur, et des filtres : période
+    # (date_from et date_to), rédacteur (auteur), lieu et publication (identifiant).
     motclef = request.args.get("keyword", None)
+    filtres = lire_filtres(request.args)
 
     # Utilisation de la méthode paginate pour la pagination :
     page = request.args.get("page", 1)
@@ -116,32 +140,57 @@ def recherche():
     else:
         page = 1
 
-    # Création d'une liste vide de résultat. Cette liste restera vide si il n'y a pas de mot clé.
+    # Création d'une liste vide de résultat. Cette liste restera vide si il n'y a ni mot clé ni filtre.
     resultats = []
     # Création d'un titre qui s'affichera si il n'y a pas de mot clé.
     titre = "Recherche"
 
     # Si il y a un mot clé, les variables résultats et titre changent.
-    # Le résultat de la recherche est obtenu grâce à la comparaison avec .like() du mot clé aux données de renseignées
-    # dans la table lettre : date, rédacteur, lieu, volume. Pour volume, on utilise .any afin de requêter aussi dans
-    # la table Publication.
+    # Le résultat de la recherche est obtenu grâce à l'index plein texte, qui rassemble les données de la table lettre
+    # (numéro, date, rédacteur, lieu), les titres des publications et le texte des transcriptions. Les lettres sont
+    # classées par pertinence (bm25) et accompagnées d'un extrait où les termes trouvés sont surlignés.
+    # Sans mot clé, les lettres répondant aux filtres sont classées par identifiant.
+    conditions, erreurs = conditions_filtres(filtres)
+    if erreurs:
+        flash("Les erreurs suivantes ont été rencontrées : " + ",".join(erreurs), "danger")
+        filtres = {}
+    elif motclef:
+        trouvees = resultats_recherche(motclef)
+        resultats = Lettre.query.options(db.selectinload(Lettre.lettre_volume))\
+            .join(trouvees, trouvees.c.lettre_id == Lettre.lettre_id)\
+            .filter(*conditions)\
+            .add_columns(trouvees.c.extrait)\
+            .order_by(trouvees.c.score, Lettre.lettre_id)\
+            .paginate(page=page, per_page=RESULTATS_PAR_PAGE)
+    elif filtres:
+        resultats = Lettre.query.options(db.selectinload(Lettre.lettre_volume))\
+            .filter(*conditions)\
+            .add_columns(db.null().label("extrait"))\
+            .order_by(Lettre.lettre_id)\
+            .paginate(page=page, per_page=RESULTATS_PAR_PAGE)
     if motclef:
-        resultats = Lettre.query.filter(or_(Lettre.lettre_numero.like("%{}%".format(motclef)),
-                                            Lettre.lettre_date.like("%{}%".format(motclef)),
-                                            Lettre.lettre_redacteur.like("%{}%".format(motclef)),
-                                            Lettre.lettre_lieu.like("%{}%".format(motclef)),
-                                            Lettre.lettre_volume.any(Publication.publication_titre.like("%{}%".format(
-                                                motclef))))).paginate(page=page, per_page=RESULTATS_PAR_PAGE)
-
         titre = "Résultat(s) de votre recherche pour ' " + motclef + " ' "
+
+    # Facettes des résultats et du corpus (nombre de lettres par rédacteur, lieu, année et publication), lues dans le
+    # cache si elles y sont. Chaque valeur d'une facette est un lien ajoutant le filtre correspondant à la recherche ;
+    # chaque filtre en cours peut être retiré.
+    facettes = facettes_recherche(motclef if not erreurs else None, filtres)
+    totaux = {facette: {valeur["valeur"]: valeur["nombre"] for valeur in valeurs}
+              for facette, valeurs in facettes["corpus"].items()}
+    retraits = {nom: url_for("recherche", keyword=motclef, **{autre: valeur for autre, valeur in filtres.items()
+                                                             if autre != nom})
+                for nom in filtres}
     return render_template("pages/recherche.html", nom="Correspondance jésuite", resultats=resultats, titre=titre,
-                           keyword=motclef)
+                           keyword=motclef, filtres=filtres, facettes=facettes["resultats"], totaux=totaux,
+                           retraits=retraits, surligner=surligner)
 
 
 # ROUTE POUR L'AFFICHAGE DES TRANSCRIPTIONS
 
 # Route pour afficher l'ensemble des transcriptions, présentées sous la forme de tableau avec une pagination.
 @app.route('/transcriptions', methods=["POST", "GET"])
+@reponse_en_cache(etiquettes_collection("transcription", "lettre"))
+@reponse_conditionnelle(validateur_global)
 def transcriptions():
     """"
     Route affichant 10 transcriptions par pages grâce à la méthode paginate.
@@ -160,6 +209,7 @@ def transcriptions():
     # - page = correspondant au numéro de page.
     # - per_page : correspondant au nombre de résultat maximal par page. Sa valeur ici est la variable définit
     # dans le fichier constantes.py.
+    # Le texte des transcriptions n'est pas chargé : la liste affiche leur extrait et leur nombre de mots.
     transcriptions = Transcription.query.paginate(page=page, per_page=RESULTATS_PAR_PAGE)
 
     return render_template('pages/transcription/transcriptions.html', nom="Correspondance jésuite",
@@ -168,14 +218,16 @@ def transcriptions():
 
 # Route vers chacune des transcription grâce à leur id.
 @app.route('/transcriptions/<int:transcription_id>')
+@reponse_en_cache(etiquettes_transcription)
+@reponse_conditionnelle(validateur_transcription)
 def afficher_transcription(transcription_id):
     """Route permettant d'afficher les transcriptions
     :param transcription_id: Identifiant de la transcription
     :type transcription_id: int
     :return: template HTML (transcription.html)
     """
-    # Récupération de la transcription grâce à son identifiant (transcription_id) en utilisant .get()
-    transcription = Transcription.query.get(transcription_id)
+    # Récupération de la transcription grâce à son identifiant (transcription_id) en utilisant .get(), avec son texte
+    transcription = Transcription.query.options(db.undefer(Transcription.transcription_texte)).get(transcription_id)
 
     # Jointure pour afficher les données de la table contribution qui concernent cette transcription :
     # la dernière modification de transcription.
@@ -197,6 +249,8 @@ def afficher_transcription(transcription_id):
 
 # Route vers la liste des ouvrages utilisés pour la constitution de la DB.
 @app.route('/publications', methods=["POST", "GET"])
+@reponse_en_cache(etiquettes_collection("publication"))
+@reponse_conditionnelle(validateur_global)
 def publications():
     """
         Route permettant l'affichage des ouvrages
@@ -210,6 +264,8 @@ def publications():
 
 # Route pour consulter la liste des lettres publiées dans chaque ouvrage :
 @app.route('/publications/<int:publication_id>', methods=["POST", "GET"])
+@reponse_en_cache(etiquettes_publication)
+@reponse_conditionnelle(validateur_publication)
 def unique_publication(publication_id):
     """
     Route permettant l'affichage des données d'un seul ouvrage
@@ -273,9 +329,15 @@ def connexion():
     if request.method == "POST":
         # Appel de la static method identification définie dans la classe Utilisateur.
         # Récupération des données entrées par l'utilisateur dans le formulaire.
-        utilisateur = Utilisateur.identification(
-            login=request.form.get("login", None),
-            motdepasse=request.form.get("motdepasse", None))
+        # Si trop de connexions sont en cours de vérification, la demande est refusée sans attendre (voir
+        # hachage.py) : l'utilisateur est invité à réessayer.
+        try:
+            utilisateur = Utilisateur.identification(
+                login=request.form.get("login", None),
+                motdepasse=request.form.get("motdepasse", None))
+        except HachageOccupe:
+            flash("Trop de connexions sont en cours, veuillez réessayer dans quelques instants", "error")
+            return render_template("pages/utilisateur/connexion.html"), 503, {"Retry-After": "1"}
 
         # Si la static method identification renvoi utilisateur après la récupération des données entrées par
         # l'utilisateur dans le formulaire, l'utilisateur est considéré comme connecté grâce à login_user
@@ -376,7 +438,10 @@ def source(lettre_id):
     # Si des données sont ajoutée par l'utilisateur :
     if source_lettre:
         # On les envoi avec l'ID de la lettre à la static methode sourcer_lettre de la classe Lettre.
-        Lettre.sourcer_lettre(source_lettre, lettre_id)
+        statut, donnees = Lettre.sourcer_lettre(source_lettre, lettre_id)
+        if statut is False:
+            flash("Les erreurs suivantes ont été rencontrées : " + " ; ".join(donnees), "danger")
+            return redirect(url_for("source", lettre_id=lettre_id))
 
         # En cas de succès de la static method, information à l'utilisateur que la lettre a bien été reliée
         # à un ouvrage.
@@ -407,8 +472,11 @@ def supprimer_source(lettre_id):
     publication_id = request.form.get("publication_id", None)
 
     if publication_id:
-        # On les envoi avec l'ID de la lettre à la static methode sourcer_lettre de la classe Lettre.
-        Lettre.retirer_source_lettre(publication_id, lettre_id)
+        # On les envoi avec l'ID de la lettre à la static methode retirer_source_lettre de la classe Lettre.
+        statut, donnees = Lettre.retirer_source_lettre(publication_id, lettre_id)
+        if statut is False:
+            flash("Les erreurs suivantes ont été rencontrées : " + " ; ".join(donnees), "danger")
+            return redirect(url_for("unique_lettre", lettre_id=lettre_id))
 
         # En cas de succès, confirmation à l'utilisateur que le lien publication / lettre à été supprimé.
         flash("Source supprimée !", "success")
@@ -469,21 +537,12 @@ def edition(lettre_id):
             lettre_modifiee.lettre_lieu = lettre_lieu
             lettre_modifiee.lettre_date = lettre_date
 
-            # Ajout des nouvelles des données à la place des anciennes et enregistrement.
+            # Enregistrement de la modification et de la contribution en une seule transaction.
             db.session.add(lettre_modifiee)
-            db.session.commit()
-
-            # Enregistrement de la modification dans la table contribution :
-            if lettre_modifiee:
-                # Récupération l'id de la lettre que l'on a modifié.
-                lettre = Lettre.query.get_or_404(lettre_id)
-                # Récupération l'id de l'utilisateur courant
-                utilisateur = Utilisateur.query.get(current_user.ut_id)
-                # Préparation des données à l'enregistrement :
-                a_contribue = Contribution(utilisateur=utilisateur, lettre=lettre)
-                # Envoie dans la DB et enregistrement
-                db.session.add(a_contribue)
-                db.session.commit()
+            statut, donnees = Contribution.enregistrer_modification(lettre=lettre_modifiee)
+            if statut is False:
+                flash("Les erreurs suivantes ont été rencontrées : " + " ; ".join(donnees), "danger")
+                return redirect(url_for("edition", lettre_id=lettre_id))
 
             # Information pour l'utilisateur lui confirmant que la lettre a été modifée et récapitulant les
             # modifications grâce à .format() .
@@ -517,21 +576,12 @@ def suppression_lettre(lettre_id):
     # Si la méthode est POST cela signifie que le formulaire est envoyé
     if request.method == 'POST':
 
-        # Enregistrement de la modification dans la table contribution :
-        if lettre_a_supprimer:
-            # Récupération l'id de la lettre que l'on souhaite supprimer.
-            lettre = Lettre.query.get_or_404(lettre_id)
-            # Récupération l'id de l'utilisateur courant
-            utilisateur = Utilisateur.query.get(current_user.ut_id)
-            # Préparation des données à l'enregistrement :
-            a_contribue = Contribution(utilisateur=utilisateur, lettre=lettre)
-            # Envoi dans la DB et enregistrement
-            db.session.add(a_contribue)
-            db.session.commit()
-
-        # Suppression de la publication de la DB et enregistrement de ce changement :
-        db.session.delete(lettre_a_supprimer)
-        db.session.commit()
+        # Suppression de la lettre et enregistrement de la contribution en une seule transaction.
+        statut, donnees = Contribution.enregistrer_modification(lettre=lettre_a_supprimer,
+                                                                suppression=lettre_a_supprimer)
+        if statut is False:
+            flash("Les erreurs suivantes ont été rencontrées : " + " ; ".join(donnees), "danger")
+            return redirect(url_for("unique_lettre", lettre_id=lettre_id))
 
         # Information pour l'utilisateur lui confirmant que la lettre a bien été supprimée.
         flash("La lettre a été supprimée", "success")
@@ -580,22 +630,14 @@ def nouvelle_transcription(lettre_id):
         if not erreurs:
             # On ajoute les données précédemment récupérées du formulaire à la lettre à transcrire précédemment
             # selectionnée.
-            lettre_a_transcrire.transcription_texte.append(Transcription(transcription_texte=lettre_transcrite))
-            # Ajout des nouvelles des données et enregistrement.
+            transcription_ajoutee = Transcription(transcription_texte=lettre_transcrite)
+            lettre_a_transcrire.transcription_texte.append(transcription_ajoutee)
+            # Enregistrement de la transcription et de la contribution en une seule transaction.
             db.session.add(lettre_a_transcrire)
-            db.session.commit()
-
-            # Enregistrement de la modification dans la table contribution :
-            if lettre_a_transcrire:
-                # Récupération l'id de la transcription que l'on souhaite supprimer.
-                transcription = Transcription.query.order_by(Transcription.transcription_id.desc()).limit(1).first()
-                # Récupération l'id de l'utilisateur courant
-                utilisateur = Utilisateur.query.get(current_user.ut_id)
-                # Préparation des données à l'enregistrement :
-                a_contribue = Contribution(utilisateur=utilisateur, transcription=transcription)
-                # Envoie dans la DB et enregistrement
-                db.session.add(a_contribue)
-                db.session.commit()
+            statut, donnees = Contribution.enregistrer_modification(transcription=transcription_ajoutee)
+            if statut is False:
+                flash("Les erreurs suivantes ont été rencontrées : " + " ; ".join(donnees), "danger")
+                return redirect(url_for("nouvelle_transcription", lettre_id=lettre_id))
 
             # Information pour l'utilisateur lui confirmant que la transcription a été ajoutée.
             flash(
@@ -622,7 +664,8 @@ def modification_transcription(transcription_id):
     # Définition d'une liste d'erreur vide.
     erreurs = []
     # Récupération de l'ID de la transcription à modifier grâce .get_or_404()
-    transcription_a_modifier = Transcription.query.get_or_404(transcription_id)
+    transcription_a_modifier = Transcription.query.options(db.undefer(Transcription.transcription_texte))\
+        .get_or_404(transcription_id)
 
     # Si la méthode est POST cela signifie que le formulaire est envoyé
     if request.method == "POST":
@@ -645,21 +688,12 @@ def modification_transcription(transcription_id):
             # selectionnée.
             transcription_a_modifier.transcription_texte = transcription_modifiee
 
-            # Ajout des nouvelles des données à la place des anciennes et enregistrement.
+            # Enregistrement de la modification et de la contribution en une seule transaction.
             db.session.add(transcription_a_modifier)
-            db.session.commit()
-
-            # Enregistrement de la modification dans la table contribution :
-            if transcription_a_modifier:
-                # Récupération l'id de la transcription que l'on souhaite supprimer.
-                transcription = Transcription.query.get_or_404(transcription_id)
-                # Récupération l'id de l'utilisateur courant
-                utilisateur = Utilisateur.query.get(current_user.ut_id)
-                # Préparation des données à l'enregistrement :
-                a_contribue = Contribution(utilisateur=utilisateur, transcription=transcription)
-                # Envoie dans la DB et enregistrement
-                db.session.add(a_contribue)
-                db.session.commit()
+            statut, donnees = Contribution.enregistrer_modification(transcription=transcription_a_modifier)
+            if statut is False:
+                flash("Les erreurs suivantes ont été rencontrées : " + " ; ".join(donnees), "danger")
+                return redirect(url_for("modification_transcription", transcription_id=transcription_id))
 
             # Information pour l'utilisateur lui confirmant que la transcription a été modifée.
             flash("La transcription a été modifiée !", "success")
@@ -690,21 +724,12 @@ def suppression_transcription(transcription_id):
     # Si la méthode est POST cela signifie que le formulaire est envoyé
     if request.method == 'POST':
 
-        # Enregistrement de la modification dans la table contribution :
-        if transcription_a_supprimer:
-            # Récupération l'id de la publication que l'on souhaite supprimer.
-            transcription = Transcription.query.get_or_404(transcription_id)
-            # Récupération l'id de l'utilisateur courant
-            utilisateur = Utilisateur.query.get(current_user.ut_id)
-            # Préparation des données à l'enregistrement :
-            a_contribue = Contribution(utilisateur=utilisateur, transcription=transcription)
-            # Envoi dans la DB et enregistrement
-            db.session.add(a_contribue)
-            db.session.commit()
-
-        # Suppression de la transcription de la DB et enregistrement de ce changement :
-        db.session.delete(transcription_a_supprimer)
-        db.session.commit()
+        # Suppression de la transcription et enregistrement de la contribution en une seule transaction.
+        statut, donnees = Contribution.enregistrer_modification(transcription=transcription_a_supprimer,
+                                                                suppression=transcription_a_supprimer)
+        if statut is False:
+            flash("Les erreurs suivantes ont été rencontrées : " + " ; ".join(donnees), "danger")
+            return redirect(url_for("afficher_transcription", transcription_id=transcription_id))
 
         # Information pour l'utilisateur lui confirmant que la publication a bien été supprimée.
         flash("La transcription a été supprimée", "success")
@@ -787,21 +812,12 @@ def edition_publication(publication_id):
             publication_modifiee.publication_titre = publication_titre
             publication_modifiee.publication_volume = publication_volume
 
-            # Ajout des nouvelles des données à la place des anciennes et enregistrement.
+            # Enregistrement de la modification et de la contribution en une seule transaction.
             db.session.add(publication_modifiee)
-            db.session.commit()
-
-            # Enregistrement de la modification dans la table contribution :
-            if publication_modifiee:
-                # Récupération l'id de la publication que l'on souhaite supprimer.
-                publication = Publication.query.get_or_404(publication_id)
-                # Récupération l'id de l'utilisateur courant
-                utilisateur = Utilisateur.query.get(current_user.ut_id)
-                # Préparation des données à l'enregistrement :
-                a_contribue = Contribution(utilisateur=utilisateur, publication=publication)
-                # Envoie dans la DB et enregistrement
-                db.session.add(a_contribue)
-                db.session.commit()
+            statut, donnees = Contribution.enregistrer_modification(publication=publication_modifiee)
+            if statut is False:
+                flash("Les erreurs suivantes ont été rencontrées : " + " ; ".join(donnees), "danger")
+                return redirect(url_for("edition_publication", publication_id=publication_id))
 
             # Information pour l'utilisateur lui confirmant que la publication a été modifée et récapitule
             # les modifications grâce à .format().
@@ -835,21 +851,12 @@ def suppression_publication(publication_id):
     # Si la méthode est POST cela signifie que le formulaire est envoyé
     if request.method == 'POST':
 
-        # Enregistrement de la modification dans la table contribution :
-        if source_a_supprimer:
-            # Récupération l'id de la publication que l'on souhaite supprimer.
-            publication = Publication.query.get_or_404(publication_id)
-            # Récupération l'id de l'utilisateur courant
-            utilisateur = Utilisateur.query.get(current_user.ut_id)
-            # Préparation des données à l'enregistrement :
-            a_contribue = Contribution(utilisateur=utilisateur, publication=publication)
-            # Envoie dans la DB et enregistrement
-            db.session.add(a_contribue)
-            db.session.commit()
-
-        # Suppression de la publication de la DB et enregistrement de ce changement :
-        db.session.delete(source_a_supprimer)
-        db.session.commit()
+        # Suppression de la publication et enregistrement de la contribution en une seule transaction.
+        statut, donnees = Contribution.enregistrer_modification(publication=source_a_supprimer,
+                                                                suppression=source_a_supprimer)
+        if statut is False:
+            flash("Les erreurs suivantes ont été rencontrées : " + " ; ".join(donnees), "danger")
+            return redirect(url_for("unique_publication", publication_id=publication_id))
 
         # Information pour l'utilisateur lui confirmant que la publication a bien été supprimée.
         flash("Cet ouvrage a été supprimé", "success")
@@ -0,0 +1,173 @@
+# Requêtes conditionnelles (ETag / Last-Modified) :
+# Chaque écriture dans la base de données enregistre une ligne dans la table contribution, avec sa date. La date de
+# la dernière contribution concernant une ressource (et le nombre de ces contributions) suffit donc à savoir si la
+# ressource a changé depuis la dernière visite d'un navigateur ou d'un moissonneur : si ce n'est pas le cas, la route
+# répond "304 Not Modified" sans recalculer ni renvoyer la page.
+# L'en-tête Last-Modified, précis à la seconde, ne voit ni le nombre de contributions ni les écritures qui ne laissent
+# pas de contribution datée sur la ressource (suppression, import) : il porte la plus récente de la date de la
+# ressource et de la date de la dernière de ces écritures (voir modeles/statistiques.py), et il n'est pas envoyé tant
+# que cette seconde n'est pas écoulée, pour qu'une autre écriture dans la même seconde ne soit pas ignorée.
+import datetime
+from functools import wraps
+from hashlib import sha1
+from flask import request, session, make_response, Response
+from flask_login import current_user
+
+from ..app import db
+from ..modeles.donnees import Contribution, Transcription, Source
+from ..modeles.statistiques import Statistique
+from ..modeles.contributeurs import Contributeur
+
+
+def requete_validateur(*conditions):
+    """
+    Retourne la date de la dernière contribution et le nombre de modifications répondant aux conditions données :
+    les contributions, auxquelles s'ajoutent les imports faits hors de l'application (commande import-corpus), qui
+    n'enregistrent pas de contribution.
+    :param conditions: conditions SQLAlchemy sur la table contribution (aucune : toutes les contributions)
+    :return: tuple (date de dernière modification ou None, nombre de modifications)
+    """
+    query = db.session.query(db.func.max(Contribution.contribution_date),
+                             db.func.count(Contribution.contribution_id) + nombre_importations())
+    if conditions:
+        query = query.filter(db.or_(*conditions))
+    return query.one()
+
+
+def nombre_importations():
+    """
+    Sous-requête retournant le nombre d'imports faits par la commande import-corpus (0 s'il n'y en a eu aucun).
+    """
+    return db.func.coalesce(db.session.query(Statistique.statistique_valeur).filter(
+        Statistique.statistique_nom == "importations").as_scalar(), 0)
+
+
+def validateur_global(**parametres):
+    """
+    Validateur des collections et des pages de liste : toute contribution modifie la collection. Les contributions
+    n'étant jamais supprimées, l'identifiant de la dernière contribution remplace leur nombre : la date et
+    l'identifiant maximaux sont lus dans les index, sans parcourir la table contribution.
+    """
+    derniere_date = db.session.query(db.func.max(Contribution.contribution_date)).as_scalar()
+    dernier_identifiant = db.session.query(db.func.max(Contribution.contribution_id)).as_scalar()
+    return db.session.query(derniere_date, db.func.coalesce(dernier_identifiant, 0) + nombre_importations()).one()
+
+
+def date_modification_globale():
+    """
+    Retourne la date de la dernière suppression ou du dernier import (voir modeles/statistiques.py,
+    noter_modification_globale), ou None s'il n'y en a eu aucun.
+    :rtype: datetime.datetime
+    """
+    secondes = db.session.query(Statistique.statistique_valeur).filter(
+        Statistique.statistique_nom == "derniere_modification_globale").scalar()
+    return datetime.datetime.utcfromtimestamp(secondes) if secondes else None
+
+
+def derniere_modification_connue(derniere_modification):
+    """
+    Calcule la valeur de l'en-tête Last-Modified : la plus récente de la date de la ressource et de la date de la
+    dernière suppression ou du dernier import, à la seconde près. Si cette seconde n'est pas écoulée, une autre
+    écriture peut encore avoir lieu à la même date : aucune date n'est retournée.
+    :param derniere_modification: date de la dernière contribution sur la ressource (ou None)
+    :return: date (UTC, sans microsecondes) ou None
+    :rtype: datetime.datetime
+    """
+    dates = [date for date in (derniere_modification, date_modification_globale()) if date is not None]
+    if not dates:
+        return None
+    date = max(dates).replace(microsecond=0)
+    if date >= datetime.datetime.utcnow().replace(microsecond=0):
+        return None
+    return date
+
+
+def validateur_lettre(lettre_id, **parametres):
+    """
+    Validateur d'une lettre : contributions sur la lettre, ses transcriptions et les publications qui l'éditent
+    (leurs données sont incluses dans la page et dans le JSON de la lettre).
+    """
+    transcriptions = db.session.query(Transcription.transcription_id).filter(
+        Transcription.transcription_lettre_id == lettre_id)
+    publications = db.session.query(Source.c.source_publication_id).filter(Source.c.source_lettre_id == lettre_id)
+    return requete_validateur(Contribution.contribution_lettre_id == lettre_id,
+                              Contribution.contribution_transcription_id.in_(transcriptions),
+                              Contribution.contribution_publication_id.in_(publications))
+
+
+def validateur_publication(publication_id, **parametres):
+    """
+    Validateur d'une publication : contributions sur la publication et sur les lettres qu'elle édite (listées sur
+    la page de la publication).
+    """
+    lettres = db.session.query(Source.c.source_lettre_id).filter(Source.c.source_publication_id == publication_id)
+    return requete_validateur(Contribution.contribution_publication_id == publication_id,
+                              Contribution.contribution_lettre_id.in_(lettres))
+
+
+def validateur_transcription(transcription_id, **parametres):
+    """
+    Validateur d'une transcription : contributions sur la transcription et sur la lettre transcrite.
+    """
+    lettres = db.session.query(Transcription.transcription_lettre_id).filter(
+        Transcription.transcription_id == transcription_id)
+    return requete_validateur(Contribution.contribution_transcription_id == transcription_id,
+                              Contribution.contribution_lettre_id.in_(lettres))
+
+
+def validateur_contributeur(ut_id, **parametres):
+    """
+    Validateur d'un contributeur : ses contributions. La date de sa dernière contribution et leur nombre sont lus dans
+    ses compteurs (voir modeles/contributeurs.py), sans parcourir ses contributions.
+    """
+    ligne = db.session.query(Contributeur.contributeur_derniere,
+                             Contributeur.contributeur_contributions + nombre_importations()).filter(
+        Contributeur.contributeur_ut_id == ut_id).first()
+    return tuple(ligne) if ligne else (None, 0)
+
+
+def reponse_conditionnelle(validateur):
+    """
+    Décorateur de route ajoutant les en-têtes ETag et Last-Modified aux réponses, et répondant "304 Not Modified"
+    lorsque la ressource n'a pas changé depuis la version connue du client (en-têtes If-None-Match ou
+    If-Modified-Since).
+    :param validateur: fonction recevant les paramètres de la route et retournant (date, nombre de contributions)
+    """
+    def decorateur(fonction):
+        @wraps(fonction)
+        def route(*args, **kwargs):
+            # Seules les lectures sont concernées. Une page qui doit afficher un message (flash) est toujours
+            # recalculée pour que le message ne soit pas perdu.
+            if request.method not in ("GET", "HEAD") or session.get("_flashes"):
+                return fonction(*args, **kwargs)
+
+            derniere_modification, nombre = validateur(**kwargs)
+            # La page dépend aussi de l'utilisateur connecté (menu, boutons de modification).
+            utilisateur = current_user.get_id() if current_user.is_authenticated else ""
+            etag = sha1("{}|{}|{}|{}".format(request.full_path, utilisateur, derniere_modification,
+                                             nombre).encode("utf-8")).hexdigest()
+
+            date_entete = derniere_modification_connue(derniere_modification)
+
+            # Si le client connaît déjà cette version, la route n'est pas exécutée.
+            if request.if_none_match:
+                inchangee = request.if_none_match.contains_weak(etag)
+            else:
+                inchangee = (date_entete is not None and request.if_modified_since is not None
+                             and date_entete <= request.if_modified_since.replace(tzinfo=None))
+            if inchangee:
+                reponse = Response(status=304)
+            else:
+                reponse = make_response(fonction(*args, **kwargs))
+                if reponse.status_code != 200:
+                    return reponse
+
+            reponse.set_etag(etag, weak=True)
+            if date_entete is not None:
+                reponse.last_modified = date_entete
+            # Le client doit revalider sa copie à chaque visite, et la réponse varie selon la session.
+            reponse.headers["Cache-Control"] = "no-cache"
+            reponse.vary.add("Cookie")
+            return reponse
+        return route
+    return decorateur
@@ -1,21 +1,3 @@
-<!-- Styles -->
-<style>
-#chartdiv {
-  width: 100%;
-  height: 500px;
-  overflow: hidden;
-}
-</style>
-
-<!-- Resources -->
-<script src="https://cdn.amcharts.com/lib/4/core.js"></script>
-<script src="https://cdn.amcharts.com/lib/4/maps.js"></script>
-<script src="https://cdn.amcharts.com/lib/4/geodata/worldLow.js"></script>
-<script src="https://cdn.amcharts.com/lib/4/themes/kelly.js"></script>
-<script src="https://cdn.amcharts.com/lib/4/themes/animated.js"></script>
-
-<!-- Chart code -->
-<script>
 am4core.ready(function() {
 
 // Themes begin
@@ -24,7 +6,9 @@ am4core.useTheme(am4themes_animated);
 // Themes end
 
 // Create map instance
-var chart = am4core.create("chartdiv", am4maps.MapChart);
+// Les adresses de l'API et de la recherche sont données par le template (partials/carte.html, attributs data-)
+var conteneur = document.getElementById("chartdiv");
+var chart = am4core.create(conteneur, am4maps.MapChart);
 
 // Set map definition
 chart.geodata = am4geodata_worldLow;
@@ -81,104 +65,26 @@ function animateBullet(circle) {
 
 var colorSet = new am4core.ColorSet();
 
-imageSeries.data = [ {
-  "title": "Venise",
-  "latitude": 55.8371,
-  "longitude": 7.3676,
-  "color":colorSet.next()
-}, {
-  "title": "Copenhagen",
-  "latitude": 55.6763,
-  "longitude": 12.5681,
-  "color":colorSet.next()
-}, {
-  "title": "Paris",
-  "latitude": 48.8567,
-  "longitude": 2.3510,
-  "color":colorSet.next()
-}, {
-  "title": "Reykjavik",
-  "latitude": 64.1353,
-  "longitude": -21.8952,
-  "color":colorSet.next()
-}, {
-  "title": "Moscow",
-  "latitude": 55.7558,
-  "longitude": 37.6176,
-  "color":colorSet.next()
-}, {
-  "title": "Madrid",
-  "latitude": 40.4167,
-  "longitude": -3.7033,
-  "color":colorSet.next()
-}, {
-  "title": "London",
-  "latitude": 51.5002,
-  "longitude": -0.1262,
-  "url": "http://www.google.co.uk",
-  "color":colorSet.next()
-}, {
-  "title": "Peking",
-  "latitude": 39.9056,
-  "longitude": 116.3958,
-  "color":colorSet.next()
-}, {
-  "title": "New Delhi",
-  "latitude": 28.6353,
-  "longitude": 77.2250,
-  "color":colorSet.next()
-}, {
-  "title": "Tokyo",
-  "latitude": 35.6785,
-  "longitude": 139.6823,
-  "url": "http://www.google.co.jp",
-  "color":colorSet.next()
-}, {
-  "title": "Ankara",
-  "latitude": 39.9439,
-  "longitude": 32.8560,
-  "color":colorSet.next()
-}, {
-  "title": "Buenos Aires",
-  "latitude": -34.6118,
-  "longitude": -58.4173,
-  "color":colorSet.next()
-}, {
-  "title": "Brasilia",
-  "latitude": -15.7801,
-  "longitude": -47.9292,
-  "color":colorSet.next()
-}, {
-  "title": "Ottawa",
-  "latitude": 45.4235,
-  "longitude": -75.6979,
-  "color":colorSet.next()
-}, {
-  "title": "Washington",
-  "latitude": 38.8921,
-  "longitude": -77.0241,
-  "color":colorSet.next()
-}, {
-  "title": "Kinshasa",
-  "latitude": -4.3369,
-  "longitude": 15.3271,
-  "color":colorSet.next()
-}, {
-  "title": "Cairo",
-  "latitude": 30.0571,
-  "longitude": 31.2272,
-  "color":colorSet.next()
-}, {
-  "title": "Pretoria",
-  "latitude": -25.7463,
-  "longitude": 28.1876,
-  "color":colorSet.next()
-} ];
+// Rayon des cercles : proportionnel à la racine carrée du nombre de lettres (la surface suit le nombre de lettres)
+circle.propertyFields.radius = "rayon";
+circle2.propertyFields.radius = "rayon";
 
+// Chargement des lieux d'envoi depuis l'API (GeoJSON) : un point par lieu, avec son nombre de lettres
+fetch(conteneur.dataset.carte)
+  .then(function(reponse) { return reponse.json(); })
+  .then(function(carte) {
+    imageSeries.data = carte.features.map(function(point) {
+      return {
+        "title": point.properties.lieu + " : " + point.properties.lettres + " lettre(s)",
+        "longitude": point.geometry.coordinates[0],
+        "latitude": point.geometry.coordinates[1],
+        "rayon": 2 + Math.sqrt(point.properties.lettres),
+        "url": conteneur.dataset.recherche + "?lieu=" + encodeURIComponent(point.properties.lieu),
+        "color": colorSet.next()
+      };
+    });
+  });
 
 
-}); // end am4core.ready()
-</script>
 
-<!-- HTML -->
-<div id="chartdiv"></div>
\ No newline at end of file
+}); // end am4core.ready()
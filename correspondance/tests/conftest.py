@@ -0,0 +1,41 @@
+# Fixtures communes aux tests :
+# Chaque test utilise une copie de la base de données livrée (db.db), mise à jour (voir modeles/schema.py), et un cache
+# des réponses vide : la base livrée n'est jamais modifiée.
+import shutil
+
+import pytest
+
+from ..app import create_app, db
+from ..cache import cache
+from ..constantes import BASE_DE_DONNEES
+from ..modeles.schema import mettre_a_jour_schema
+
+
+@pytest.fixture
+def base_livree(tmp_path):
+    """
+    Application configurée sur une copie de la base de données livrée, dont le schéma n'a pas été mis à jour.
+    """
+    chemin = tmp_path / "db.db"
+    shutil.copyfile(BASE_DE_DONNEES, chemin)
+    application = create_app({"BASE_DE_DONNEES": str(chemin), "TESTING": True})
+    with application.app_context():
+        cache.vider()
+        yield application
+        db.session.remove()
+        db.get_engine().dispose()
+    cache.vider()
+
+
+@pytest.fixture
+def application(base_livree):
+    """
+    Application configurée sur une copie à jour de la base de données livrée.
+    """
+    mettre_a_jour_schema()
+    return base_livree
+
+
+@pytest.fixture
+def client(application):
+    return application.test_client()
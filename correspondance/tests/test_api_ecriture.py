@@ -0,0 +1,81 @@
+# Écriture d'un lot de lettres par l'API (POST /api/lettres, voir Lettre.enregistrer_lot) :
+# Une lettre identique enregistrée par une autre requête entre la recherche des doublons et l'enregistrement du lot
+# est refusée par l'index unique des clés naturelles : la réponse signale le conflit (409) et la lettre en cause.
+import sqlite3
+
+from sqlalchemy import event
+
+from ..app import db
+from ..constantes import API_ROUTE
+from ..modeles.donnees import Lettre
+from ..modeles.utilisateurs import Utilisateur
+
+LETTRE = {"numero": "9999", "auteur": "Rédacteur", "lieu": "Rome", "date": "1560-01-01"}
+
+
+def connecter_auteur(client):
+    """
+    Enregistre un utilisateur et le connecte dans la session du client.
+    """
+    auteur = Utilisateur(ut_nom="Auteur", ut_login="auteur", ut_mail="auteur@exemple.org", ut_mdp="!")
+    db.session.add(auteur)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(auteur.ut_id)
+        session["_fresh"] = True
+
+
+def enregistrer_depuis_une_autre_requete(lettre):
+    """
+    Enregistre une lettre par une connexion indépendante de l'application, comme le ferait une autre requête.
+    :return: identifiant de la lettre
+    """
+    connexion = sqlite3.connect(db.engine.url.database)
+    try:
+        with connexion:
+            curseur = connexion.execute(
+                "INSERT INTO lettre (lettre_numero, lettre_redacteur, lettre_lieu, lettre_date, lettre_cle) "
+                "VALUES (?, ?, ?, ?, ?)", (lettre["numero"], lettre["auteur"], lettre["lieu"], lettre["date"],
+                                           Lettre.calculer_cle(lettre["numero"], lettre["auteur"], lettre["lieu"],
+                                                               lettre["date"])))
+        return curseur.lastrowid
+    finally:
+        connexion.close()
+
+
+def test_lettre_enregistree_entre_temps(client):
+    connecter_auteur(client)
+    concurrente = []
+
+    # La lettre concurrente est enregistrée juste avant l'envoi du lot, après la recherche des doublons.
+    def enregistrer_concurrente(session, contexte, instances):
+        if not concurrente:
+            concurrente.append(enregistrer_depuis_une_autre_requete(LETTRE))
+
+    event.listen(db.session, "before_flush", enregistrer_concurrente)
+    try:
+        reponse = client.post(API_ROUTE + "/lettres", json=[LETTRE])
+    finally:
+        event.remove(db.session, "before_flush", enregistrer_concurrente)
+
+    assert reponse.status_code == 409
+    resultat = reponse.get_json()["data"][0]
+    assert resultat["statut"] == "rejetee"
+    assert resultat["conflit"]["id"] == concurrente[0]
+
+
+def test_erreur_d_enregistrement(client):
+    connecter_auteur(client)
+
+    # Une erreur qui ne vient pas de l'index des clés naturelles reste une erreur du serveur.
+    def refuser(session, contexte, instances):
+        raise RuntimeError("Base de données indisponible")
+
+    event.listen(db.session, "before_flush", refuser)
+    try:
+        reponse = client.post(API_ROUTE + "/lettres", json=[LETTRE])
+    finally:
+        event.remove(db.session, "before_flush", refuser)
+
+    assert reponse.status_code == 500
+    assert "conflit" not in reponse.get_json()["data"][0]
@@ -0,0 +1,56 @@
+# Cache des réponses (voir cache.py) :
+# Chaque processus du serveur a son propre cache. Une écriture faite par un autre processus, qui n'invalide pas ce
+# cache, doit tout de même empêcher de servir les réponses calculées avant elle.
+import sqlite3
+
+from ..app import db
+from ..cache import cache
+from ..constantes import API_ROUTE
+
+
+def ecrire_depuis_un_autre_processus(requete):
+    """
+    Exécute une écriture sur le fichier de la base par une connexion indépendante de l'application, comme le ferait
+    un autre processus du serveur.
+    """
+    connexion = sqlite3.connect(db.engine.url.database)
+    try:
+        with connexion:
+            connexion.execute(requete)
+    finally:
+        connexion.close()
+
+
+def lire(client, url):
+    """
+    Demande une URL et lit la réponse en entier (la réponse est enregistrée dans le cache au fil de son envoi).
+    :return: tuple (en-tête X-Cache, contenu)
+    """
+    reponse = client.get(url)
+    return reponse.headers["X-Cache"], reponse.get_data(as_text=True)
+
+
+def test_ecriture_d_un_autre_processus(client):
+    url = API_ROUTE + "/lettres/1"
+    assert lire(client, url)[0] == "MISS"
+    assert lire(client, url)[0] == "HIT"
+
+    ecrire_depuis_un_autre_processus("UPDATE lettre SET lettre_redacteur = 'Autre processus' WHERE lettre_id = 1")
+    ecrire_depuis_un_autre_processus("INSERT INTO contribution (contribution_lettre_id, contribution_ut_id, "
+                                     "contribution_date) SELECT 1, min(ut_id), datetime('now') FROM utilisateur")
+
+    etat, contenu = lire(client, url)
+    assert etat == "MISS"
+    assert "Autre processus" in contenu
+    assert cache.statistiques()["perimees"] == 1
+
+
+def test_import_d_un_autre_processus(client):
+    url = API_ROUTE + "/lettres/1"
+    lire(client, url)
+    assert lire(client, url)[0] == "HIT"
+
+    ecrire_depuis_un_autre_processus("INSERT INTO statistique (statistique_nom, statistique_valeur) "
+                                     "VALUES ('importations', 1) ON CONFLICT (statistique_nom) "
+                                     "DO UPDATE SET statistique_valeur = statistique_valeur + 1")
+    assert lire(client, url)[0] == "MISS"
@@ -0,0 +1,77 @@
+# Clés naturelles des lettres et des publications (voir donnees.py et modeles/schema.py) :
+# Les doublons antérieurs à l'ajout des clés gardent une clé vide jusqu'à leur fusion : ils restent modifiables. Seul
+# l'index unique des clés naturelles est signalé comme un doublon ; les autres erreurs d'intégrité sont rapportées
+# telles quelles.
+from flask_login import login_user
+
+from ..app import db
+from ..modeles.donnees import Lettre, Publication, Contribution
+from ..modeles.utilisateurs import Utilisateur
+
+DOUBLON = "Ces données sont déjà enregistrées dans la base de données"
+
+
+def connecter_auteur(application):
+    """
+    Enregistre un utilisateur et retourne un contexte de requête où il est connecté.
+    """
+    auteur = Utilisateur(ut_nom="Auteur", ut_login="auteur", ut_mail="auteur@exemple.org", ut_mdp="!")
+    db.session.add(auteur)
+    db.session.commit()
+    contexte = application.test_request_context()
+    contexte.push()
+    login_user(auteur)
+    return contexte
+
+
+def creer_doublon_ancien(lettre_id):
+    """
+    Copie une lettre sans clé naturelle, comme un doublon laissé par la mise à jour du schéma.
+    :return: identifiant du doublon
+    """
+    db.session.execute("INSERT INTO lettre (lettre_numero, lettre_redacteur, lettre_lieu, lettre_date) "
+                       "SELECT lettre_numero, lettre_redacteur, lettre_lieu, lettre_date FROM lettre "
+                       "WHERE lettre_id = :id", {"id": lettre_id})
+    doublon_id = db.session.execute("SELECT max(lettre_id) FROM lettre").scalar()
+    db.session.commit()
+    return doublon_id
+
+
+def test_doublon_ancien_modifiable(application):
+    contexte = connecter_auteur(application)
+    try:
+        doublon_id = creer_doublon_ancien(1)
+
+        statut, donnees = Lettre.sourcer_lettre(2, doublon_id)
+        assert statut is True, donnees
+        lettre = Lettre.query.get(doublon_id)
+        lettre.lettre_redacteur = lettre.lettre_redacteur + " "
+        statut, donnees = Contribution.enregistrer_modification(lettre=lettre)
+        assert statut is True, donnees
+        assert Lettre.query.get(doublon_id).lettre_cle is None
+
+        # Lien ajouté à une lettre expirée par un commit (relation seule modifiée).
+        db.session.commit()
+        lettre.lettre_volume.append(Publication.query.get(3))
+        statut, donnees = Contribution.enregistrer_modification(lettre=lettre)
+        assert statut is True, donnees
+        assert Lettre.query.get(doublon_id).lettre_cle is None
+    finally:
+        contexte.pop()
+
+
+def test_erreurs_d_integrite(application):
+    contexte = connecter_auteur(application)
+    try:
+        publication = Publication.query.get(1)
+        db.session.add(Publication(publication_titre=publication.publication_titre,
+                                   publication_volume=publication.publication_volume))
+        assert Contribution.enregistrer_modification() == (False, [DOUBLON])
+
+        db.session.add(Lettre(lettre_id=1, lettre_numero="1", lettre_redacteur="Autre", lettre_lieu="Rome",
+                              lettre_date="1560"))
+        statut, donnees = Contribution.enregistrer_modification()
+        assert statut is False
+        assert "lettre.lettre_id" in donnees[0]
+    finally:
+        contexte.pop()
@@ -0,0 +1,40 @@
+# Compteurs des contributeurs (voir modeles/contributeurs.py) :
+# Les compteurs tenus à jour à chaque écriture sont ceux qu'on obtient en les recalculant à partir de la table
+# contribution, y compris après la suppression d'un objet, dont les contributions sont détachées.
+from flask_login import login_user
+
+from ..app import db
+from ..modeles.contributeurs import recalculer_contributeurs
+from ..modeles.donnees import Lettre, Transcription, Contribution
+from ..modeles.utilisateurs import Utilisateur
+
+
+def lire_compteurs():
+    """
+    Retourne le contenu de la table des compteurs des contributeurs, trié par contributeur.
+    :rtype: list
+    """
+    return [tuple(ligne) for ligne in db.session.execute("SELECT * FROM contributeur ORDER BY contributeur_ut_id")]
+
+
+def test_recalcul_apres_suppression(application):
+    auteur = Utilisateur(ut_nom="Auteur", ut_login="auteur", ut_mail="auteur@exemple.org", ut_mdp="!")
+    db.session.add(auteur)
+    db.session.commit()
+    with application.test_request_context():
+        login_user(auteur)
+        statut, lettre = Lettre.ajouter_lettre("9999", "Rédacteur", "Rome", "1560-01-01")
+        assert statut is True, lettre
+        transcription = Transcription(transcription_texte="Texte de la lettre", lettre=lettre)
+        db.session.add(transcription)
+        statut, donnees = Contribution.enregistrer_modification(transcription=transcription)
+        assert statut is True, donnees
+        statut, donnees = Contribution.enregistrer_modification(transcription=transcription,
+                                                                suppression=transcription)
+        assert statut is True, donnees
+
+    incrementaux = lire_compteurs()
+    with db.engine.begin() as connexion:
+        recalculer_contributeurs(connexion)
+    db.session.commit()
+    assert lire_compteurs() == incrementaux
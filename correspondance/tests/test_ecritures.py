@@ -0,0 +1,77 @@
+# Écritures suivies par une contribution :
+# La modification d'un objet et la contribution de son auteur sont enregistrées dans une seule transaction (voir
+# Contribution.enregistrer_modification) : des auteurs qui écrivent en même temps ne voient jamais leur contribution
+# reliée à l'objet d'un autre.
+import threading
+
+from flask_login import login_user
+
+from ..app import db
+from ..modeles.donnees import Lettre, Contribution
+from ..modeles.utilisateurs import Utilisateur
+
+# Nombre d'auteurs écrivant en même temps, et nombre de lettres créées par chacun.
+AUTEURS = 4
+LETTRES_PAR_AUTEUR = 20
+
+
+def creer_auteurs(nombre):
+    """
+    Enregistre des utilisateurs (sans mot de passe utilisable) et retourne leurs identifiants.
+    :rtype: list
+    """
+    auteurs = [Utilisateur(ut_nom="Auteur {}".format(numero), ut_login="auteur{}".format(numero),
+                           ut_mail="auteur{}@exemple.org".format(numero), ut_mdp="!") for numero in range(nombre)]
+    db.session.add_all(auteurs)
+    db.session.commit()
+    return [auteur.ut_id for auteur in auteurs]
+
+
+def test_ecritures_simultanees(application):
+    auteurs = creer_auteurs(AUTEURS)
+    depart = threading.Barrier(AUTEURS)
+    echecs = []
+
+    def ecrire(ut_id):
+        # Chaque fil a son propre contexte de requête, et donc sa propre session de base de données.
+        with application.test_request_context():
+            login_user(Utilisateur.query.get(ut_id))
+            depart.wait()
+            try:
+                for numero in range(LETTRES_PAR_AUTEUR):
+                    statut, donnees = Lettre.ajouter_lettre(str(numero), "Rédacteur {}".format(ut_id), "Rome",
+                                                            "1560-01-{:02d}".format(numero + 1))
+                    if statut is False:
+                        echecs.append(donnees)
+            finally:
+                db.session.remove()
+
+    fils = [threading.Thread(target=ecrire, args=(ut_id,)) for ut_id in auteurs]
+    for fil in fils:
+        fil.start()
+    for fil in fils:
+        fil.join()
+    assert echecs == []
+
+    # Chaque lettre créée a exactement une contribution, celle de l'auteur qui l'a écrite.
+    for ut_id in auteurs:
+        lettres = Lettre.query.filter(Lettre.lettre_redacteur == "Rédacteur {}".format(ut_id)).all()
+        assert len(lettres) == LETTRES_PAR_AUTEUR
+        for lettre in lettres:
+            assert [contribution.contribution_ut_id for contribution in Contribution.query.filter(
+                Contribution.contribution_lettre_id == lettre.lettre_id)] == [ut_id]
+        assert Contribution.query.filter(Contribution.contribution_ut_id == ut_id).count() == LETTRES_PAR_AUTEUR
+
+
+def test_source_introuvable(application, client):
+    ut_id = creer_auteurs(1)[0]
+    with client.session_transaction() as session:
+        session["_user_id"] = str(ut_id)
+        session["_fresh"] = True
+    contributions = Contribution.query.count()
+
+    reponse = client.post("/lettres/1/source", data={"publication_id": "999999"}, follow_redirects=True)
+    assert "La publication 999999 est introuvable" in reponse.get_data(as_text=True)
+    reponse = client.post("/lettres/1/supprimer_source", data={"publication_id": "999999"}, follow_redirects=True)
+    assert "La publication 999999 est introuvable" in reponse.get_data(as_text=True)
+    assert Contribution.query.count() == contributions
@@ -0,0 +1,20 @@
+# Plans d'exécution des requêtes des pages fréquentes (voir modeles/plans.py) :
+# Les mêmes vérifications que la commande verifier-plans, sur une copie à jour de la base livrée : un index absent ou
+# une requête qui parcourt une table entière fait échouer les tests.
+from ..app import db
+from ..modeles.plans import verifier_plans
+from ..modeles.schema import index_manquants
+
+
+def test_index_declares_presents(application):
+    with db.engine.connect() as connexion:
+        assert index_manquants(connexion) == []
+
+
+def test_plans_sans_parcours_complet(application):
+    resultats = verifier_plans()
+    assert resultats
+    problemes = ["{} (HTTP {}) : {} -> {}".format(resultat["url"], resultat["statut"],
+                                                  " ".join(resultat["requete"].split()), resultat["parcours"])
+                 for resultat in resultats if resultat["statut"] != 200 or resultat["parcours"]]
+    assert problemes == []
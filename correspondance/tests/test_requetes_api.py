@@ -0,0 +1,62 @@
+# Nombre de requêtes SQL des routes de l'API :
+# Les relations des objets sérialisés sont chargées à l'avance (voir les méthodes options_jsonapi des modèles) : une
+# page de la collection des lettres coûte le même nombre de requêtes quelle que soit sa taille.
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from ..app import db
+from ..constantes import API_ROUTE
+
+# Nombre maximal de requêtes d'une page de l'API.
+REQUETES_MAX = 10
+
+
+@contextmanager
+def compter_requetes():
+    """
+    Compte les requêtes SQL exécutées dans le bloc.
+    :return: liste recevant une entrée par requête
+    """
+    requetes = []
+
+    def noter(connexion, curseur, instruction, parametres, contexte, executemany):
+        requetes.append(instruction)
+
+    event.listen(db.engine, "before_cursor_execute", noter)
+    try:
+        yield requetes
+    finally:
+        event.remove(db.engine, "before_cursor_execute", noter)
+
+
+def requetes_route(client, url):
+    """
+    Retourne le nombre de requêtes SQL exécutées pour répondre à une URL (la réponse est lue en entier).
+    """
+    with compter_requetes() as requetes:
+        reponse = client.get(url)
+        assert reponse.status_code == 200
+        reponse.get_data()
+    return len(requetes)
+
+
+@pytest.fixture
+def client_pret(client):
+    """
+    Client dont la première requête a déjà été reçue par l'application (mise à jour du schéma, voir app.py).
+    """
+    client.get(API_ROUTE + "/cache")
+    return client
+
+
+def test_requetes_page_independantes_de_la_taille(client_pret):
+    nombres = [requetes_route(client_pret, API_ROUTE + "/lettres?page[size]={}".format(taille))
+               for taille in (10, 100)]
+    assert len(set(nombres)) == 1
+    assert nombres[0] <= REQUETES_MAX
+
+
+def test_requetes_lettre_unique(client_pret):
+    assert requetes_route(client_pret, API_ROUTE + "/lettres/1") <= REQUETES_MAX
@@ -0,0 +1,23 @@
+# Historique des révisions des transcriptions (voir modeles/revisions.py).
+from flask_login import login_user
+
+from ..app import db
+from ..modeles.donnees import Transcription, Contribution
+from ..modeles.revisions import Revision
+from ..modeles.utilisateurs import Utilisateur
+
+
+def test_premiere_modification(application):
+    # Le texte d'une transcription antérieure à l'historique devient sa révision 1, même s'il n'a pas été chargé
+    # (colonne différée) avant la modification.
+    transcription_id, ancien_texte = db.session.query(Transcription.transcription_id,
+                                                      Transcription.transcription_texte).first()
+    with application.test_request_context():
+        login_user(Utilisateur.query.first())
+        transcription = Transcription.query.get(transcription_id)
+        transcription.transcription_texte = "Nouveau texte de la transcription."
+        statut, donnees = Contribution.enregistrer_modification(transcription=transcription)
+        assert statut is True
+        assert Revision.version(transcription_id, 1)[1] == ancien_texte
+        assert Revision.version(transcription_id, 2)[1] == "Nouveau texte de la transcription."
+        db.session.remove()
@@ -0,0 +1,54 @@
+# Mises à jour du schéma de la base de données (voir modeles/schema.py).
+import threading
+
+from ..app import db
+from ..modeles import schema
+from ..modeles.schema import mettre_a_jour_schema, version_schema, MIGRATIONS
+
+
+def colonnes(table):
+    with db.engine.connect() as connexion:
+        return {ligne[1] for ligne in connexion.execute("PRAGMA table_info({})".format(table))}
+
+
+def test_migration_en_echec_annulee(base_livree, monkeypatch):
+    # Une migration qui échoue après un ALTER TABLE n'en laisse aucune trace : la mise à jour peut être relancée.
+    def migration_en_echec(connexion):
+        connexion.execute("ALTER TABLE lettre ADD COLUMN lettre_essai TEXT")
+        raise RuntimeError("échec de la migration")
+
+    monkeypatch.setattr(schema, "MIGRATIONS", [migration_en_echec])
+    try:
+        mettre_a_jour_schema()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("la migration aurait dû échouer")
+    with db.engine.connect() as connexion:
+        assert version_schema(connexion) == 0
+    assert "lettre_essai" not in colonnes("lettre")
+
+    monkeypatch.setattr(schema, "MIGRATIONS", MIGRATIONS)
+    assert mettre_a_jour_schema() == list(range(1, len(MIGRATIONS) + 1))
+
+
+def test_mises_a_jour_simultanees(base_livree):
+    # Deux mises à jour lancées en même temps appliquent chaque migration une seule fois.
+    depart = threading.Barrier(2)
+    versions, erreurs = [], []
+
+    def mettre_a_jour():
+        with base_livree.app_context():
+            depart.wait()
+            try:
+                versions.extend(mettre_a_jour_schema())
+            except Exception as erreur:
+                erreurs.append(erreur)
+
+    fils = [threading.Thread(target=mettre_a_jour) for _ in range(2)]
+    for fil in fils:
+        fil.start()
+    for fil in fils:
+        fil.join()
+    assert erreurs == []
+    assert sorted(versions) == list(range(1, len(MIGRATIONS) + 1))
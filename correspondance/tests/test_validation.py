@@ -0,0 +1,54 @@
+# Requêtes conditionnelles (voir routes/validation.py) :
+# Un client qui ne connaît que la date de sa copie (If-Modified-Since) ne reçoit "304 Not Modified" que si aucune
+# écriture n'a pu modifier la ressource depuis : ni une suppression, qui ne laisse pas de contribution datée sur la
+# ressource, ni une modification faite dans la même seconde que la copie.
+from flask_login import login_user
+
+from ..app import db
+from ..modeles.donnees import Lettre, Transcription, Contribution
+from ..modeles.utilisateurs import Utilisateur
+
+# Lettre livrée avec une transcription.
+LETTRE_ID = 155
+TRANSCRIPTION_ID = 8
+
+
+def enregistrer_en_tant_qu_auteur(application, **modification):
+    """
+    Enregistre une modification (voir Contribution.enregistrer_modification) au nom d'un nouvel utilisateur.
+    """
+    auteur = Utilisateur(ut_nom="Auteur", ut_login="auteur", ut_mail="auteur@exemple.org", ut_mdp="!")
+    db.session.add(auteur)
+    db.session.commit()
+    with application.test_request_context():
+        login_user(auteur)
+        statut, donnees = Contribution.enregistrer_modification(**modification)
+    assert statut is True, donnees
+
+
+def test_suppression_depuis_la_copie(application, client):
+    reponse = client.get("/lettres/{}".format(LETTRE_ID))
+    derniere_modification = reponse.headers["Last-Modified"]
+    assert client.get("/lettres/{}".format(LETTRE_ID),
+                      headers={"If-Modified-Since": derniere_modification}).status_code == 304
+
+    # La contribution de la suppression est détachée de la transcription : la date de la lettre ne change pas.
+    transcription = Transcription.query.get(TRANSCRIPTION_ID)
+    enregistrer_en_tant_qu_auteur(application, transcription=transcription, suppression=transcription)
+
+    reponse = client.get("/lettres/{}".format(LETTRE_ID), headers={"If-Modified-Since": derniere_modification})
+    assert reponse.status_code == 200
+    assert "Last-Modified" not in reponse.headers
+
+
+def test_modification_dans_la_meme_seconde(application, client):
+    lettre = Lettre.query.get(LETTRE_ID)
+    lettre.lettre_lieu = "Roma"
+    enregistrer_en_tant_qu_auteur(application, lettre=lettre)
+
+    # La seconde de la modification n'est pas écoulée : la copie ne porte pas de date, seulement son ETag.
+    reponse = client.get("/lettres/{}".format(LETTRE_ID))
+    assert reponse.status_code == 200
+    assert "Last-Modified" not in reponse.headers
+    assert client.get("/lettres/{}".format(LETTRE_ID),
+                      headers={"If-None-Match": reponse.headers["ETag"]}).status_code == 304
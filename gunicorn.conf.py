@@ -0,0 +1,17 @@
+# Configuration du serveur gunicorn : gunicorn -c gunicorn.conf.py
+# Les réglages peuvent être changés par des variables d'environnement, ex : CORRESPONDANCE_PROCESSUS=4.
+import multiprocessing
+import os
+
+wsgi_app = "wsgi:application"
+bind = os.environ.get("CORRESPONDANCE_ADRESSE", "127.0.0.1:8000")
+# L'application est chargée une fois dans le processus principal, puis partagée par les processus de travail : les
+# connexions à la base de données ouvertes pendant ce chargement sont fermées avant leur création (voir moteur.py).
+preload_app = True
+# Un processus de travail par cœur, chacun répondant à plusieurs requêtes à la fois (fils d'exécution). Le nombre de
+# fils ne dépasse pas la taille du pool de connexions (SQLITE_TAILLE_POOL).
+workers = int(os.environ.get("CORRESPONDANCE_PROCESSUS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("CORRESPONDANCE_FILS", 4))
+timeout = 60
+accesslog = "-"
@@ -1,4 +1,6 @@
-from correspondance.app import app
+from correspondance.app import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,10 @@
+# Point d'entrée des serveurs WSGI de production, ex : gunicorn -c gunicorn.conf.py
+# L'application est créée (et le schéma de la base de données mis à jour) une seule fois, dans le processus principal
+# du serveur, avant la création des processus de travail.
+from correspondance.app import create_app
+from correspondance.modeles.schema import mettre_a_jour_schema
+
+application = create_app()
+
+with application.app_context():
+    mettre_a_jour_schema()